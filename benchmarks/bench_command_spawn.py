@@ -0,0 +1,79 @@
+"""
+Command 子进程启动延迟微基准
+
+在父进程 RSS 分别为 100MB / 2GB 时，对比:
+    - fork_exec:   subprocess 默认路径（close_fds=True，带 cwd）
+    - posix_spawn: Command 的快速路径（vfork 语义，不复制页表）
+    - bash:        经过 /bin/bash -c 执行
+usage:
+    python3 benchmarks/bench_command_spawn.py [--rss 100,2048] [--rounds 50]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+from utils.command import Command, get_base_env, is_posix_spawn_available  # noqa
+
+MB_SIZE = 1024 * 1024
+
+
+def _timeit(func, rounds: int) -> float:
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def _fork_exec():
+    subprocess.run(
+        ["/bin/true"],
+        cwd="/",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=get_base_env(),
+    )
+
+
+def _spawn():
+    Command(["/bin/true"], working_dir=Path.cwd()).run(original=True)
+
+
+def _bash():
+    Command(["/bin/true && /bin/true"], working_dir=Path.cwd()).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Command spawn latency benchmark")
+    parser.add_argument("--rss", default="100,2048", help="parent RSS in MB")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    print(
+        f"python: {sys.version.split()[0]}, posix_spawn: {is_posix_spawn_available()}"
+    )
+    print(
+        f"{'rss(MB)':>8} {'fork_exec(ms)':>14} {'posix_spawn(ms)':>16} {'bash(ms)':>9}"
+    )
+    ballast = None
+    for rss_mb in [int(item) for item in args.rss.split(",")]:
+        # 写满每一页，确保内存真正驻留
+        ballast = None
+        ballast = bytearray(b"\x01") * (rss_mb * MB_SIZE)
+        fork_exec_ms = _timeit(_fork_exec, args.rounds)
+        spawn_ms = _timeit(_spawn, args.rounds)
+        bash_ms = _timeit(_bash, args.rounds)
+        print(f"{rss_mb:>8} {fork_exec_ms:>14.2f} {spawn_ms:>16.2f} {bash_ms:>9.2f}")
+    del ballast
+
+
+if __name__ == "__main__":
+    os.chdir(Path(__file__).resolve().parent.parent)
+    main()
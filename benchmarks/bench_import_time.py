@@ -0,0 +1,126 @@
+"""
+入口脚本导入耗时基准
+
+通过 python -X importtime 多次导入各个入口脚本, 取累计耗时的中位数, 并检查不应在导入时加载的模块:
+    - cryptography: 只在校验安装包时导入
+    - tabulate / packaging: 只在输出表格、比较版本时导入
+    - utils.aio_tools: 只有 install_rdb_agent 在导入时需要
+--budget-ms 指定每个入口的耗时上限, 超过上限或加载了不应加载的模块时退出码非 0, 可以放在 CI 中
+usage:
+    python3 benchmarks/bench_import_time.py [--rounds 5] [--top 10] [--budget-ms 150]
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# 入口: 导入语句
+ENTRIES = {
+    "install_rdb_server": "import install_rdb_server",
+    "install_rdb_worker": "import install_rdb_worker",
+    "install_update_code": "import install_update_code",
+    "install_rdb_agent": "import install_rdb_agent",
+    "changelog-updater": "import importlib; importlib.import_module('changelog-updater')",
+}
+# 所有入口导入时都不应加载的模块
+FORBIDDEN_MODULES = ["cryptography", "tabulate", "packaging", "yaml"]
+# 除 install_rdb_agent 外, 导入时不应加载的模块
+FORBIDDEN_ENTRY_MODULES = {
+    entry: ["utils.aio_tools"] for entry in ENTRIES if entry != "install_rdb_agent"
+}
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def run_import(statement: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Returns:
+        list: [(模块名, 自身耗时 us, 累计耗时 us, 层级), ...]
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=PROJECT_DIR.as_posix(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{statement} failed: {process.stderr[-2000:]}")
+    result = []
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            result.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return result
+
+
+def measure(
+    entry: str, statement: str, rounds: int
+) -> Tuple[float, Dict[str, int], List[str]]:
+    """
+    Returns:
+        tuple: (入口累计耗时中位数 ms, 各模块自身耗时中位数 us, 已加载的模块)
+    """
+    totals = []
+    self_times: Dict[str, List[int]] = dict()
+    modules: List[str] = []
+    for _ in range(rounds):
+        records = run_import(statement)
+        # 顶层模块（层级 0）的累计耗时之和
+        totals.append(sum(record[2] for record in records if record[3] == 0))
+        for name, self_us, _, _ in records:
+            self_times.setdefault(name, []).append(self_us)
+        modules = [record[0] for record in records]
+    return (
+        statistics.median(totals) / 1000,
+        {name: int(statistics.median(values)) for name, values in self_times.items()},
+        modules,
+    )
+
+
+def find_forbidden(entry: str, modules: List[str]) -> List[str]:
+    forbidden = FORBIDDEN_MODULES + FORBIDDEN_ENTRY_MODULES.get(entry, [])
+    return sorted(
+        {
+            module
+            for module in modules
+            for name in forbidden
+            if module == name or module.startswith(name + ".")
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="entry point import time benchmark")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="show top N self time")
+    parser.add_argument(
+        "--budget-ms", type=float, default=0, help="fail when an entry exceeds it"
+    )
+    parser.add_argument("entries", nargs="*", default=list(ENTRIES))
+    args = parser.parse_args()
+
+    failed = False
+    for entry in args.entries:
+        total_ms, self_times, modules = measure(entry, ENTRIES[entry], args.rounds)
+        forbidden = find_forbidden(entry, modules)
+        over_budget = bool(args.budget_ms) and total_ms > args.budget_ms
+        status = "FAIL" if forbidden or over_budget else "OK"
+        failed = failed or status == "FAIL"
+        print(f"{entry:<22} {total_ms:>8.1f}ms  {len(modules):>4} modules  {status}")
+        if forbidden:
+            print(f"    forbidden: {', '.join(forbidden)}")
+        top = sorted(self_times.items(), key=lambda item: item[1], reverse=True)
+        for name, self_us in top[: args.top]:
+            print(f"    {self_us / 1000:>7.2f}ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
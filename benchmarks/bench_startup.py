@@ -0,0 +1,96 @@
+"""
+冻结二进制启动耗时基准
+
+对每个已解压的安装包目录，分别测量 install 和 changelog-updater 的冷启动、热启动耗时
+    - cold: 第一次启动（--drop-caches 时先清空页缓存，需要 root）
+    - warm: 之后多次启动的中位数
+用同一版本分别以 onefile / onedir 模式打包，即可对比两种布局
+usage:
+    python3 benchmarks/bench_startup.py rdb_agent_onefile/ rdb_agent_onedir/ [--rounds 10] [--drop-caches]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, Path(__file__).resolve().parent.parent.as_posix())
+
+from constants import PackageFilenameEnum  # noqa
+
+BINARIES = [
+    PackageFilenameEnum.INSTALL.value,
+    PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value,
+]
+
+
+def _drop_caches() -> None:
+    os.sync()
+    Path("/proc/sys/vm/drop_caches").write_text("3\n")
+
+
+def _launch(binary: Path) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        [binary.as_posix(), "--help"],
+        cwd=binary.parent.as_posix(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return (time.perf_counter() - start) * 1000
+
+
+def _get_layout(binary: Path) -> str:
+    return "onedir" if binary.is_symlink() else "onefile"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="frozen binary startup benchmark")
+    parser.add_argument("package_dirs", nargs="+", help="extracted package dirs")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument(
+        "--drop-caches", action="store_true", help="drop page cache before cold run"
+    )
+    parser.add_argument("--json", action="store_true", help="print json result")
+    args = parser.parse_args()
+
+    results = []
+    for package_dir in [Path(item).resolve() for item in args.package_dirs]:
+        config = json.loads(
+            package_dir.joinpath(PackageFilenameEnum.VERSION.value).read_text()
+        )
+        for name in BINARIES:
+            binary = package_dir.joinpath(name)
+            if not binary.exists():
+                continue
+            if args.drop_caches:
+                _drop_caches()
+            cold_ms = _launch(binary)
+            warm_ms = statistics.median(_launch(binary) for _ in range(args.rounds))
+            results.append(
+                {
+                    "package_type": config.get("package_type", ""),
+                    "layout": _get_layout(binary),
+                    "binary": name,
+                    "cold_ms": round(cold_ms, 2),
+                    "warm_ms": round(warm_ms, 2),
+                }
+            )
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(
+        f"{'package_type':<22} {'layout':<8} {'binary':<18} {'cold(ms)':>9} {'warm(ms)':>9}"
+    )
+    for item in results:
+        print(
+            f"{item['package_type']:<22} {item['layout']:<8} {item['binary']:<18} "
+            f"{item['cold_ms']:>9.2f} {item['warm_ms']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
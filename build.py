@@ -1,18 +1,44 @@
+import argparse
 import os
 import shutil
 import tarfile
+import tempfile
+from enum import Enum
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Optional
 
-from constants import PROJECT_DIR, PackageFilenameEnum, PackageTypeEnum
+from constants import (
+    PROJECT_DIR,
+    RUNTIME_DIR_NAME,
+    PackageFilenameEnum,
+    PackageTypeEnum,
+)
+from utils.aio_tools import SUPPORTED_ARCHS, ToolInfo, get_arch, get_tools
 from utils.command import Command
+from utils.delta import DeltaBuilder, DeltaPackage
+from utils.log_base import logger
+from utils.manifest import ManifestBuilder, PackageManifest
 from utils.verify import PackageBuilder
 
 
+class BuildModeEnum(str, Enum):
+    # 单文件, 每次启动都要解压 python 运行时到临时目录
+    ONEFILE = "onefile"
+    # 目录模式, 运行时随安装包一起解压, 启动时不需要再解压
+    ONEDIR = "onedir"
+
+
 class BuildPackage:
-    def __init__(self):
+    def __init__(
+        self,
+        mode: BuildModeEnum = BuildModeEnum.ONEFILE,
+        runtime_tmpdir: Optional[str] = None,
+    ):
         self._builder = PackageBuilder()
         self.install_script = self._init_script_name()
+        self.mode = BuildModeEnum(mode)
+        # onefile 模式下的解压目录, 默认是 /tmp, /tmp 较慢时可以指定到其他目录
+        self.runtime_tmpdir = runtime_tmpdir
 
     def _init_script_name(self) -> str:
         """
@@ -45,10 +71,11 @@ class BuildPackage:
         编译成二进制文件
         for example:
             pyinstaller --onefile install_rdb_server.py -> dist/install_rdb_server
+            pyinstaller --onedir install_rdb_server.py -> dist/install_rdb_server/
         Args:
             py_script_name: 需要编译的 py 脚本名称
         Returns:
-            Path: 二进制文件路径
+            Path: 二进制文件路径, onedir 模式下是目录路径
         """
         if py_script_name is None:
             binary_file_name = Path(self.install_script).stem
@@ -61,36 +88,197 @@ class BuildPackage:
             raise Exception("pyinstaller not found")
 
         # At this point, py_script_name is guaranteed to be a string
-        command = Command([pyinstaller_path, "--onefile", py_script_name])
+        command_args = [pyinstaller_path, f"--{self.mode.value}"]
+        if self.mode == BuildModeEnum.ONEFILE and self.runtime_tmpdir:
+            command_args.append(f"--runtime-tmpdir={self.runtime_tmpdir}")
+        command = Command(command_args + [py_script_name])
         result = command.run(original=True, display=True)
         if result.returncode != 0:
             raise Exception(f"Failed to build binary: {result.stderr}")
         return Path(PROJECT_DIR).joinpath("dist", binary_file_name)
 
+    def build_manifest(self) -> Optional[Path]:
+        """
+        探测 package.tar.gz 中 tools/ 目录下每个架构的工具, 生成 manifest.json
+        记录工具版本、文件数量、大小和哈希, 安装时不需要再执行安装包中的二进制文件
+        Returns:
+            Path: manifest 文件路径, 安装包中没有 tools/ 时返回 None
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with tarfile.open(self._builder.package_path, "r:gz") as tar:
+                members = [
+                    member
+                    for member in tar.getmembers()
+                    if member.name.lstrip("./").startswith("tools/")
+                ]
+                if not members:
+                    return None
+                tar.extractall(path=temp_dir, members=members)
+            tools_root = Path(temp_dir).joinpath("tools")
+            tools_by_arch = {
+                arch: [
+                    ToolInfo(tools_path=tools_root.as_posix(), arch=arch, **tool)
+                    for tool in get_tools()
+                ]
+                for arch in SUPPORTED_ARCHS
+            }
+            data = ManifestBuilder(tools_root, get_arch()).build(tools_by_arch)
+        manifest_path = PROJECT_DIR.joinpath(PackageFilenameEnum.MANIFEST.value)
+        PackageManifest(data).save(manifest_path)
+        for arch, tools in data["tools"].items():
+            missing = sorted(
+                name for name, info in tools.items() if not info["version"]
+            )
+            logger.info(f"manifest {arch}: {len(tools)} tools")
+            if missing:
+                logger.warning(f"manifest {arch}: no version for {', '.join(missing)}")
+        return manifest_path
+
+    def _extract_baseline(self, baseline: Path, output_dir: Path) -> Dict[str, Path]:
+        """
+        从上一个版本的安装包中取出 package.tar.gz 和 manifest.json
+        """
+        names = [PackageFilenameEnum.PACKAGE.value, PackageFilenameEnum.MANIFEST.value]
+        result = dict()
+        with tarfile.open(baseline, "r:gz") as tar:
+            for member in tar:
+                name = Path(member.name).name
+                if not member.isfile() or name not in names or name in result:
+                    continue
+                path = output_dir.joinpath(name)
+                with tar.extractfile(member) as src, open(path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+                result[name] = path
+        if PackageFilenameEnum.PACKAGE.value not in result:
+            raise Exception(
+                f"{PackageFilenameEnum.PACKAGE.value} not found in {baseline}"
+            )
+        return result
+
+    def build_delta(self, baseline: Path, manifest_path: Optional[Path]) -> Path:
+        """
+        对比上一个版本的安装包, 生成增量包, 替换安装包中的 package.tar.gz
+        - package.delta.tar.gz: 变化的工具文件、补丁、变化的 whl、内核源码等
+        - delta.json: 基础版本的文件哈希, 安装前校验目标端与基础版本一致
+        Args:
+            baseline: 上一个版本的安装包, 例如 aio-update-agent-5.5.1.0.tar.gz
+            manifest_path: 当前版本的工具清单
+        Returns:
+            Path: delta.json 文件路径
+        """
+        package_type = self._builder.config.get("package_type")
+        if package_type not in [
+            PackageTypeEnum.INSTALL_UPDATE_AGENT.value,
+            PackageTypeEnum.INSTALL_UPDATE_CODE.value,
+        ]:
+            raise Exception(f"delta package is not supported for {package_type}")
+        delta_tar_path = PROJECT_DIR.joinpath("package.delta.tar.gz")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            temp_path = Path(temp_dir)
+            baseline_files = self._extract_baseline(baseline, temp_path)
+            roots = dict()
+            for name, package_path in [
+                ("base", baseline_files[PackageFilenameEnum.PACKAGE.value]),
+                ("new", self._builder.package_path),
+            ]:
+                roots[name] = temp_path.joinpath(name)
+                with tarfile.open(package_path, "r:gz") as tar:
+                    tar.extractall(path=roots[name])
+            # 旧版安装包没有 manifest 时, 只按当前版本的工具目录对比
+            manifest_files = [
+                baseline_files.get(PackageFilenameEnum.MANIFEST.value),
+                manifest_path,
+            ]
+            manifests = [
+                manifest
+                for manifest in map(PackageManifest.load, filter(None, manifest_files))
+                if manifest is not None
+            ]
+            if not manifests:
+                raise Exception("manifest not found, can not build delta package")
+            output_root = temp_path.joinpath("delta")
+            output_root.mkdir()
+            data = DeltaBuilder(roots["base"], roots["new"], manifests).build(
+                output_root, baseline.name
+            )
+            with tarfile.open(delta_tar_path, "w:gz") as tar:
+                for path in sorted(output_root.iterdir()):
+                    tar.add(path.as_posix(), arcname=path.name)
+        delta_path = DeltaPackage(data).save(
+            PROJECT_DIR.joinpath(PackageFilenameEnum.DELTA.value)
+        )
+        full_size = self._builder.package_path.stat().st_size
+        delta_size = delta_tar_path.stat().st_size
+        logger.info(
+            f"delta from {baseline.name}: {len(data['tools'])} tool files changed, "
+            f"{len(data['wheels'])} wheels unchanged, "
+            f"{full_size / 1024 / 1024:.1f}M -> {delta_size / 1024 / 1024:.1f}M"
+        )
+        # 安装包中的 package.tar.gz 替换为增量包, verify 也按增量包计算哈希
+        self._builder.package_path = delta_tar_path
+        return delta_path
+
     def build_tar_gz(
-        self, install_binary_path: Path, changelog_updater_binary_path: Path
+        self,
+        install_binary_path: Path,
+        changelog_updater_binary_path: Path,
+        manifest_path: Optional[Path] = None,
+        delta_path: Optional[Path] = None,
     ):
         """
         构建 tar.gz 包
         Args:
             install_binary_path: 安装二进制文件路径
             changelog_updater_binary_path: changelog-updater 二进制文件路径
+            manifest_path: 工具清单文件路径
+            delta_path: 增量包清单文件路径
         """
         # 构建包
         base_dir = self._builder.package_name.replace(".tar.gz", "")
         with tarfile.open(self._builder.package_name, "w:gz") as tar:
             for file in self._builder.PACKAGE_FILES:
-                tar.add(file, arcname=Path(base_dir).joinpath(Path(file).name))
-            tar.add(
+                # 增量包时 package_path 是 package.delta.tar.gz
+                source = (
+                    self._builder.package_path
+                    if file == PackageFilenameEnum.PACKAGE.value
+                    else file
+                )
+                tar.add(source, arcname=Path(base_dir).joinpath(Path(file).name))
+            self._add_binary(
+                tar,
                 install_binary_path,
-                arcname=Path(base_dir).joinpath(PackageFilenameEnum.INSTALL.value),
+                Path(base_dir),
+                PackageFilenameEnum.INSTALL.value,
             )
-            tar.add(
+            self._add_binary(
+                tar,
                 changelog_updater_binary_path,
-                arcname=Path(base_dir).joinpath(
-                    PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value
-                ),
+                Path(base_dir),
+                PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value,
             )
+            for path in [manifest_path, delta_path]:
+                if path is not None:
+                    tar.add(path, arcname=Path(base_dir).joinpath(path.name))
+
+    def _add_binary(
+        self, tar: tarfile.TarFile, binary_path: Path, base_dir: Path, name: str
+    ) -> None:
+        """
+        将二进制文件添加到 tar.gz 包中
+        - onefile: <base_dir>/<name>
+        - onedir: <base_dir>/runtime/<name>/ 目录, 以及软链 <base_dir>/<name> -> runtime/<name>/<binary>
+        """
+        if self.mode == BuildModeEnum.ONEFILE:
+            tar.add(binary_path, arcname=base_dir.joinpath(name))
+            return
+        runtime_dir = Path(RUNTIME_DIR_NAME).joinpath(name)
+        tar.add(binary_path, arcname=base_dir.joinpath(runtime_dir))
+        # onedir 中可执行文件名与脚本名相同, 安装包目录下的 install 链接到它
+        link_info = tarfile.TarInfo(base_dir.joinpath(name).as_posix())
+        link_info.type = tarfile.SYMTYPE
+        link_info.linkname = runtime_dir.joinpath(binary_path.name).as_posix()
+        link_info.mode = 0o777
+        tar.addfile(link_info)
 
     def clean_dist(self):
         """
@@ -107,11 +295,19 @@ class BuildPackage:
         for file in PROJECT_DIR.glob("*.spec"):
             file.unlink()
 
-    def build_package(self):
+    def build_package(self, baseline: Optional[Path] = None):
         """
         构建包
+        Args:
+            baseline: 上一个版本的安装包, 指定时生成增量包
         """
-        # 加密 verify 文件
+        # 生成工具清单
+        manifest_path = self.build_manifest()
+        # 生成增量包
+        delta_path = None
+        if baseline is not None:
+            delta_path = self.build_delta(baseline, manifest_path)
+        # 加密 verify 文件, 增量包替换 package.tar.gz 后再计算哈希
         self._builder.encrypt_verify_file()
         # 构建二进制文件 install
         install_binary_path = self.build_binary()
@@ -120,10 +316,40 @@ class BuildPackage:
             PackageFilenameEnum.CHANGELOG_UPDATER.value
         )
         # 构建 tar.gz 包
-        self.build_tar_gz(install_binary_path, changelog_updater_binary_path)
+        self.build_tar_gz(
+            install_binary_path,
+            changelog_updater_binary_path,
+            manifest_path,
+            delta_path,
+        )
         self.clean_dist()
 
 
+def main():
+    parser = argparse.ArgumentParser(description="package builder")
+    parser.add_argument(
+        "--mode",
+        choices=[item.value for item in BuildModeEnum],
+        default=BuildModeEnum.ONEFILE.value,
+        help="onefile: single binary, extracted to a temp dir on every launch; "
+        "onedir: runtime shipped unpacked in the package, no extraction on launch",
+    )
+    parser.add_argument(
+        "--runtime-tmpdir",
+        default=None,
+        help="onefile only, extract the runtime here instead of /tmp",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="previous release package, build a delta package that only contains "
+        "the files changed since it (update packages only)",
+    )
+    args = parser.parse_args()
+    builder = BuildPackage(mode=args.mode, runtime_tmpdir=args.runtime_tmpdir)
+    builder.build_package(baseline=args.baseline)
+
+
 if __name__ == "__main__":
-    builder = BuildPackage()
-    builder.build_package()
+    main()
@@ -1,148 +1,13 @@
 import argparse
-import json
-import os
-from collections import defaultdict
-from copy import deepcopy
 from datetime import datetime
-from enum import Enum
-from pathlib import Path
 from typing import Dict, List
 
-import yaml
-
-from utils.aio_tools import ToolsHandler
+from utils.changelog import CHANGELOG_FILE, VERSION_FILE, VersionHandler
+from utils.changelog_query import ChangelogQuery, parse_time
+from utils.changelog_store import RECORD_TIME_FORMAT, ChangelogStore
+from utils.diagnostics import install_profiler
 from utils.log_base import logger
-
-TOOL_PATH = "/opt/aio/airflow/tools"
-AIO_HOME = "/opt/aio"
-CHANGELOG_FILE = f"{AIO_HOME}/logs/changelog.txt"
-VERSION_FILE = f"{AIO_HOME}/logs/version.json"
-
-
-class ActionEnum(Enum):
-    ADD = "Add"
-    MAINTAIN = "Maintain"
-    MODIFY = "Modify"
-
-
-class ChangelogHandler:
-    def __init__(self, changelog_file, version_file):
-        self.changelog_file = changelog_file
-        self.version_file = version_file
-        self.changelog_info = self._load_changelog()
-        self.version_info = self._load_version()
-
-    def _load_version(self) -> Dict[str, List]:
-        if not os.path.exists(self.version_file):
-            return dict()
-        with open(self.version_file, "r") as f:
-            content = f.read().strip()
-            if not content:
-                return dict()
-            return json.loads(content)
-
-    def _load_changelog(self) -> Dict[str, str]:
-        if not os.path.exists(self.changelog_file):
-            return dict()
-
-        with open(self.changelog_file, "r") as f:
-            data = yaml.safe_load(f)
-        if data:
-            return data
-        return dict()
-
-    def _save_changelog(self, changelog: Dict[str, str]) -> None:
-        with open(self.changelog_file, "w") as f:
-            yaml.safe_dump(
-                changelog,
-                f,
-                default_flow_style=False,
-                allow_unicode=True,
-                sort_keys=False,
-            )
-
-    def get_last_version_dict(self) -> Dict[str, str]:
-        if not self.changelog_info:
-            return dict()
-        # Sort by key to get the latest one
-        data = sorted(self.changelog_info.items(), key=lambda x: x[0], reverse=True)[0][
-            1
-        ]
-        result = dict()
-        for key, value in data.items():
-            version = value[0]["version"].split("->")[-1] or ""
-            result[key] = version.strip()
-        # Output sorted by key
-        return dict(sorted(result.items(), key=lambda x: x[0]))
-
-    def update_changelog(self) -> bool:
-        last_version_dict = self.get_last_version_dict()
-        if self.version_info == last_version_dict:
-            logger.info("Version information has not changed, not updating changelog")
-            return False
-        # Update changelog
-        data = {}
-        for key, value in self.version_info.items():
-            action = ActionEnum.MAINTAIN.value
-            version = value
-            if key not in last_version_dict:
-                action = ActionEnum.ADD.value
-                version = value
-                logger.info(
-                    f"Tool {key}:{version} not found in changelog, adding version information"
-                )
-            else:
-                # Modify version information
-                history_version = last_version_dict.get(key)
-                if value != history_version:
-                    action = ActionEnum.MODIFY.value
-                    version = f"{history_version} -> {value}"
-                    logger.warning(f"Tool version changed, {key}:{version}")
-            data[key] = [
-                {
-                    "version": version,
-                    "action": action,
-                    "time": str(datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                }
-            ]
-        sorted_data = sorted(data.items())
-        today = datetime.now().strftime("%Y%m%d%H%M")
-
-        save_data = deepcopy(self.changelog_info)
-        save_data.update({today: dict(sorted_data)})
-        sorted_yaml_data = sorted(save_data.items(), key=lambda x: x[0], reverse=True)
-        self._save_changelog(dict(sorted_yaml_data))
-        return True
-
-
-class VersionHandler:
-    def __init__(self, version_file, changelog_file=""):
-        self.version_file = version_file
-        self.changelog_file = changelog_file
-        self.version_info = defaultdict()
-        self.tools_handler = ToolsHandler()
-
-    def get_version(self) -> Dict[str, str]:
-        result = self.tools_handler.get_tools_version()
-        self.version_info.update({k: v for k, v in result.items() if v})
-        return self.version_info
-
-    def update_changelog(self) -> bool:
-        """Update changelog and return whether changes occurred"""
-        changelog_handler = ChangelogHandler(self.changelog_file, self.version_file)
-        if not changelog_handler.version_info:
-            current_file = Path(__file__)
-            file_name = current_file.stem
-            logger.error(
-                "Version information is empty, please get version information first"
-            )
-            logger.error(f"Get more information: {file_name} --help")
-            return False
-        return changelog_handler.update_changelog()
-
-    def save_version(self):
-        with open(self.version_file, "w") as f:
-            json.dump(self.version_info, f)
+from utils.metrics import metrics
 
 
 class CommandParser:
@@ -185,19 +50,122 @@ class CommandParser:
         )
         update_parser.set_defaults(func=self.update)
 
+        export_parser = subparsers.add_parser(
+            "export", help="Export the changelog history in YAML format."
+        )
+        export_parser.add_argument(
+            "-i",
+            "--input",
+            required=False,
+            default=CHANGELOG_FILE,
+            help=f"changelog file, the history is stored next to it(default: {CHANGELOG_FILE})",
+        )
+        export_parser.add_argument(
+            "-o",
+            "--output",
+            required=False,
+            default=CHANGELOG_FILE,
+            help=f"yaml output file(default: {CHANGELOG_FILE})",
+        )
+        export_parser.set_defaults(func=self.export)
+
+        history_parser = subparsers.add_parser(
+            "history", help="Show the version timeline of one tool."
+        )
+        history_parser.add_argument("tool", help="tool name, for example: fsdeamon")
+        self._add_input_argument(history_parser)
+        history_parser.set_defaults(func=self.history)
+
+        diff_parser = subparsers.add_parser(
+            "diff", help="Show the tools changed between two points in time."
+        )
+        diff_parser.add_argument(
+            "since", help="start time, for example: 2025-10-01 or '2025-10-01 12:00:00'"
+        )
+        diff_parser.add_argument(
+            "until",
+            nargs="?",
+            default=None,
+            help="end time(default: now)",
+        )
+        self._add_input_argument(diff_parser)
+        diff_parser.set_defaults(func=self.diff)
+
+        rollup_parser = subparsers.add_parser(
+            "rollup",
+            help="Show current version, first seen, last changed and change count of every tool.",
+        )
+        self._add_input_argument(rollup_parser)
+        rollup_parser.set_defaults(func=self.rollup)
+
         args = parser.parse_args()
         return args
 
     def record(self, args):
-        version_handler = VersionHandler(args.output)
-        version_handler.get_version()
-        version_handler.save_version()
+        # 探测到的工具版本同时写入 node-exporter textfile
+        with metrics.recording("changelog_updater", install=False):
+            version_handler = VersionHandler(args.output)
+            version_handler.get_version()
+            version_handler.save_version()
 
     def update(self, args):
-        version_handler = VersionHandler(args.input, args.output)
-        version_handler.update_changelog()
+        with metrics.recording("changelog_updater", install=False):
+            version_handler = VersionHandler(args.input, args.output)
+            version_handler.update_changelog()
+
+    def _add_input_argument(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            "-i",
+            "--input",
+            required=False,
+            default=CHANGELOG_FILE,
+            help=f"changelog file, the history is stored next to it(default: {CHANGELOG_FILE})",
+        )
+
+    def _print_table(self, rows: List[Dict], headers: List[str]) -> None:
+        from tabulate import tabulate
+
+        table = tabulate(
+            [[row[header] for header in headers] for row in rows],
+            headers=headers,
+            tablefmt="pretty",
+        )
+        print(table)
+
+    def history(self, args):
+        query = ChangelogQuery(ChangelogStore(args.input))
+        rows = query.tool_history(args.tool)
+        if not rows:
+            logger.info(f"No history found for tool: {args.tool}")
+            return
+        self._print_table(rows, ["time", "action", "version"])
+
+    def diff(self, args):
+        query = ChangelogQuery(ChangelogStore(args.input))
+        since = parse_time(args.since)
+        until = (
+            parse_time(args.until, end_of_day=True)
+            if args.until
+            else datetime.now().strftime(RECORD_TIME_FORMAT)
+        )
+        rows = query.diff(since, until)
+        if not rows:
+            logger.info(f"No tools changed between {since} and {until}")
+            return
+        self._print_table(rows, ["tool", "action", "before", "after"])
+
+    def rollup(self, args):
+        query = ChangelogQuery(ChangelogStore(args.input))
+        self._print_table(
+            query.rollup(), ["tool", "current", "first_seen", "last_changed", "changes"]
+        )
+
+    def export(self, args):
+        output_path = ChangelogStore(args.input).export_yaml(args.output)
+        logger.info(f"Changelog exported: {output_path.as_posix()}")
 
 
 if __name__ == "__main__":
+    install_profiler("changelog-updater")
     args = CommandParser().parse()
     args.func(args)
@@ -5,11 +5,20 @@ from pathlib import Path
 
 SECURE_KEY = "dZ5|nT7#"
 FLAG = "RiverSecurity"
-PROJECT_DIR = (
-    Path(sys.executable).resolve().parent
-    if getattr(sys, "frozen", False)
-    else Path(__file__).resolve().parent
-)
+# onedir 打包模式下，二进制及其依赖位于 runtime/<name>/ 目录中，安装包根目录下是指向它的软链
+RUNTIME_DIR_NAME = "runtime"
+
+
+def _get_project_dir() -> Path:
+    if not getattr(sys, "frozen", False):
+        return Path(__file__).resolve().parent
+    executable_dir = Path(sys.executable).resolve().parent
+    if executable_dir.parent.name == RUNTIME_DIR_NAME:
+        return executable_dir.parent.parent
+    return executable_dir
+
+
+PROJECT_DIR = _get_project_dir()
 # 压缩包路径
 PACKAGE_TAR_GZ = PROJECT_DIR.joinpath("package.tar.gz")
 # 解压后的目录
@@ -17,8 +26,41 @@ PACKAGE_DIR = PROJECT_DIR.joinpath("package")
 # 磁盘空间阈值, 5G
 DISK_SPACE_THRESHOLD = 5 * 1024 * 1024 * 1024
 GB_SIZE = 1024 * 1024 * 1024
+# rpm、pip 的安装位置
+INSTALL_ROOT = "/opt"
+# 按安装包规划磁盘空间时, 每个挂载点额外保留的空间, 默认 512M
+SPACE_MARGIN = int(os.getenv("AIO_SPACE_MARGIN_MB", "512")) * 1024 * 1024
+# fsbackup 完成后输出目录所在挂载点至少需要的剩余空间, 默认 1G
+FSBACKUP_OUTPUT_MIN_BYTES = (
+    int(os.getenv("AIO_FSBACKUP_OUTPUT_MIN_GB", "1")) * 1024 * 1024 * 1024
+)
 
 TOOLS_PATH = os.getenv("TOOLS_PATH", "/opt/aio/airflow/tools")
+# 日志目录, 安装日志、性能分析报告等都写到这里
+AIO_LOGS_DIR = os.getenv("AIO_LOGS_DIR", "/opt/aio/logs")
+# 结构化日志文件（json lines）, 日志目录不可写时只输出到控制台
+LOG_FILE = os.getenv("AIO_LOG_FILE", f"{AIO_LOGS_DIR}/aio-install.jsonl")
+LOG_FILE_MAX_BYTES = int(os.getenv("AIO_LOG_FILE_MAX_MB", "20")) * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+# node-exporter textfile 采集目录, 目录存在且可写时写入安装指标（.prom）, 设置为空关闭
+METRICS_DIR = os.getenv("AIO_METRICS_DIR", "/var/lib/node_exporter/textfile_collector")
+# 控制台、日志文件的日志级别
+LOG_LEVEL = os.getenv("AIO_LOG_LEVEL", "DEBUG").upper()
+LOG_FILE_LEVEL = os.getenv("AIO_LOG_FILE_LEVEL", "DEBUG").upper()
+# 工具版本探测缓存文件
+PROBE_CACHE_FILE = os.getenv(
+    "AIO_PROBE_CACHE_FILE", f"{AIO_LOGS_DIR}/.tools-version-cache.json"
+)
+# 主机信息快照文件, 设置后检查主机环境时写入, 供编排工具读取
+HOST_FACTS_FILE = os.getenv("AIO_HOST_FACTS_FILE", "")
+# 目标端内容寻址存储, 保存安装过的工具版本, 用于回滚
+STORE_DIR = os.getenv("AIO_STORE_DIR", "/opt/aio/store")
+# 存储中文件的总大小上限, 默认 10G
+STORE_MAX_BYTES = int(os.getenv("AIO_STORE_MAX_GB", "10")) * 1024 * 1024 * 1024
+# aio 配置文件, 由 rpm 生成, server ip 首次安装时填写
+AIO_ENV_FILE = "/opt/aio/cfg/aio.env"
+# aio 的 python 虚拟环境
+VENV_DIRS = {"cdm": "/opt/aio/cdm", "airflow": "/opt/aio/airflow"}
 # 内核版本信息
 KERNEL_VERSION = os.uname().release
 # 内核文件名
@@ -59,3 +101,7 @@ class PackageFilenameEnum(str, Enum):
     CHANGELOG_UPDATER_BINARY = "changelog-updater"
     # 工具版本信息文件， 用于获取patch包中工具版本信息
     TOOLS_VERSION = "version.txt"
+    # 打包时生成的工具清单（版本、文件大小、哈希）, 优先于 version.txt
+    MANIFEST = "manifest.json"
+    # 增量包中记录基础版本哈希和变化文件的清单
+    DELTA = "delta.json"
@@ -1,15 +1,24 @@
 import argparse
-import json
 import sys
 import tarfile
 from pathlib import Path
-from typing import Callable
+from typing import Callable, Dict, List, Optional
 
-from constants import PROJECT_DIR, PackageFilenameEnum, PackageTypeEnum
-from utils.aio_tools import ToolsHandler
+from constants import PROJECT_DIR, TOOLS_PATH, PackageFilenameEnum, PackageTypeEnum
+from utils.aio_tools import ToolsHandler, get_arch
+from utils.answers import AnswerError, add_answer_arguments, answers
+from utils.changelog import record_changelog
 from utils.check import HostEnvironmentDetection
-from utils.command import Command
+from utils.command import shell_session
+from utils.copy_plan import CopyOperation
+from utils.delta import DeltaPackage
+from utils.diagnostics import install_profiler
+from utils.host_facts import get_host_facts
 from utils.log_base import logger
+from utils.metrics import get_tar_bytes, metrics
+from utils.preflight import Preflight
+from utils.space_plan import SpacePlanner
+from utils.timeline import timeline
 from utils.verify import PackageBuilder
 
 
@@ -24,12 +33,19 @@ class Installer:
         self.tools_handler = ToolsHandler(
             package_tools_path=self.package_dir.joinpath("tools")
         )
+        # 工具复制计划, 有 manifest 时在解压前生成, 工具直接解压到目标路径旁的暂存路径
+        self.tools_plan: Optional[List[CopyOperation]] = None
+        # 增量包, 只有升级包可以是增量包
+        self.delta: Optional[DeltaPackage] = None
+        if self.config["package_type"] == PackageTypeEnum.INSTALL_UPDATE_AGENT:
+            self.delta = DeltaPackage.load(
+                PROJECT_DIR.joinpath(PackageFilenameEnum.DELTA.value)
+            )
 
     def _parse_config(self) -> dict:
-        version_file = PROJECT_DIR.joinpath(PackageFilenameEnum.VERSION.value)
-        data = json.loads(version_file.read_text(encoding="utf-8"))
-        return data
+        return get_host_facts().package_config
 
+    @timeline.phase("verify")
     def _verify_package(self) -> bool:
         try:
             package_builder = PackageBuilder()
@@ -39,24 +55,78 @@ class Installer:
             return False
         return True
 
+    @timeline.phase("tools_plan")
+    def _plan_tools(self) -> None:
+        """
+        旧版安装包没有 manifest, 解压后才能知道包中有哪些工具, 仍然先全部解压再复制
+        """
+        if self.tools_handler.manifest is None or self.delta is not None:
+            return
+        if self.config["package_type"] == PackageTypeEnum.INSTALL_RDB_AGENT:
+            self.tools_plan = self.tools_handler.get_install_plan()
+        elif self.config["package_type"] == PackageTypeEnum.INSTALL_UPDATE_AGENT:
+            self.tools_plan = self.tools_handler.get_update_plan()
+
+    def _check_disk_space(self) -> bool:
+        """
+        复制计划决定了哪些工具会被解压、写到哪里, 先生成复制计划再规划磁盘空间
+        """
+        self._plan_tools()
+        tools_target = None if self.tools_plan is not None else Path(TOOLS_PATH)
+        return SpacePlanner(self.package_tar_gz, self.package_dir).check(
+            self.tools_plan,
+            tools_target,
+            kernel_build=True,
+            fsbackup_output_dir=Path(
+                self.tools_handler.get_planned_fsbackup_done_output_dir()
+            ),
+        )
+
+    def _check_delta_base(self) -> bool:
+        """
+        增量包只能应用到基础版本上, 目标端文件与基础版本不一致时需要使用完整包
+        """
+        mismatched = self.delta.check_base(Path(TOOLS_PATH), get_arch())
+        if mismatched:
+            logger.error(
+                f"{len(mismatched)} files do not match the delta base "
+                f"{self.delta.base_package}, use the full package instead: "
+                f"{', '.join(mismatched[:10])}"
+            )
+            return False
+        return True
+
+    @timeline.phase("extract")
     def _extract_tar_gz(self) -> bool:
         logger.info(f"Extracting tar.gz: {self.package_tar_gz}")
         if not tarfile.is_tarfile(self.package_tar_gz):
             logger.error(f"Failed to extract tar.gz: {self.package_tar_gz}")
             return False
+        if self.tools_plan is not None:
+            return self.tools_handler.stage_package(
+                self.package_tar_gz, self.package_dir, self.tools_plan
+            )
         with tarfile.open(self.package_tar_gz, "r:gz") as tar:
             tar.extractall(path=self.package_dir)
+            metrics.add_bytes("extracted", get_tar_bytes(tar))
             logger.info(f"Extracted tar.gz to: {self.package_dir}")
         return True
 
-    def install_or_update_tools(self) -> None:
+    @timeline.phase("tools_install")
+    def install_or_update_tools(self) -> bool:
+        """
+        安装或更新工具, 复制校验失败、增量包写入失败时返回 False
+        """
         if self.config["package_type"] == PackageTypeEnum.INSTALL_RDB_AGENT:
-            self.tools_handler.install_tools()
-        elif self.config["package_type"] == PackageTypeEnum.INSTALL_UPDATE_AGENT:
-            self.tools_handler.update_tools()
-        else:
-            logger.error(f"Invalid package type: {self.config['package_type']}")
+            return self.tools_handler.install_tools(self.tools_plan)
+        if self.delta is not None:
+            return self.tools_handler.apply_delta(self.delta)
+        if self.config["package_type"] == PackageTypeEnum.INSTALL_UPDATE_AGENT:
+            return self.tools_handler.update_tools(self.tools_plan)
+        logger.error(f"Invalid package type: {self.config['package_type']}")
+        return False
 
+    @timeline.phase("process_check")
     def _check_process(self) -> bool:
         return self.tools_handler.check_process(exclude_tools=["kernel"])
 
@@ -67,41 +137,66 @@ class Installer:
         if func() != result:
             sys.exit(1)
 
-    def _save_changelog(self) -> None:
+    @timeline.phase("changelog")
+    def _save_changelog(self, tools_version: Dict[str, str]) -> None:
         """
-        保存 changelog
+        保存 changelog, 复用已探测到的工具版本信息
         """
-        changelog_updater_binary_path = Path(PROJECT_DIR).joinpath(
-            PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value
-        )
-        if not changelog_updater_binary_path.exists():
-            logger.error(
-                f"changelog-updater binary not found: {changelog_updater_binary_path.as_posix()}"
-            )
-            return
-        Command([changelog_updater_binary_path.as_posix(), "record"]).run(
-            original=True, display=True
-        )
-        Command([changelog_updater_binary_path.as_posix(), "update"]).run(
-            original=True, display=True
+        try:
+            record_changelog(tools_version, tools_handler=self.tools_handler)
+        except Exception as e:
+            logger.error(f"Failed to save changelog: {e}")
+
+    def preflight(self) -> bool:
+        """
+        安装前检查, 并发执行, 输出汇总表
+        """
+        preflight = Preflight()
+        self.host_environment_detection.add_checks(
+            preflight, check_os_release=False, check_disk_space=False
         )
+        preflight.add("disk_space", self._check_disk_space)
+        if not self.force:
+            preflight.add("process", lambda: not self._check_process())
+        if self.delta is not None:
+            preflight.add("delta_base", self._check_delta_base)
+        preflight.add("verify", self._verify_package)
+        return preflight.run()
 
-    def run(self) -> None:
-        if not self.host_environment_detection.check(check_os_release=False):
-            return
+    def run(self) -> bool:
+        self._func_verify(self.preflight, True)
         if self.force:
-            self.tools_handler.kill_background_processes(exclude_tools=["kernel"])
-        else:
-            self._func_verify(self._check_process, False)
-        self._func_verify(self._verify_package, True)
+            # 所有检查通过后再关闭后台进程
+            with timeline.span("kill_processes"):
+                self.tools_handler.kill_background_processes(exclude_tools=["kernel"])
         self._func_verify(self._extract_tar_gz, True)
-        self.install_or_update_tools()
-        self._save_changelog()
-        self.tools_handler.print_tools_version()
-        self.tools_handler.check_process(ignore_warning=True)
+        self._func_verify(self.install_or_update_tools, True)
+        tools_version = self.tools_handler.print_tools_version()
+        self._save_changelog(tools_version)
+        with timeline.span("process_check"):
+            self.tools_handler.check_process(ignore_warning=True)
+        return True
+
+    def rollback(self, tool: str) -> bool:
+        """
+        从目标端存储回滚工具, 不需要旧版安装包
+        Args:
+            tool: 工具名称, 或 工具名称=版本
+        """
+        tool_name, _, version = tool.partition("=")
+        if self._check_process():
+            if not self.force:
+                return False
+            self.tools_handler.kill_background_processes(exclude_tools=["kernel"])
+        if not self.tools_handler.rollback_tool(tool_name, version):
+            return False
+        tools_version = self.tools_handler.print_tools_version()
+        self._save_changelog(tools_version)
+        return True
 
 
 def main():
+    install_profiler("install_rdb_agent")
     parser = argparse.ArgumentParser(description="tools installer or updater")
     parser.add_argument(
         "-f",
@@ -109,12 +204,60 @@ def main():
         action="store_true",  # 不需要值，只要写了就表示 True
         help="force install or update",
     )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record phase timings, write json report and chrome trace to the log dir",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="run the preflight checks only, exit 1 if any check fails",
+    )
+    parser.add_argument(
+        "--rollback",
+        metavar="TOOL[=VERSION]",
+        help="switch a tool back to a version kept in the local store "
+        "(the previous one by default)",
+    )
+    parser.add_argument(
+        "--store",
+        action="store_true",
+        help="list the tool versions kept in the local store",
+    )
+    add_answer_arguments(parser)
     args = parser.parse_args()
+    try:
+        answers.configure_from_args(args)
+    except AnswerError as e:
+        logger.error(str(e))
+        sys.exit(1)
     if args.force:
         installer = Installer(force=True)
     else:
         installer = Installer()
-    installer.run()
+    install_only = not (args.check or args.store or args.rollback)
+    with metrics.recording(
+        installer.config["package_type"], enabled=install_only
+    ), timeline.recording(
+        installer.config["package_type"], enabled=args.profile
+    ), shell_session():
+        if args.check:
+            result = installer.preflight()
+        elif args.store:
+            installer.tools_handler.print_store()
+            result = True
+        elif args.rollback:
+            result = installer.rollback(args.rollback)
+        else:
+            try:
+                result = installer.run()
+            except AnswerError as e:
+                logger.error(str(e))
+                result = False
+        metrics.result = result
+    if not result:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,20 @@
-import ipaddress
+import argparse
 import re
+import sys
 import tarfile
 from pathlib import Path
 
-from constants import PROJECT_DIR, PackageFilenameEnum
+from constants import AIO_ENV_FILE, PROJECT_DIR, PackageFilenameEnum
+from utils.answers import AnswerError, add_answer_arguments, answers
+from utils.changelog import record_changelog
 from utils.check import HostEnvironmentDetection
-from utils.command import Command
+from utils.command import Command, shell_session
+from utils.diagnostics import install_profiler
 from utils.log_base import logger
+from utils.metrics import get_tar_bytes, metrics
+from utils.preflight import Preflight
+from utils.space_plan import SpacePlanner
+from utils.timeline import timeline
 from utils.verify import PackageBuilder
 
 
@@ -17,6 +25,7 @@ class Installer:
         self.host_environment_detection = HostEnvironmentDetection()
         self.is_first_install = False
 
+    @timeline.phase("verify")
     def _verify_package(self) -> bool:
         try:
             package_builder = PackageBuilder()
@@ -26,6 +35,7 @@ class Installer:
             return False
         return True
 
+    @timeline.phase("rpm_check")
     def _check_rpm_installed(self) -> bool:
         command = Command(
             [
@@ -42,6 +52,10 @@ class Installer:
             logger.info(f"RPM not installed")
             return False
 
+    def _check_disk_space(self) -> bool:
+        return SpacePlanner(self.package_tar_gz, self.package_dir).check()
+
+    @timeline.phase("extract")
     def _extract_tar_gz(self) -> bool:
         logger.info(f"Extracting tar.gz: {self.package_tar_gz}")
         if not tarfile.is_tarfile(self.package_tar_gz):
@@ -49,9 +63,11 @@ class Installer:
             return False
         with tarfile.open(self.package_tar_gz, "r:gz") as tar:
             tar.extractall(path=self.package_dir)
+            metrics.add_bytes("extracted", get_tar_bytes(tar))
             logger.info(f"Extracted tar.gz to: {self.package_dir}")
         return True
 
+    @timeline.phase("rpm_install")
     def _install_rpm(self) -> None:
         files = list(self.package_dir.glob("aio-*.rpm"))
         if not files:
@@ -65,6 +81,7 @@ class Installer:
         if result.returncode != 0:
             logger.error(f"Failed to install rpm: {result.stderr}")
 
+    @timeline.phase("service_start")
     def _start_aio_speedd(self) -> None:
         command = Command(["systemctl", "restart", "aio.speed.service"])
         result = command.run(original=True)
@@ -72,13 +89,6 @@ class Installer:
             logger.error(f"Failed to start aio-speedd: {result.stderr}")
         logger.info("aio-speedd is started")
 
-    def _is_valid_ipv4(self, ip: str) -> bool:
-        try:
-            ipaddress.IPv4Address(ip)
-            return True
-        except ipaddress.AddressValueError:
-            return False
-
     def _set_permissions(self, env_file_content: str) -> str:
         """
         设置权限, 设置三全分立
@@ -88,10 +98,10 @@ class Installer:
         """
         # 默认设置为 non-separate
         aio_role_mode = "non-separate"
-        if self.is_first_install:
-            input_str = input("是否开启三权分立(y/n), 默认不开启: ")
-            if "y" in input_str.lower():
-                aio_role_mode = "separate"
+        if self.is_first_install and answers.confirm(
+            "role_separation", "是否开启三权分立(y/n), 默认不开启: ", default=False
+        ):
+            aio_role_mode = "separate"
         # 删除 AIO_ROLE_MODE 的行
         env_file_content = re.sub(
             r"^AIO_ROLE_MODE=.*\n?", "", env_file_content, flags=re.M
@@ -101,12 +111,25 @@ class Installer:
         )
         return env_file_content
 
+    def _check_answers(self) -> bool:
+        """
+        aio.env 由 rpm 生成, 还不存在或仍是 127.0.0.1 时安装过程中需要 server ip
+        """
+        aio_env_file = Path(AIO_ENV_FILE)
+        required = []
+        if not aio_env_file.exists() or "127.0.0.1" in aio_env_file.read_text(
+            encoding="utf-8"
+        ):
+            required.append("server_ip")
+        return answers.check(required)
+
+    @timeline.phase("configure")
     def _replace_aio_env(self) -> None:
         """
         替换 aio.env 文件中的 127.0.0.1 为实际的 server ip
         """
         # 读取 aio.env 文件
-        aio_env_file = Path("/opt/aio/cfg/aio.env")
+        aio_env_file = Path(AIO_ENV_FILE)
         if not aio_env_file.exists():
             logger.error(f"aio.env file not found: {aio_env_file.as_posix()}")
             return
@@ -123,23 +146,16 @@ class Installer:
         # 如果是第一次安装，则需要替换 aio.env 文件中的 127.0.0.1 为实际的 server ip
         self.is_first_install = True
         # 替换 aio.env 文件内容
-        while True:
-            input_str = input(
-                f"Please input the server ipv4 address (example: 192.168.1.100): "
-            )
-            input_str = input_str.strip()
-            if "127.0.0.1" in input_str:
-                logger.error(f"Invalid ip: {input_str}")
-                continue
-            if not self._is_valid_ipv4(input_str):
-                logger.error(f"Invalid ip: {input_str}")
-                continue
-            content = content.replace("127.0.0.1", input_str)
-            break
+        server_ip = answers.ask(
+            "server_ip",
+            "Please input the server ipv4 address (example: 192.168.1.100): ",
+        )
+        content = content.replace("127.0.0.1", server_ip)
         content = self._set_permissions(content)
         aio_env_file.write_text(content, encoding="utf-8")
         logger.info(f"{aio_env_file.as_posix()} is modified")
 
+    @timeline.phase("service_start")
     def _init_service(self) -> None:
         """
         初始化服务
@@ -148,41 +164,74 @@ class Installer:
         Command(["rdb", "init"]).run(original=True, display=True)
         Command(["rdb", "start"]).run(original=True, display=True)
 
+    @timeline.phase("changelog")
     def _save_changelog(self) -> None:
         """
         保存 changelog
         """
-        changelog_updater_binary_path = Path(PROJECT_DIR).joinpath(
-            PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value
-        )
-        if not changelog_updater_binary_path.exists():
-            logger.error(
-                f"changelog-updater binary not found: {changelog_updater_binary_path.as_posix()}"
-            )
-            return
-        Command([changelog_updater_binary_path.as_posix(), "record"]).run(
-            original=True, display=True
-        )
-        Command([changelog_updater_binary_path.as_posix(), "update"]).run(
-            original=True, display=True
-        )
+        try:
+            record_changelog()
+        except Exception as e:
+            logger.error(f"Failed to save changelog: {e}")
 
-    def run(self) -> None:
-        if not self.host_environment_detection.check():
-            return
-        if self._check_rpm_installed():
-            return
-        if not self._verify_package():
-            return
+    def preflight(self) -> bool:
+        """
+        安装前检查, 并发执行, 输出汇总表
+        """
+        preflight = Preflight()
+        self.host_environment_detection.add_checks(preflight, check_disk_space=False)
+        preflight.add("disk_space", self._check_disk_space)
+        preflight.add("rpm", lambda: not self._check_rpm_installed())
+        preflight.add("answers", self._check_answers)
+        preflight.add("verify", self._verify_package)
+        return preflight.run()
+
+    def run(self) -> bool:
+        if not self.preflight():
+            return False
         if not self._extract_tar_gz():
-            return
+            return False
         self._install_rpm()
         self._replace_aio_env()
         self._save_changelog()
         self._start_aio_speedd()
         self._init_service()
+        return True
 
 
-if __name__ == "__main__":
+def main():
+    install_profiler("install_rdb_server")
+    parser = argparse.ArgumentParser(description="rdb server installer")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record phase timings, write json report and chrome trace to the log dir",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="run the preflight checks only, exit 1 if any check fails",
+    )
+    add_answer_arguments(parser)
+    args = parser.parse_args()
+    try:
+        answers.configure_from_args(args)
+    except AnswerError as e:
+        logger.error(str(e))
+        sys.exit(1)
     installer = Installer()
-    installer.run()
+    with metrics.recording(
+        "install_rdb_server", enabled=not args.check
+    ), timeline.recording("install_rdb_server", enabled=args.profile), shell_session():
+        try:
+            result = installer.preflight() if args.check else installer.run()
+        except AnswerError as e:
+            logger.error(str(e))
+            result = False
+        metrics.result = result
+    if not result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
-import ipaddress
+import argparse
+import sys
 import tarfile
 from pathlib import Path
 
-from constants import PROJECT_DIR, PackageFilenameEnum
+from constants import AIO_ENV_FILE, PROJECT_DIR, PackageFilenameEnum
+from utils.answers import AnswerError, add_answer_arguments, answers
+from utils.changelog import record_changelog
 from utils.check import HostEnvironmentDetection
-from utils.command import Command
+from utils.command import Command, shell_session
+from utils.diagnostics import install_profiler
 from utils.log_base import logger
+from utils.metrics import get_tar_bytes, metrics
+from utils.preflight import Preflight
+from utils.space_plan import SpacePlanner
+from utils.timeline import timeline
 from utils.verify import PackageBuilder
 
 
@@ -15,6 +23,7 @@ class Installer:
         self.package_dir = PROJECT_DIR.joinpath("package")
         self.host_environment_detection = HostEnvironmentDetection()
 
+    @timeline.phase("host_check")
     def _check_host_type(self) -> bool:
         """
         检查主机类型,
@@ -25,13 +34,7 @@ class Installer:
             return False
         return True
 
-    def _is_valid_ipv4(self, ip: str) -> bool:
-        try:
-            ipaddress.IPv4Address(ip)
-            return True
-        except ipaddress.AddressValueError:
-            return False
-
+    @timeline.phase("verify")
     def _verify_package(self) -> bool:
         try:
             package_builder = PackageBuilder()
@@ -41,6 +44,7 @@ class Installer:
             return False
         return True
 
+    @timeline.phase("rpm_check")
     def _check_rpm_installed(self) -> bool:
         command = Command(
             [
@@ -57,6 +61,10 @@ class Installer:
             logger.info(f"RPM not installed")
             return False
 
+    def _check_disk_space(self) -> bool:
+        return SpacePlanner(self.package_tar_gz, self.package_dir).check()
+
+    @timeline.phase("extract")
     def _extract_tar_gz(self) -> bool:
         logger.info(f"Extracting tar.gz: {self.package_tar_gz}")
         if not tarfile.is_tarfile(self.package_tar_gz):
@@ -64,9 +72,11 @@ class Installer:
             return False
         with tarfile.open(self.package_tar_gz, "r:gz") as tar:
             tar.extractall(path=self.package_dir)
+            metrics.add_bytes("extracted", get_tar_bytes(tar))
             logger.info(f"Extracted tar.gz to: {self.package_dir}")
         return True
 
+    @timeline.phase("rpm_install")
     def _install_rpm(self) -> None:
         logger.info(f"Installing RPM: {self.package_dir}")
         files = list(self.package_dir.glob("aio-airflow-*.rpm"))
@@ -81,12 +91,25 @@ class Installer:
         if result.returncode != 0:
             logger.error(f"Failed to install rpm: {result.stderr}")
 
+    def _check_answers(self) -> bool:
+        """
+        aio.env 由 rpm 生成, 还不存在或仍是 127.0.0.1 时安装过程中需要 server ip
+        """
+        aio_env_file = Path(AIO_ENV_FILE)
+        required = []
+        if not aio_env_file.exists() or "127.0.0.1" in aio_env_file.read_text(
+            encoding="utf-8"
+        ):
+            required.append("server_ip")
+        return answers.check(required)
+
+    @timeline.phase("configure")
     def _replace_aio_env(self) -> None:
         """
         替换 aio.env 文件中的 127.0.0.1 为实际的 server ip
         """
         # 读取 aio.env 文件
-        aio_env_file = Path("/opt/aio/cfg/aio.env")
+        aio_env_file = Path(AIO_ENV_FILE)
         if not aio_env_file.exists():
             logger.error(f"aio.env file not found: {aio_env_file.as_posix()}")
             return
@@ -94,22 +117,15 @@ class Installer:
         content = aio_env_file.read_text(encoding="utf-8")
         if "127.0.0.1" not in content:
             return
-        while True:
-            input_str = input(
-                f"Please input the rdb server ipv4 address (example: 192.168.1.100): "
-            )
-            input_str = input_str.strip()
-            if "127.0.0.1" in input_str:
-                logger.error(f"Invalid ip: {input_str}")
-                continue
-            if not self._is_valid_ipv4(input_str):
-                logger.error(f"Invalid ip: {input_str}")
-                continue
-            content = content.replace("127.0.0.1", input_str)
-            break
+        server_ip = answers.ask(
+            "server_ip",
+            "Please input the rdb server ipv4 address (example: 192.168.1.100): ",
+        )
+        content = content.replace("127.0.0.1", server_ip)
         aio_env_file.write_text(content, encoding="utf-8")
         logger.info(f"{aio_env_file.as_posix()} is modified")
 
+    @timeline.phase("service_start")
     def _start_aio_speedd(self) -> None:
         command = Command(["systemctl", "restart", "aio.speed.service"])
         result = command.run(original=True)
@@ -117,25 +133,17 @@ class Installer:
             logger.error(f"Failed to start aio-speedd: {result.stderr}")
         logger.info("aio-speedd is started")
 
+    @timeline.phase("changelog")
     def _save_changelog(self) -> None:
         """
         保存 changelog
         """
-        changelog_updater_binary_path = Path(PROJECT_DIR).joinpath(
-            PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value
-        )
-        if not changelog_updater_binary_path.exists():
-            logger.error(
-                f"changelog-updater binary not found: {changelog_updater_binary_path.as_posix()}"
-            )
-            return
-        Command([changelog_updater_binary_path.as_posix(), "record"]).run(
-            original=True, display=True
-        )
-        Command([changelog_updater_binary_path.as_posix(), "update"]).run(
-            original=True, display=True
-        )
+        try:
+            record_changelog()
+        except Exception as e:
+            logger.error(f"Failed to save changelog: {e}")
 
+    @timeline.phase("service_start")
     def _init_service(self) -> None:
         """
         初始化服务
@@ -145,24 +153,65 @@ class Installer:
             original=True, display=True
         )
 
-    def run(self) -> None:
-        if not self._check_host_type():
-            return
-        if not self.host_environment_detection.check():
-            return
-        if self._check_rpm_installed():
-            return
-        if not self._verify_package():
-            return
+    def preflight(self) -> bool:
+        """
+        安装前检查, 并发执行, 输出汇总表
+        """
+        preflight = Preflight()
+        preflight.add("host_type", self._check_host_type)
+        self.host_environment_detection.add_checks(preflight, check_disk_space=False)
+        preflight.add("disk_space", self._check_disk_space)
+        preflight.add("rpm", lambda: not self._check_rpm_installed())
+        preflight.add("answers", self._check_answers)
+        preflight.add("verify", self._verify_package)
+        return preflight.run()
+
+    def run(self) -> bool:
+        if not self.preflight():
+            return False
         if not self._extract_tar_gz():
-            return
+            return False
         self._install_rpm()
         self._replace_aio_env()
         self._save_changelog()
         self._start_aio_speedd()
         self._init_service()
+        return True
 
 
-if __name__ == "__main__":
+def main():
+    install_profiler("install_rdb_worker")
+    parser = argparse.ArgumentParser(description="rdb worker installer")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record phase timings, write json report and chrome trace to the log dir",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="run the preflight checks only, exit 1 if any check fails",
+    )
+    add_answer_arguments(parser)
+    args = parser.parse_args()
+    try:
+        answers.configure_from_args(args)
+    except AnswerError as e:
+        logger.error(str(e))
+        sys.exit(1)
     installer = Installer()
-    installer.run()
+    with metrics.recording(
+        "install_rdb_worker", enabled=not args.check
+    ), timeline.recording("install_rdb_worker", enabled=args.profile), shell_session():
+        try:
+            result = installer.preflight() if args.check else installer.run()
+        except AnswerError as e:
+            logger.error(str(e))
+            result = False
+        metrics.result = result
+    if not result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import re
 import sys
 import tarfile
@@ -5,10 +6,18 @@ from pathlib import Path
 from typing import List
 
 from constants import PROJECT_DIR, PackageFilenameEnum
-from utils.aio_tools import parse_version
+from utils.answers import AnswerError, add_answer_arguments, answers
+from utils.changelog import record_changelog
 from utils.check import HostEnvironmentDetection
-from utils.command import Command
+from utils.command import Command, shell_session
+from utils.delta import DeltaPackage
+from utils.diagnostics import install_profiler
 from utils.log_base import logger
+from utils.metrics import get_tar_bytes, metrics
+from utils.preflight import Preflight
+from utils.space_plan import SpacePlanner
+from utils.timeline import timeline
+from utils.version_reader import get_distribution_version, parse_version
 from utils.verify import PackageBuilder
 
 
@@ -19,6 +28,10 @@ class Installer:
         self.host_environment_detection = HostEnvironmentDetection()
         self._package_builder = PackageBuilder()
         self.current_version = self._get_current_version()
+        # 增量包中只有变化的 whl
+        self.delta = DeltaPackage.load(
+            PROJECT_DIR.joinpath(PackageFilenameEnum.DELTA.value)
+        )
 
     def _get_current_version(self) -> str:
         """
@@ -50,6 +63,7 @@ class Installer:
             env_file.write_text(new_content, encoding="utf-8")
             logger.info(f"Set AIO_VERSION to {version} in {env_file.as_posix()}")
 
+    @timeline.phase("verify")
     def _verify_package(self) -> bool:
         try:
             self._package_builder.decrypt_verify_file()
@@ -58,10 +72,29 @@ class Installer:
             return False
         return True
 
+    @timeline.phase("service_start")
     def _start_service(self, service_name: str) -> None:
         Command(["rdb", "stop", service_name]).run(original=True, display=True)
         Command(["rdb", "start", service_name]).run(original=True, display=True)
 
+    def _check_disk_space(self) -> bool:
+        return SpacePlanner(self.package_tar_gz, self.package_dir).check()
+
+    def _check_delta_base(self) -> bool:
+        """
+        增量包中没有的 whl, 目标端已安装的版本必须与基础版本一致
+        """
+        mismatched = self.delta.check_wheels()
+        if mismatched:
+            logger.error(
+                f"installed libraries do not match the delta base "
+                f"{self.delta.base_package}, use the full package instead: "
+                f"{', '.join(mismatched)}"
+            )
+            return False
+        return True
+
+    @timeline.phase("extract")
     def _extract_tar_gz(self) -> bool:
         """
         解压package.tar.gz文件到package目录下
@@ -72,6 +105,7 @@ class Installer:
             return False
         with tarfile.open(self.package_tar_gz, "r:gz") as tar:
             tar.extractall(path=self.package_dir)
+            metrics.add_bytes("extracted", get_tar_bytes(tar))
             logger.info(f"Extracted tar.gz to: {self.package_dir}")
         return True
 
@@ -83,12 +117,17 @@ class Installer:
         return list(whl_files)
 
     def _get_python_library_version(self, pip_path: Path, library_name: str) -> str:
+        # 优先读取 dist-info 元数据, 不启动 pip
+        version = get_distribution_version(pip_path.parent.parent, library_name)
+        if version:
+            return parse_version(r"(\d+\.\d+\.\d+\.\d+)", version)
         result = Command([pip_path.as_posix(), "show", library_name]).run(original=True)
         if result.returncode != 0:
             logger.info(f"Failed to get {library_name} version: {result.stderr}")
             return ""
         return parse_version(r"Version:\s*(\d+\.\d+\.\d+\.\d+)", result.stdout)
 
+    @timeline.phase("pip_install_cdm")
     def _install_cdm(self) -> None:
         pip_path = Path("/opt/aio/cdm/bin/pip3")
         if not pip_path.exists():
@@ -141,6 +180,7 @@ class Installer:
         self._start_service("task_log")
         self._start_service("web")
 
+    @timeline.phase("pip_install_airflow")
     def _install_airflow(self) -> None:
         pip_path = Path("/opt/aio/airflow/bin/pip3")
         if not pip_path.exists():
@@ -188,40 +228,77 @@ class Installer:
         self._start_service("task_log")
         self._start_service("worker")
 
+    @timeline.phase("changelog")
     def _save_changelog(self) -> None:
         """
         保存 changelog
         """
-        changelog_updater_binary_path = Path(PROJECT_DIR).joinpath(
-            PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value
-        )
-        if not changelog_updater_binary_path.exists():
-            logger.error(
-                f"changelog-updater binary not found: {changelog_updater_binary_path.as_posix()}"
-            )
-            return
-        Command([changelog_updater_binary_path.as_posix(), "record"]).run(
-            original=True, display=True
-        )
-        Command([changelog_updater_binary_path.as_posix(), "update"]).run(
-            original=True, display=True
-        )
+        try:
+            record_changelog()
+        except Exception as e:
+            logger.error(f"Failed to save changelog: {e}")
 
     def _install_code(self) -> None:
         self._install_cdm()
         self._install_airflow()
 
-    def run(self) -> None:
-        if not self.host_environment_detection.check(check_os_release=False):
-            return
-        if not self._verify_package():
-            return
+    def preflight(self) -> bool:
+        """
+        安装前检查, 并发执行, 输出汇总表
+        """
+        preflight = Preflight()
+        self.host_environment_detection.add_checks(
+            preflight, check_os_release=False, check_disk_space=False
+        )
+        preflight.add("disk_space", self._check_disk_space)
+        if self.delta is not None:
+            preflight.add("delta_base", self._check_delta_base)
+        preflight.add("verify", self._verify_package)
+        return preflight.run()
+
+    def run(self) -> bool:
+        if not self.preflight():
+            return False
         if not self._extract_tar_gz():
-            return
+            return False
         self._install_code()
         self._save_changelog()
+        return True
 
 
-if __name__ == "__main__":
+def main():
+    install_profiler("install_update_code")
+    parser = argparse.ArgumentParser(description="code updater")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="record phase timings, write json report and chrome trace to the log dir",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="run the preflight checks only, exit 1 if any check fails",
+    )
+    # 代码升级没有交互式问题, 接受与其他安装包相同的参数, 批量部署时统一传入
+    add_answer_arguments(parser)
+    args = parser.parse_args()
+    try:
+        answers.configure_from_args(args)
+    except AnswerError as e:
+        logger.error(str(e))
+        sys.exit(1)
     installer = Installer()
-    installer.run()
+    with metrics.recording(
+        "install_update_code", enabled=not args.check
+    ), timeline.recording("install_update_code", enabled=args.profile), shell_session():
+        if args.check:
+            result = installer.preflight()
+        else:
+            result = installer.run()
+        metrics.result = result
+    if not result:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
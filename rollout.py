@@ -0,0 +1,90 @@
+import argparse
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from constants import PROJECT_DIR
+from utils.log_base import logger
+from utils.rollout import Rollout, load_inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="push, verify and install a package on many hosts",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("-i", "--inventory", required=True, help="inventory json file")
+    parser.add_argument(
+        "-p", "--package", required=True, help="package built by build.py"
+    )
+    parser.add_argument(
+        "-c", "--concurrency", type=int, default=10, help="hosts deployed at once"
+    )
+    parser.add_argument(
+        "--canary",
+        type=int,
+        default=1,
+        help="hosts deployed first, the others start only if all of them succeed",
+    )
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        default=0,
+        help="number of failed hosts tolerated, no new hosts are started once "
+        "more hosts fail (0: stop after the first failure), -1 for no limit",
+    )
+    parser.add_argument(
+        "--check-only",
+        action="store_true",
+        help="push and run the preflight checks without installing",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="install with --profile and collect the timing reports",
+    )
+    parser.add_argument(
+        "--timeout", type=int, default=None, help="timeout of each remote command"
+    )
+    parser.add_argument(
+        "--log-dir",
+        default=None,
+        help="per-host logs and report.json (default: rollout-logs/<time>)",
+    )
+    args = parser.parse_args()
+
+    package = Path(args.package).resolve()
+    if not package.is_file():
+        logger.error(f"package not found: {package}")
+        sys.exit(1)
+    hosts = load_inventory(Path(args.inventory))
+    if not hosts:
+        logger.error(f"no hosts in inventory: {args.inventory}")
+        sys.exit(1)
+    log_dir = (
+        Path(args.log_dir)
+        if args.log_dir
+        else PROJECT_DIR.joinpath(
+            "rollout-logs", datetime.now().strftime("%Y%m%d%H%M%S")
+        )
+    )
+    rollout = Rollout(
+        package,
+        hosts,
+        log_dir,
+        concurrency=args.concurrency,
+        canary=args.canary,
+        max_failures=args.max_failures,
+        check_only=args.check_only,
+        profile=args.profile,
+        timeout=args.timeout,
+    )
+    start = time.perf_counter()
+    results = rollout.run()
+    if not rollout.report(results, time.perf_counter() - start):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,15 @@
-import platform
+import os
 import re
 import shutil
 import sys
+import tarfile
 import tempfile
 from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from packaging.version import parse as parseVersion
-from tabulate import tabulate
-
 from constants import (
     FS_BACKUP_KERNEL_NAME,
     KERNEL_VERSION,
@@ -18,32 +17,64 @@ from constants import (
     TOOLS_PATH,
     PackageFilenameEnum,
 )
+from utils.answers import answers
+from utils.artifact_store import ArtifactStore
 from utils.command import Command
+from utils.copy_engine import CopyEngine, copy_anything
+from utils.copy_plan import CopyOperation, CopyPlanner, _is_within
+from utils.delta import DeltaError, DeltaPackage
+from utils.host_facts import HostFacts, get_host_facts
 from utils.log_base import COLORS, logger
+from utils.manifest import PackageManifest
+from utils.metrics import metrics
+from utils.probe_cache import ProbeCache, get_rule_fingerprint
+from utils.staging import (
+    StagedExtractor,
+    StageRoute,
+    get_staging_path,
+    remove_path,
+    swap_into_place,
+)
+from utils.timeline import timeline
+from utils.version_reader import parse_version, read_version
+
+
+# 安装包支持的架构, 与 get_arch 的返回值一致
+SUPPORTED_ARCHS = ["x86_64", "aarch64"]
+# 形如 ps -ef | grep '<pattern>' | grep -v grep 的进程命令, 可以直接用主机信息中的进程判断
+PS_GREP_PATTERN = re.compile(r"^ps -ef \| grep '([^']+)' \| grep -v grep$")
+# fsbackup 完成后的默认输出目录
+DEFAULT_FSBACKUP_DONE_OUTPUT_DIR = "/var/fsbackup"
 
 
+@lru_cache(maxsize=None)
 def get_arch():
     """
     获取架构
     """
-    arch = platform.machine().lower()
+    return get_host_facts().arch
 
-    if arch in ["x86_64", "amd64", "i386", "i686"]:
-        return "x86_64"
-    elif arch in ["aarch64", "arm64", "armv8"]:
-        return "aarch64"
-    else:
-        return "x86_64"
 
+def is_newer_version(package_version: str, target_version: str) -> bool:
+    """
+    安装包中的版本是否比目标端新
+    - 目标端没有版本（未安装或探测失败）: 需要更新
+    - 安装包中没有版本: 无法比较, 不更新
+    - 不符合 PEP 440 的版本（例如 20250101-rc）按字符串比较
+    """
+    if not target_version:
+        return True
+    if not package_version:
+        return False
+    from packaging.version import InvalidVersion
+    from packaging.version import parse as parseVersion
 
-def parse_version(pattern: str, string: str) -> str:
-    match = re.search(pattern, string)
-    if match:
-        return match.group(1)
-    return ""
+    try:
+        return parseVersion(package_version) > parseVersion(target_version)
+    except InvalidVersion:
+        return package_version > target_version
 
 
-ARCH = get_arch()
 """
 {
     # 工具名称
@@ -63,330 +94,348 @@ ARCH = get_arch()
             "path_type": "dir",
         }
     ],
+    # 可选, 版本是否可以按 path 的文件标识缓存, 默认 True
+    # 版本不由 path 本身决定的工具（例如 pip3 show）需要设置为 False
+    "cacheable": True,
+    # 可选, 不执行工具二进制文件的版本读取方式, 读取失败时回退到 command, 见 utils/version_reader.py
+    # 可以读取其他架构的二进制文件
+    "reader": {"type": "elf-string", "pattern": r"version\s*?(\d+\.\d+\.\d+)"},
 },
 """
-TOOLS: List[Dict[str, Any]] = [
-    {
-        "name": "aio-oss",
-        "path": "{tools_path}/aio-oss/{arch}/aio-oss",
-        "command": ["$path", "--version"],
-        "processes_command": "ps -ef | grep 'aio-oss' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"version\s*?(\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/aio-oss",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "airflow",
-        "path": "/opt/aio/airflow/bin/pip3",
-        "command": ["$path", "show", "aio-tasks"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"Version:\s*(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": None,
-    },
-    {
-        "name": "cdm",
-        "path": "/opt/aio/cdm/bin/pip3",
-        "command": ["$path", "show", "aio"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"Version:\s*(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": None,
-    },
-    {
-        "name": "bwlimit",
-        "path": "{tools_path}/bwlimit/{arch}/bwlimit_tools",
-        "command": None,
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": None,
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/bwlimit",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "aio-speed",
-        "path": "{tools_path}/rpc/{arch}/aio-speed",
-        "command": ["$path", "--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: out.strip(),
-        "replace_dirs": None,
-    },
-    {
-        "name": "aio-speedd",
-        "path": "{tools_path}/rpc/{arch}/aio-speedd",
-        "command": ["$path", "--version"],
-        "processes_command": "ps -ef | grep 'aio-speedd' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: out.strip(),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/rpc",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "dm_ftp",
-        "path": "{tools_path}/dm_ftp/{arch}/dm-ftp",
-        "command": ["$path", "-v"],
-        "processes_command": "ps -ef | grep 'dm-ftp' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"version:.*?(\d{8})", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/dm_ftp",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "fs-cli",
-        "path": "{tools_path}/fs-tools/{arch}/fsclient/fs-cli",
-        "command": ["$path", "--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: out.strip(),
-        "replace_dirs": None,
-    },
-    {
-        "name": "fsdeamon",
-        "path": "{tools_path}/fs-tools/{arch}/fsdeamon/fsdeamon",
-        "command": ["$path", "-V"],
-        "processes_command": "ps -ef | grep './fsdeamon' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"version:\s*(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/fs-tools",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "kernel",
-        "path": "{tools_path}/fs-tools/{arch}/kernel/{kernel_version}/fsbackup.ko",
-        "command": ["modinfo", "--field=version", "$path"],
-        "processes_command": "lsmod | grep fsbackup",
-        "kill_processes_command": "lsmod | grep fsbackup | awk '{print $1}' | xargs rmmod",
-        "parse": lambda out: out.strip(),
-        "replace_dirs": None,
-    },
-    {
-        "name": "gmssl",
-        "path": "{tools_path}/gmssl/{arch}/gmssl",
-        "command": ["$path", "version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"GmSSL\s*(\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/gmssl",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "obk_ftp",
-        "path": "{tools_path}/obk_ftp/{arch}/FileTransferAgent",
-        "command": ["$path", "--version"],
-        "processes_command": "ps -ef | grep './FileTransferAgent' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"version:\s*(\d{8})", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/obk_ftp",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "zfsdeamon",
-        "path": "{tools_path}/s3-tools/{arch}/zfsdeamon/zfsdeamon",
-        "command": ["$path", "--version"],
-        "processes_command": "ps -ef | grep './zfsdeamon' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/s3-tools/{arch}/zfsdeamon",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "afs-cli",
-        "path": "{tools_path}/s3-tools/{arch}/afs/afs-cli",
-        "command": ["$path", "--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"version\s*(\d+\.\d+\.\d+)", out),
-        "replace_dirs": None,
-    },
-    {
-        "name": "afsd",
-        "path": "{tools_path}/s3-tools/{arch}/afs/afsd",
-        "command": ["$path", "--version", "x"],
-        "processes_command": "ps -ef | grep 'afsd' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"version:\s*(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/s3-tools/{arch}/afs",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "mc",
-        "path": "{tools_path}/s3-tools/{arch}/mc",
-        "command": ["$path", f"--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"version:\s*(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/s3-tools/{arch}/mc",
-                "path_type": "file",
-            }
-        ],
-    },
-    {
-        "name": "s3fs",
-        "path": "{tools_path}/s3-tools/{arch}/s3fs",
-        "command": ["$path", "--version"],
-        "processes_command": "ps -ef | grep 's3fs' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r".*?V(\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/s3-tools/{arch}/s3fs",
-                "path_type": "file",
-            }
-        ],
-    },
-    {
-        "name": "s3-tool",
-        "path": "{tools_path}/s3-tools/{arch}/s3-tool/s3-tool",
-        "command": ["$path", "--version"],
-        "processes_command": "ps -ef | grep 's3-tool' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: parse_version(r"(\d+\.\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/s3-tools/{arch}/s3-tool",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "lsof",
-        "path": "{tools_path}/sys/{arch}/lsof",
-        "command": ["$path", "-v"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r".*?revision:\s*(\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/sys",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "rdbcomm",
-        "path": "{tools_path}/rdbcomm/{arch}/rdbcomm",
-        "command": ["$path", "-v"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: out.strip(),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/rdbcomm/{arch}/rdbcomm",
-                "path_type": "file",
-            }
-        ],
-    },
-    {
-        "name": "rdbcommd",
-        "path": "{tools_path}/rdbcomm/{arch}/rdbcommd",
-        "command": ["$path", "-v"],
-        "processes_command": "ps -ef | grep '/rdbcommd' | grep -v grep",
-        "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
-        "parse": lambda out: out.strip(),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/rdbcomm/{arch}/rdbcommd",
-                "path_type": "file",
-            }
-        ],
-    },
-    {
-        "name": "zfs",
-        "path": "{tools_path}/s3-tools/{arch}/zfs/zfs",
-        "command": ["$path", "--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"-(\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/s3-tools/{arch}/zfs",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "xbsa",
-        "path": "{tools_path}/sys/{arch}/xbsa",
-        "command": None,
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": None,
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/xbsa",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "xtrabackup2.4",
-        "path": "{tools_path}/mysql/xtrabackup/2.4-linux-{arch}/xtrabackup",
-        "command": ["$path", "--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"version\s*?(\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/mysql/xtrabackup/2.4-linux-{arch}",
-                "path_type": "dir",
-            }
-        ],
-    },
-    {
-        "name": "xtrabackup8.0",
-        "path": "{tools_path}/mysql/xtrabackup/8.0-linux-{arch}/xtrabackup",
-        "command": ["$path", "--version"],
-        "processes_command": None,
-        "kill_processes_command": None,
-        "parse": lambda out: parse_version(r"version\s*?(\d+\.\d+\.\d+)", out),
-        "replace_dirs": [
-            {
-                "path": "{tools_path}/mysql/xtrabackup/8.0-linux-{arch}",
-                "path_type": "dir",
-            }
-        ],
-    },
-]
+
+
+@lru_cache(maxsize=None)
+def get_tools() -> List[Dict[str, Any]]:
+    """
+    工具定义, 第一次使用时才创建（包含大量 lambda）, 字段说明见上方注释
+    """
+    return [
+        {
+            "name": "aio-oss",
+            "path": "{tools_path}/aio-oss/{arch}/aio-oss",
+            "command": ["$path", "--version"],
+            "processes_command": "ps -ef | grep 'aio-oss' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"version\s*?(\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/aio-oss",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "airflow",
+            "path": "/opt/aio/airflow/bin/pip3",
+            "command": ["$path", "show", "aio-tasks"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"Version:\s*(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": None,
+            "cacheable": False,
+            "reader": {"type": "dist-info", "distribution": "aio-tasks"},
+        },
+        {
+            "name": "cdm",
+            "path": "/opt/aio/cdm/bin/pip3",
+            "command": ["$path", "show", "aio"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"Version:\s*(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": None,
+            "cacheable": False,
+            "reader": {"type": "dist-info", "distribution": "aio"},
+        },
+        {
+            "name": "bwlimit",
+            "path": "{tools_path}/bwlimit/{arch}/bwlimit_tools",
+            "command": None,
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": None,
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/bwlimit",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "aio-speed",
+            "path": "{tools_path}/rpc/{arch}/aio-speed",
+            "command": ["$path", "--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: out.strip(),
+            "replace_dirs": None,
+        },
+        {
+            "name": "aio-speedd",
+            "path": "{tools_path}/rpc/{arch}/aio-speedd",
+            "command": ["$path", "--version"],
+            "processes_command": "ps -ef | grep 'aio-speedd' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: out.strip(),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/rpc",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "dm_ftp",
+            "path": "{tools_path}/dm_ftp/{arch}/dm-ftp",
+            "command": ["$path", "-v"],
+            "processes_command": "ps -ef | grep 'dm-ftp' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"version:.*?(\d{8})", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/dm_ftp",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "fs-cli",
+            "path": "{tools_path}/fs-tools/{arch}/fsclient/fs-cli",
+            "command": ["$path", "--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: out.strip(),
+            "replace_dirs": None,
+        },
+        {
+            "name": "fsdeamon",
+            "path": "{tools_path}/fs-tools/{arch}/fsdeamon/fsdeamon",
+            "command": ["$path", "-V"],
+            "processes_command": "ps -ef | grep './fsdeamon' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"version:\s*(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/fs-tools",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "kernel",
+            "path": "{tools_path}/fs-tools/{arch}/kernel/{kernel_version}/fsbackup.ko",
+            "command": ["modinfo", "--field=version", "$path"],
+            "processes_command": "lsmod | grep fsbackup",
+            "kill_processes_command": "lsmod | grep fsbackup | awk '{print $1}' | xargs rmmod",
+            "parse": lambda out: out.strip(),
+            "replace_dirs": None,
+            "reader": {"type": "modinfo", "field": "version"},
+        },
+        {
+            "name": "gmssl",
+            "path": "{tools_path}/gmssl/{arch}/gmssl",
+            "command": ["$path", "version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"GmSSL\s*(\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/gmssl",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "obk_ftp",
+            "path": "{tools_path}/obk_ftp/{arch}/FileTransferAgent",
+            "command": ["$path", "--version"],
+            "processes_command": "ps -ef | grep './FileTransferAgent' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"version:\s*(\d{8})", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/obk_ftp",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "zfsdeamon",
+            "path": "{tools_path}/s3-tools/{arch}/zfsdeamon/zfsdeamon",
+            "command": ["$path", "--version"],
+            "processes_command": "ps -ef | grep './zfsdeamon' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/s3-tools/{arch}/zfsdeamon",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "afs-cli",
+            "path": "{tools_path}/s3-tools/{arch}/afs/afs-cli",
+            "command": ["$path", "--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"version\s*(\d+\.\d+\.\d+)", out),
+            "replace_dirs": None,
+        },
+        {
+            "name": "afsd",
+            "path": "{tools_path}/s3-tools/{arch}/afs/afsd",
+            "command": ["$path", "--version", "x"],
+            "processes_command": "ps -ef | grep 'afsd' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"version:\s*(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/s3-tools/{arch}/afs",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "mc",
+            "path": "{tools_path}/s3-tools/{arch}/mc",
+            "command": ["$path", f"--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"version:\s*(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/s3-tools/{arch}/mc",
+                    "path_type": "file",
+                }
+            ],
+        },
+        {
+            "name": "s3fs",
+            "path": "{tools_path}/s3-tools/{arch}/s3fs",
+            "command": ["$path", "--version"],
+            "processes_command": "ps -ef | grep 's3fs' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r".*?V(\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/s3-tools/{arch}/s3fs",
+                    "path_type": "file",
+                }
+            ],
+        },
+        {
+            "name": "s3-tool",
+            "path": "{tools_path}/s3-tools/{arch}/s3-tool/s3-tool",
+            "command": ["$path", "--version"],
+            "processes_command": "ps -ef | grep 's3-tool' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: parse_version(r"(\d+\.\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/s3-tools/{arch}/s3-tool",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "lsof",
+            "path": "{tools_path}/sys/{arch}/lsof",
+            "command": ["$path", "-v"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r".*?revision:\s*(\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/sys",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "rdbcomm",
+            "path": "{tools_path}/rdbcomm/{arch}/rdbcomm",
+            "command": ["$path", "-v"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: out.strip(),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/rdbcomm/{arch}/rdbcomm",
+                    "path_type": "file",
+                }
+            ],
+        },
+        {
+            "name": "rdbcommd",
+            "path": "{tools_path}/rdbcomm/{arch}/rdbcommd",
+            "command": ["$path", "-v"],
+            "processes_command": "ps -ef | grep '/rdbcommd' | grep -v grep",
+            "kill_processes_command": "$processes_command | awk '{print $2}' | xargs kill -9",
+            "parse": lambda out: out.strip(),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/rdbcomm/{arch}/rdbcommd",
+                    "path_type": "file",
+                }
+            ],
+        },
+        {
+            "name": "zfs",
+            "path": "{tools_path}/s3-tools/{arch}/zfs/zfs",
+            "command": ["$path", "--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"-(\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/s3-tools/{arch}/zfs",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "xbsa",
+            "path": "{tools_path}/sys/{arch}/xbsa",
+            "command": None,
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": None,
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/xbsa",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "xtrabackup2.4",
+            "path": "{tools_path}/mysql/xtrabackup/2.4-linux-{arch}/xtrabackup",
+            "command": ["$path", "--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"version\s*?(\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/mysql/xtrabackup/2.4-linux-{arch}",
+                    "path_type": "dir",
+                }
+            ],
+        },
+        {
+            "name": "xtrabackup8.0",
+            "path": "{tools_path}/mysql/xtrabackup/8.0-linux-{arch}/xtrabackup",
+            "command": ["$path", "--version"],
+            "processes_command": None,
+            "kill_processes_command": None,
+            "parse": lambda out: parse_version(r"version\s*?(\d+\.\d+\.\d+)", out),
+            "replace_dirs": [
+                {
+                    "path": "{tools_path}/mysql/xtrabackup/8.0-linux-{arch}",
+                    "path_type": "dir",
+                }
+            ],
+        },
+    ]
 
 
 @dataclass
@@ -399,10 +448,13 @@ class ToolInfo:
     parse: Optional[Callable[[str], str]]
     replace_dirs: Optional[List[dict]]
     tools_path: str
-    arch: str = ARCH
+    arch: str = ""
     kernel_version: str = KERNEL_VERSION
+    cacheable: bool = True
+    reader: Optional[Dict[str, Any]] = None
 
     def __post_init__(self):
+        self.arch = self.arch or get_arch()
         self.path = Path(
             self.path.format(
                 tools_path=self.tools_path,
@@ -439,14 +491,34 @@ class ToolInfo:
 
 
 class ToolCommand:
-    def __init__(self, tool_info: ToolInfo):
+    def __init__(self, tool_info: ToolInfo, probe_cache: Optional[ProbeCache] = None):
         self.tool = tool_info
+        self.probe_cache = probe_cache if tool_info.cacheable else None
 
     def get_version(self) -> Optional[str]:
-        if self.tool.command is None:
+        if self.tool.command is None and self.tool.reader is None:
             return None
         if not self.tool.path.exists():
             return None
+        if self.probe_cache is None:
+            return self._get_version()
+        # 工具文件没有变化时直接使用缓存的版本, 不执行二进制文件
+        rule = get_rule_fingerprint(
+            self.tool.command, self.tool.parse, self.tool.reader
+        )
+        version = self.probe_cache.get(self.tool.path, rule)
+        if version is not None:
+            return version
+        version = self._get_version()
+        if version:
+            self.probe_cache.set(self.tool.path, rule, version)
+        return version
+
+    def _get_version(self) -> Optional[str]:
+        if self.tool.reader is not None:
+            version = read_version(self.tool.reader, self.tool.path, self.tool.parse)
+            if version or self.tool.command is None:
+                return version or None
         work_dir = self.tool.path.parent
         command = Command(self.tool.command, working_dir=work_dir)
         result = command.run(original=True)
@@ -458,9 +530,16 @@ class ToolCommand:
             return None
         return self.tool.parse(result.stdout or result.stderr)
 
-    def is_process_running(self) -> bool:
+    def is_process_running(self, host_facts: Optional[HostFacts] = None) -> bool:
+        """
+        Args:
+            host_facts: 主机信息, 传入时 ps -ef | grep 形式的进程命令直接查找其中的进程, 不执行 ps
+        """
         if self.tool.processes_command is None:
             return False
+        match = PS_GREP_PATTERN.match(self.tool.processes_command)
+        if host_facts is not None and match:
+            return host_facts.is_running(match.group(1))
         command = Command([self.tool.processes_command])
         result = command.run()
         if result.returncode == 0:
@@ -472,8 +551,10 @@ class KernelBuilder:
     def __init__(self, kernel_code_path: Path):
         # 内核代码路径
         self.kernel_code_path = kernel_code_path
-        self.kernel_path = Path(TOOLS_PATH).joinpath(
-            "fs-tools", ARCH, "kernel", KERNEL_VERSION, FS_BACKUP_KERNEL_NAME
+        # 目标端编译的内核模块目录, 按内核版本区分, 更新 fs-tools 时保留
+        self.kernel_dir = Path(TOOLS_PATH).joinpath("fs-tools", get_arch(), "kernel")
+        self.kernel_path = self.kernel_dir.joinpath(
+            KERNEL_VERSION, FS_BACKUP_KERNEL_NAME
         )
         # 安装包中的内核文件路径
         self.package_kernel_path = PROJECT_DIR.joinpath("package", "fsbackup.ko")
@@ -491,6 +572,7 @@ class KernelBuilder:
             if temp_dir and Path(temp_dir).exists():
                 shutil.rmtree(temp_dir, ignore_errors=True)
 
+    @timeline.phase("kernel_build")
     def build_kernel(self) -> bool:
         """
         编译内核
@@ -506,11 +588,12 @@ class KernelBuilder:
         try:
             with self.temporary_build_directory() as temp_path:
                 # 将内核代码复制到临时目录中
+                engine = CopyEngine()
                 for item in self.kernel_code_path.iterdir():
-                    if item.is_dir():
-                        shutil.copytree(item, temp_path.joinpath(item.name))
+                    if item.is_dir() and not item.is_symlink():
+                        engine.copy_tree(item, temp_path.joinpath(item.name))
                     else:
-                        shutil.copy2(item, temp_path)
+                        engine.copy_file(item, temp_path)
                 # 编译内核
                 command = Command(["make"], working_dir=temp_path)
                 result = command.run()
@@ -526,6 +609,7 @@ class KernelBuilder:
             logger.error(error_msg)
             return False
 
+    @timeline.phase("kernel_replace")
     def replace_fsbackup_kernel(self) -> bool:
         """
         替换目标端内核
@@ -550,6 +634,7 @@ class KernelBuilder:
             return True
         return False
 
+    @timeline.phase("kernel_load")
     def install_kernel(self, fsbackup_done_output_dir: str) -> bool:
         """
         安装内核, 传入 fsbackup_done_output_dir 参数
@@ -567,6 +652,16 @@ class KernelBuilder:
             return False
         return True
 
+    def get_planned_fsbackup_done_output_dir(self) -> str:
+        """
+        安装前规划磁盘空间使用, 不询问: 已配置的目录, 否则是已回答的目录或默认目录
+        """
+        return (
+            self.get_current_fsbackup_done_output_dir()
+            or answers.values.get("fsbackup_output_dir")
+            or DEFAULT_FSBACKUP_DONE_OUTPUT_DIR
+        )
+
     def get_current_fsbackup_done_output_dir(self) -> str:
         """
         获取当前 fsbackup 完成后的输出目录
@@ -586,6 +681,10 @@ class KernelBuilder:
         """
         # 内核文件路径, 默认是目标端内核文件路径
         kernel_path = kernel_path or self.kernel_path
+        # 直接读取 .modinfo 节, 失败时再执行 modinfo
+        version = read_version({"type": "modinfo", "field": "version"}, kernel_path)
+        if version:
+            return version
         command = Command(["modinfo", "--field=version", kernel_path.as_posix()])
         result = command.run(original=True)
         if result.returncode != 0:
@@ -628,10 +727,11 @@ class KernelBuilder:
                 logger.warning(
                     f"fsbackup done output dir {current_config_value} is not empty."
                 )
-                clean_dir_input = input(
-                    f"please input y/n to clean fsbackup done output dir {current_config_value} (default: n): "
-                )
-                if "y" in clean_dir_input.lower():
+                if answers.confirm(
+                    "clean_fsbackup_output_dir",
+                    f"please input y/n to clean fsbackup done output dir {current_config_value} (default: n): ",
+                    default=False,
+                ):
                     shutil.rmtree(current_config_value)
                     logger.info(
                         f"clean fsbackup done output dir {current_config_value} success."
@@ -641,18 +741,15 @@ class KernelBuilder:
                     )
                     return current_config_value
         # 如果当前配置为空，则询问配置
-        fsbackup_done_output_dir = Path("/var/fsbackup")
+        fsbackup_done_output_dir = Path(DEFAULT_FSBACKUP_DONE_OUTPUT_DIR)
         while True:
-            input_str = input(
-                "please input the fsbackup done output dir, suggest space in 200GB: (default: /var/fsbackup)"
-            ).strip()
-            if input_str:
-                fsbackup_done_output_dir = Path(input_str)
-            if not fsbackup_done_output_dir.is_absolute():
-                logger.error(
-                    f"fsbackup done output dir {fsbackup_done_output_dir} is not absolute."
+            fsbackup_done_output_dir = Path(
+                answers.ask(
+                    "fsbackup_output_dir",
+                    "please input the fsbackup done output dir, suggest space in 200GB: (default: /var/fsbackup)",
+                    default=DEFAULT_FSBACKUP_DONE_OUTPUT_DIR,
                 )
-                continue
+            )
             # 如果目录不存在，则创建目录
             if not fsbackup_done_output_dir.exists():
                 logger.info(
@@ -663,25 +760,28 @@ class KernelBuilder:
                         parents=True, exist_ok=True, mode=0o755
                     )
                 except Exception:
-                    logger.error(
-                        f"create fsbackup done output dir {fsbackup_done_output_dir} failed."
+                    answers.reject(
+                        "fsbackup_output_dir",
+                        f"create fsbackup done output dir {fsbackup_done_output_dir} failed.",
                     )
                     continue
             # 如果目录存在，则检查目录是否为空
             else:
                 if not fsbackup_done_output_dir.is_dir():
-                    logger.warning(
-                        f"fsbackup done output dir {fsbackup_done_output_dir} is not a directory."
+                    answers.reject(
+                        "fsbackup_output_dir",
+                        f"fsbackup done output dir {fsbackup_done_output_dir} is not a directory.",
                     )
                     continue
                 if not self._is_dir_empty_pathlib(fsbackup_done_output_dir):
                     logger.warning(
                         f"fsbackup done output dir {fsbackup_done_output_dir} is not empty."
                     )
-                    clean_dir_input = input(
-                        f"please input y/n to clean fsbackup done output dir {fsbackup_done_output_dir} (default: n): "
-                    )
-                    if "y" in clean_dir_input.lower():
+                    if answers.confirm(
+                        "clean_fsbackup_output_dir",
+                        f"please input y/n to clean fsbackup done output dir {fsbackup_done_output_dir} (default: n): ",
+                        default=False,
+                    ):
                         shutil.rmtree(fsbackup_done_output_dir)
                         fsbackup_done_output_dir.mkdir(
                             parents=True, exist_ok=True, mode=0o755
@@ -745,6 +845,8 @@ class KernelBuilder:
         # 比较版本，如果目标端内核版本大于等于安装包内核版本，则跳过更新
         target_kernel_version = self.get_kernel_version()
         package_kernel_version = self.get_kernel_version(self.package_kernel_path)
+        from packaging.version import parse as parseVersion
+
         if parseVersion(target_kernel_version) >= parseVersion(package_kernel_version):
             logger.info(
                 f"target fsbackup kernel version is {target_kernel_version}, greater than or equal to package fsbackup kernel version, skip update"
@@ -778,6 +880,17 @@ class ToolsHandler:
         self.kernel_build = KernelBuilder(
             PROJECT_DIR.joinpath("package", "fsbackup_kernel_4.x")
         )
+        # 目标端工具版本探测缓存
+        self.probe_cache = ProbeCache()
+        # 目标端内容寻址存储, 保存安装过的工具版本, 用于回滚
+        self.store = ArtifactStore()
+        # 打包时生成的工具清单, 旧版安装包中不存在
+        self.package_tools_path = package_tools_path
+        self.manifest: Optional[PackageManifest] = None
+        if package_tools_path is not None:
+            self.manifest = PackageManifest.load(
+                PROJECT_DIR.joinpath(PackageFilenameEnum.MANIFEST.value)
+            )
 
     def _init_tools(
         self, package_tools_path: Optional[Path] = None
@@ -787,7 +900,7 @@ class ToolsHandler:
         )
         result = []
         tools_map = dict()
-        for tool in TOOLS:
+        for tool in get_tools():
             tool_info = ToolInfo(tools_path=tools_path.as_posix(), **tool)
             result.append(tool_info)
             tools_map[tool_info.name] = tool_info
@@ -798,6 +911,7 @@ class ToolsHandler:
         tools: List[ToolInfo],
         include_tools: List[str] = [],
         exclude_tools: List[str] = [],
+        probe_cache: Optional[ProbeCache] = None,
     ) -> Dict[str, str]:
         """
         获取工具版本信息
@@ -805,6 +919,7 @@ class ToolsHandler:
             tools: 工具列表
             include_tools: 包含的工具列表
             exclude_tools: 排除的工具列表
+            probe_cache: 版本探测缓存, 为空时每次都执行工具二进制文件
         Returns:
             dict: 工具版本信息
         """
@@ -814,9 +929,12 @@ class ToolsHandler:
                 continue
             if include_tools and tool.name not in include_tools:
                 continue
-            tool_command = ToolCommand(tool)
-            version = tool_command.get_version()
+            tool_command = ToolCommand(tool, probe_cache)
+            with timeline.span("version_probe", tool=tool.name):
+                version = tool_command.get_version()
             result[tool.name] = version or ""
+        if probe_cache is not None:
+            probe_cache.save()
         return result
 
     def _get_tools_version_by_file(self, file_path: Path) -> Dict[str, str]:
@@ -861,6 +979,9 @@ class ToolsHandler:
         """
         table_data = []
         flag = False
+        # 每次检查都重新读取进程列表（安装后服务会启动）, 所有工具共用, 不再逐个执行 ps
+        host_facts = get_host_facts()
+        host_facts.refresh("processes")
         for tool in self.tools:
             tool_command = ToolCommand(tool)
             if (
@@ -869,13 +990,15 @@ class ToolsHandler:
             ):
                 continue
 
-            if tool_command.is_process_running():
+            if tool_command.is_process_running(host_facts):
                 flag = flag or True
                 status = f"{COLORS['DEBUG']}running{COLORS['RESET']}"
             else:
                 status = f"{COLORS['ERROR']}inactive{COLORS['RESET']}"
             table_data.append([tool.name, status])
         if flag:
+            from tabulate import tabulate
+
             table = tabulate(
                 table_data, headers=["service", "status"], tablefmt="pretty"
             )
@@ -907,19 +1030,32 @@ class ToolsHandler:
         """
         获取目标端工具版本信息
         """
-        return self._get_tools_version(self.tools, include_tools, exclude_tools)
+        return self._get_tools_version(
+            self.tools, include_tools, exclude_tools, self.probe_cache
+        )
 
-    def print_tools_version(self) -> None:
+    def print_tools_version(
+        self, tools_version: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
         """
         打印工具版本信息
+        Args:
+            tools_version: 已探测到的工具版本信息, 为空时探测目标端工具版本
+        Returns:
+            dict: 工具版本信息
         """
+        if tools_version is None:
+            tools_version = self.get_tools_version()
         table_data = []
-        for tool_name, tool_version in self.get_tools_version().items():
+        for tool_name, tool_version in tools_version.items():
             if not tool_version:
                 continue
             table_data.append([tool_name, tool_version])
+        from tabulate import tabulate
+
         table = tabulate(table_data, headers=["tool", "version"], tablefmt="pretty")
         logger.info(f"tools version:\n{table}")
+        return tools_version
 
     def compare_tools_version(
         self, only_need_update: bool = False
@@ -928,12 +1064,16 @@ class ToolsHandler:
         比较目标端工具版本信息
         """
         result: Dict[str, Dict[str, object]] = dict()
-        # 安装包中工具版本信息
+        # 安装包中工具版本信息, manifest 中的版本优先于 version.txt
         package_tools_version = self._get_tools_version_by_file(
             PROJECT_DIR.joinpath(PackageFilenameEnum.TOOLS_VERSION.value)
         )
+        if self.manifest is not None:
+            package_tools_version.update(self.manifest.get_versions(get_arch()))
         # 目标端工具版本信息
-        target_tools_version = self._get_tools_version(self.tools)
+        target_tools_version = self._get_tools_version(
+            self.tools, probe_cache=self.probe_cache
+        )
         # 比较工具版本信息
         for tool_name, _target_version in target_tools_version.items():
             _package_version = package_tools_version.get(tool_name, "")
@@ -942,13 +1082,9 @@ class ToolsHandler:
                 "package_version": _package_version,
                 "is_need_update": False,
             }
-            if not _target_version:
-                _info["is_need_update"] = True
-            else:
-                target_version = parseVersion(_target_version)
-                package_version = parseVersion(_package_version)
-                if target_version > package_version:
-                    _info["is_need_update"] = True
+            _info["is_need_update"] = is_newer_version(
+                _package_version, _target_version
+            )
             result[tool_name] = _info
         if only_need_update:
             result = {k: v for k, v in result.items() if v["is_need_update"]}
@@ -1046,32 +1182,269 @@ class ToolsHandler:
         Returns:
             bool: 是否成功
         """
-        if src.is_file():
-            # 确保目标目录存在
-            if dst.is_dir():
-                # dst 是目录 -> 复制到该目录下
-                shutil.copy2(src, dst)
-            else:
-                # dst 是文件路径 -> 创建父目录
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src, dst)
-        else:
-            # 目标目录已存在时，手动删除再复制
-            if dst.exists():
-                shutil.rmtree(dst, ignore_errors=True)
-            shutil.copytree(src, dst)
+        stats = copy_anything(src, dst)
+        logger.debug(
+            f"copied {stats.files} files, {stats.symlinks} symlinks, "
+            f"{stats.bytes} bytes: {stats.methods}"
+        )
+        metrics.add_bytes("copied", stats.bytes)
+        # 工具文件已被替换, 删除对应的版本缓存
+        self.probe_cache.invalidate(dst)
+        self.probe_cache.save()
+
+    def _get_free_bytes(self, path: Path) -> int:
+        # 目标目录可能还不存在, 使用最近的已存在的上级目录
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return shutil.disk_usage(path.as_posix()).free
+
+    def check_disk_space(self, package_dirs: List[str]) -> bool:
+        """
+        根据 manifest 检查目标端磁盘空间是否足够, 没有 manifest 时跳过
+        Args:
+            package_dirs: 需要复制的安装包中的文件或目录
+        """
+        if self.manifest is None or self.package_tools_path is None:
+            return True
+        relative_dirs = [
+            Path(item).relative_to(self.package_tools_path).as_posix()
+            for item in package_dirs
+        ]
+        required_bytes = self.manifest.get_bytes(relative_dirs)
+        free_bytes = self._get_free_bytes(Path(TOOLS_PATH))
+        if required_bytes > free_bytes:
+            logger.error(
+                f"Not enough disk space in {TOOLS_PATH}: "
+                f"required {required_bytes} bytes, free {free_bytes} bytes"
+            )
+            return False
+        return True
+
+    def verify_copy(
+        self, package_dir: Path, preserve: Optional[List[Path]] = None
+    ) -> bool:
+        """
+        根据 manifest 校验复制到目标端的文件, 没有 manifest 时跳过
+        Args:
+            preserve: 保留了目标端内容的路径, 不校验
+        """
+        if self.manifest is None or self.package_tools_path is None:
+            return True
+        relative_dir = package_dir.relative_to(self.package_tools_path).as_posix()
+        mismatched = [
+            item
+            for item in self.manifest.verify(relative_dir, Path(TOOLS_PATH))
+            if not any(_is_within(Path(item), path) for path in preserve or [])
+        ]
+        if mismatched:
+            logger.error(
+                f"{len(mismatched)} copied files do not match the manifest: "
+                + ", ".join(mismatched[:10])
+            )
+            return False
+        return True
+
+    def plan_copies(self, tool_names: List[str]) -> List[CopyOperation]:
+        """
+        生成复制计划, 共享或嵌套的目录只复制一次
+        """
+        planner = CopyPlanner(
+            self.package_tools,
+            self.package_tools_path or Path(self.package_tools[0].tools_path),
+            Path(TOOLS_PATH),
+            self.manifest,
+            preserve_paths=[self.kernel_build.kernel_dir],
+        )
+        plan = planner.plan(tool_names)
+        logger.info(f"copy plan:\n{CopyPlanner.format_plan(plan)}")
+        return plan
+
+    def get_install_plan(self) -> List[CopyOperation]:
+        """
+        首次安装: 复制所有工具
+        """
+        return self.plan_copies([tool.name for tool in self.package_tools])
+
+    def get_update_plan(self) -> List[CopyOperation]:
+        """
+        升级: 只复制需要更新的工具, 内核由 KernelBuilder 编译更新, 不参与复制
+        """
+        need_update_tools = self.compare_tools_version(only_need_update=True)
+        need_update_tools.pop("kernel", None)
+        if not need_update_tools:
+            return []
+        return self.plan_copies(list(need_update_tools))
+
+    def stage_package(
+        self, tar_path: Path, scratch_dir: Path, plan: List[CopyOperation]
+    ) -> bool:
+        """
+        解压安装包: 复制计划中的工具直接解压到目标路径旁的暂存路径, 其余文件解压到 scratch_dir
+        执行复制计划时只需要 rename, 不需要再复制一次
+        """
+        if not self.check_disk_space([operation.src.as_posix() for operation in plan]):
+            return False
+        routes = []
+        for operation in plan:
+            operation.staged = get_staging_path(operation.dst)
+            routes.append(
+                StageRoute(
+                    operation.src.relative_to(self.package_tools_path).as_posix(),
+                    operation.staged,
+                    operation.path_type,
+                )
+            )
+        try:
+            StagedExtractor(tar_path, scratch_dir, routes).extract()
+        except (OSError, tarfile.TarError) as e:
+            logger.error(f"Failed to extract {tar_path}: {e}")
+            for operation in plan:
+                remove_path(operation.staged)
+                operation.staged = None
+            return False
+        return True
+
+    def _carry_over(self, operation: CopyOperation, new_root: Path) -> None:
+        """
+        把 dst 中需要保留的目标端内容移到新目录中的相同位置, 新旧目录在同一文件系统, 只需要 rename
+        """
+        for path in operation.preserve:
+            if not (path.exists() or path.is_symlink()):
+                continue
+            moved = new_root.joinpath(path.relative_to(operation.dst))
+            logger.info(f"keep {path} built on this host")
+            remove_path(moved)
+            moved.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path.as_posix(), moved.as_posix())
+
+    def _apply_operation(self, operation: CopyOperation) -> bool:
+        if operation.staged is not None:
+            if not (operation.staged.exists() or operation.staged.is_symlink()):
+                logger.warning(f"{operation.src} not found in package, skip")
+                return True
+            logger.info(
+                f"move {', '.join(operation.tools)}: {operation.staged} -> {operation.dst}"
+            )
+            self._carry_over(operation, operation.staged)
+            swap_into_place(operation.staged, operation.dst)
+            self.probe_cache.invalidate(operation.dst)
+            self.probe_cache.save()
+            return True
+        if not operation.src.exists():
+            logger.warning(f"{operation.src} not found in package, skip")
+            return True
+        logger.info(
+            f"copy {', '.join(operation.tools)}: {operation.src} -> {operation.dst}"
+        )
+        if not operation.preserve:
+            self._copy_anything(operation.src, operation.dst)
+            return True
+        # 先复制到暂存路径, 移入需要保留的内容后再替换目标目录
+        staging_path = get_staging_path(operation.dst)
+        remove_path(staging_path)
+        self._copy_anything(operation.src, staging_path)
+        self._carry_over(operation, staging_path)
+        swap_into_place(staging_path, operation.dst)
+        self.probe_cache.invalidate(operation.dst)
+        self.probe_cache.save()
+        return True
+
+    def _store_current(self, path: Path, tools: List[str]) -> None:
+        """
+        替换前将目标端当前版本入库, 上次安装时已入库的跳过
+        """
+        if not self.store.enabled or path.as_posix() in self.store.refs:
+            return
+        if not (path.exists() or path.is_symlink()):
+            return
+        try:
+            with timeline.span("store_ingest", tools=tools):
+                self.store.ingest(path, self.get_tools_version(include_tools=tools))
+        except OSError as e:
+            logger.warning(f"Failed to save {path} to store: {e}")
+
+    def _store_installed(
+        self, path: Path, tools: List[str], hashes: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        安装后将新版本入库, 存储出错不影响安装
+        Args:
+            hashes: 已校验过的文件 sha256（相对于 path）
+        """
+        if not self.store.enabled:
+            return
+        versions = dict()
+        if self.manifest is not None:
+            versions = {
+                name: version
+                for name, version in self.manifest.get_versions(get_arch()).items()
+                if name in tools
+            }
+        package_name = get_host_facts().package_config.get("package_name", "")
+        try:
+            with timeline.span("store_ingest", tools=tools):
+                self.store.ingest(path, versions, package_name, hashes)
+        except OSError as e:
+            logger.warning(f"Failed to save {path} to store: {e}")
+
+    def _get_manifest_hashes(self, relative_path: str) -> Dict[str, str]:
+        """
+        manifest 中 relative_path 下的文件 sha256, key 相对于 relative_path
+        """
+        if self.manifest is None:
+            return dict()
+        return {
+            name[len(relative_path) :].lstrip("/") or ".": digest
+            for name, (size, digest) in self.manifest.iter_files_under(relative_path)
+            if size >= 0
+        }
+
+    def execute_plan(self, plan: List[CopyOperation]) -> bool:
+        """
+        执行复制计划, 已解压到暂存路径的直接 rename 到目标路径
+        """
+        copy_sources = [
+            operation.src.as_posix() for operation in plan if operation.staged is None
+        ]
+        if not self.check_disk_space(copy_sources):
+            return False
+        result = True
+        for operation in plan:
+            self._store_current(operation.dst, operation.tools)
+            with timeline.span(
+                "tool_copy", tools=operation.tools, bytes=operation.bytes
+            ):
+                self._apply_operation(operation)
+            if not self.verify_copy(operation.src, operation.preserve):
+                result = False
+                continue
+            hashes = None
+            if self.manifest is not None:
+                hashes = self._get_manifest_hashes(
+                    operation.src.relative_to(self.package_tools_path).as_posix()
+                )
+                # 保留的目标端内容与安装包不同, 入库时重新计算哈希
+                hashes = {
+                    name: digest
+                    for name, digest in hashes.items()
+                    if not any(
+                        _is_within(operation.dst.joinpath(name), path)
+                        for path in operation.preserve
+                    )
+                }
+            self._store_installed(operation.dst, operation.tools, hashes)
+        return result
 
-    def install_tools(self) -> bool:
+    def install_tools(self, plan: Optional[List[CopyOperation]] = None) -> bool:
         """
         首次安装工具
+        Args:
+            plan: 已生成（并已解压到暂存路径）的复制计划, 为空时重新生成
         """
-        for tool_name, tool_info in self.package_tools_map.items():
-            package_dirs_info = tool_info.get_replace_dirs
-            for _, package_dir_info in enumerate(package_dirs_info):
-                package_dir = package_dir_info["path"]
-                target_dir = package_dir.replace(tool_info.tools_path, TOOLS_PATH)
-                logger.info(f"install tool {tool_name}: {package_dir} -> {target_dir}")
-                self._copy_anything(Path(package_dir), Path(target_dir))
+        if plan is None:
+            plan = self.get_install_plan()
+        if not self.execute_plan(plan):
+            return False
         self._set_aio_speedd()
         self._set_rdbcommd()
         # 编译内核
@@ -1086,34 +1459,156 @@ class ToolsHandler:
         Returns:
             bool: 是否成功
         """
-        build_kernel_input = input("please input y/n to build fsbackup kernel: ")
-        build_kernel_input = build_kernel_input.strip() or "y"
-        if "y" not in build_kernel_input.lower():
+        if not answers.confirm(
+            "build_kernel", "please input y/n to build fsbackup kernel: ", default=True
+        ):
             return False
         self.kernel_build.install_fsbackup_kernel()
+        self.probe_cache.invalidate(self.kernel_build.kernel_path)
+        self.probe_cache.save()
         self._start_aio_speedd()
         return True
 
-    def update_tools(self) -> bool:
+    def update_tools(self, plan: Optional[List[CopyOperation]] = None) -> bool:
         """
         更新工具
+        Args:
+            plan: 已生成（并已解压到暂存路径）的复制计划, 为空时重新生成
         """
-        need_update_tools = self.compare_tools_version(only_need_update=True)
-        if not need_update_tools:
+        if plan is None:
+            plan = self.get_update_plan()
+        if not plan:
             logger.info("no tools need to update")
             return True
-        for tool_name, _ in need_update_tools.items():
-            tool_info = self.tools_map[tool_name]
-            target_dirs_info = tool_info.get_replace_dirs
-            for index, target_dir_info in enumerate(target_dirs_info):
-                package_tool_info = self.package_tools_map[tool_name]
-                package_dir = package_tool_info.get_replace_dirs[index]["path"]
-                target_dir = target_dir_info["path"]
-                logger.info(f"update tool {tool_name}: {package_dir} -> {target_dir}")
-                self._copy_anything(Path(package_dir), Path(target_dir))
-        if need_update_tools.get("aio-speedd", {}).get("is_need_update", False):
+        if not self.execute_plan(plan):
+            return False
+        if any("aio-speedd" in operation.tools for operation in plan):
+            self._set_aio_speedd()
+
+        if self.kernel_build.update_fsbackup_kernel():
+            self.probe_cache.invalidate(self.kernel_build.kernel_path)
+            self.probe_cache.save()
+        self._start_aio_speedd()
+        return True
+
+    def apply_delta(self, delta: DeltaPackage) -> bool:
+        """
+        增量包更新: 只写入变化的文件, 不比较工具版本, 不复制整个工具目录
+        安装包中的内核源码是完整的, 内核仍按版本比较后编译更新
+        """
+        entries = delta.get_tool_entries(get_arch())
+        # 变化的文件所在的工具目录, 更新前后分别入库
+        tool_dirs: Dict[str, List[str]] = dict()
+        if self.manifest is not None:
+            for name, info in self.manifest.get_tools(get_arch()).items():
+                for item in info.get("dirs") or [info["path"]]:
+                    if any(
+                        relative == item or relative.startswith(item + "/")
+                        for relative in entries
+                    ):
+                        tool_dirs.setdefault(item, []).append(name)
+        for item, tools in tool_dirs.items():
+            self._store_current(Path(TOOLS_PATH).joinpath(item), tools)
+        try:
+            changed = delta.apply(
+                self.package_tools_path.parent, Path(TOOLS_PATH), get_arch()
+            )
+        except (OSError, DeltaError) as e:
+            logger.error(f"Failed to apply delta: {e}")
+            return False
+        for item, tools in tool_dirs.items():
+            # 增量包写入的文件已校验过 sha256, 其余文件沿用上一个版本的记录
+            hashes = {
+                relative[len(item) :].lstrip("/") or ".": entry["sha256"]
+                for relative, entry in entries.items()
+                if "sha256" in entry
+                and (relative == item or relative.startswith(item + "/"))
+            }
+            self._store_installed(Path(TOOLS_PATH).joinpath(item), tools, hashes)
+        for path in changed:
+            self.probe_cache.invalidate(path)
+        self.probe_cache.save()
+        speedd_dir = self.tools_map["aio-speedd"].path.parent
+        if any(_is_within(path, speedd_dir) for path in changed):
             self._set_aio_speedd()
 
-        self.kernel_build.update_fsbackup_kernel()
+        if self.kernel_build.update_fsbackup_kernel():
+            self.probe_cache.invalidate(self.kernel_build.kernel_path)
+            self.probe_cache.save()
         self._start_aio_speedd()
         return True
+
+    def rollback_tool(self, tool_name: str, version: str = "") -> bool:
+        """
+        从存储中将工具所在目录切换到之前的版本, 只需要硬链接和 rename, 不需要安装包
+        Args:
+            tool_name: 工具名称
+            version: 工具版本, 为空时回滚到上一个版本
+        """
+        tool = self.tools_map.get(tool_name)
+        if tool is None:
+            logger.error(f"Unknown tool: {tool_name}")
+            return False
+        snapshots = [
+            snapshot
+            for snapshot in self.store.list_snapshots()
+            if _is_within(tool.path, Path(snapshot["path"]))
+        ]
+        if version:
+            snapshots = [
+                snapshot
+                for snapshot in snapshots
+                if snapshot["tools"].get(tool_name) == version
+            ]
+        else:
+            current = set(self.store.refs.values())
+            snapshots = [
+                snapshot for snapshot in snapshots if snapshot["id"] not in current
+            ]
+        if not snapshots:
+            logger.error(
+                f"No {tool_name} {version or 'previous version'} found in the store"
+            )
+            return False
+        snapshot = snapshots[0]
+        with timeline.span("store_checkout", tools=list(snapshot["tools"])):
+            if not self.store.checkout(snapshot["id"]):
+                return False
+        self.probe_cache.invalidate(Path(snapshot["path"]))
+        self.probe_cache.save()
+        if _is_within(self.tools_map["aio-speedd"].path, Path(snapshot["path"])):
+            self._set_aio_speedd()
+            self._start_aio_speedd()
+        return True
+
+    def print_store(self) -> None:
+        """
+        打印存储中的工具版本
+        """
+        current = set(self.store.refs.values())
+        table_data = []
+        for snapshot in self.store.list_snapshots():
+            table_data.append(
+                [
+                    snapshot["id"],
+                    "*" if snapshot["id"] in current else "",
+                    Path(snapshot["path"]).relative_to(TOOLS_PATH).as_posix()
+                    if _is_within(Path(snapshot["path"]), Path(TOOLS_PATH))
+                    else snapshot["path"],
+                    ", ".join(
+                        f"{name} {version}"
+                        for name, version in snapshot["tools"].items()
+                    ),
+                    snapshot["package"],
+                    snapshot["last_used"][:19],
+                ]
+            )
+        from tabulate import tabulate
+
+        table = tabulate(
+            table_data,
+            headers=["id", "current", "path", "tools", "package", "last used"],
+            tablefmt="pretty",
+        )
+        usage = self.store.get_usage() / 1024 / 1024
+        logger.info(f"store {self.store.root} ({usage:.1f}M):\n{table}")
@@ -0,0 +1,209 @@
+import argparse
+import ipaddress
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.log_base import logger
+
+TRUE_VALUES = {"y", "yes", "true", "1"}
+FALSE_VALUES = {"n", "no", "false", "0"}
+
+
+class AnswerError(ValueError):
+    pass
+
+
+def _validate_server_ip(value: str) -> str:
+    try:
+        ipaddress.IPv4Address(value)
+    except ipaddress.AddressValueError:
+        raise AnswerError(f"Invalid ip: {value}")
+    if value == "127.0.0.1":
+        raise AnswerError(f"Invalid ip: {value}")
+    return value
+
+
+def _validate_bool(value: str) -> str:
+    if value.lower() in TRUE_VALUES:
+        return "y"
+    if value.lower() in FALSE_VALUES:
+        return "n"
+    raise AnswerError(f"Invalid answer: {value}, expected y/n")
+
+
+def _validate_absolute_path(value: str) -> str:
+    path = Path(value)
+    if not path.is_absolute():
+        raise AnswerError(f"{value} is not absolute.")
+    if path.exists() and not path.is_dir():
+        raise AnswerError(f"{value} is not a directory.")
+    return value
+
+
+@dataclass
+class Question:
+    key: str
+    description: str
+    validate: Callable[[str], str]
+
+
+# 安装过程中所有需要回答的问题
+QUESTIONS = {
+    question.key: question
+    for question in [
+        Question("server_ip", "rdb server ipv4 address", _validate_server_ip),
+        Question(
+            "role_separation", "enable three-role separation (y/n)", _validate_bool
+        ),
+        Question("build_kernel", "build the fsbackup kernel (y/n)", _validate_bool),
+        Question(
+            "fsbackup_output_dir",
+            "fsbackup done output dir (absolute path)",
+            _validate_absolute_path,
+        ),
+        Question(
+            "clean_fsbackup_output_dir",
+            "clean the fsbackup done output dir when not empty (y/n)",
+            _validate_bool,
+        ),
+    ]
+}
+
+
+class Answers:
+    """
+    安装过程中交互式问题的答案, 来自答案文件（json）和 --answer key=value, 命令行参数优先
+    - 已提供答案的问题不再询问
+    - 没有提供答案时询问; 非交互模式（--non-interactive 或 AIO_NON_INTERACTIVE=1）时使用默认值,
+      没有默认值的问题（例如 server_ip）在安装前检查中失败, 不会在安装到一半时卡在终端上
+    进程内共用一个实例, 由入口脚本配置
+    """
+
+    def __init__(self):
+        self.values: Dict[str, str] = dict()
+        self.interactive = os.getenv("AIO_NON_INTERACTIVE", "0") != "1"
+
+    def configure(
+        self,
+        answer_file: Optional[str] = None,
+        overrides: Optional[List[str]] = None,
+        non_interactive: bool = False,
+    ) -> None:
+        """
+        Args:
+            answer_file: 答案文件, 例如 {"server_ip": "192.168.1.100", "build_kernel": "y"}
+            overrides: 命令行参数 key=value
+            non_interactive: 是否非交互模式
+        Raises:
+            AnswerError: 答案文件格式错误、未知的问题、答案不合法
+        """
+        raw: Dict[str, Any] = dict()
+        if answer_file:
+            try:
+                raw.update(json.loads(Path(answer_file).read_text(encoding="utf-8")))
+            except (OSError, ValueError) as e:
+                raise AnswerError(f"Failed to load answer file {answer_file}: {e}")
+        for item in overrides or []:
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise AnswerError(f"Invalid answer: {item}, expected key=value")
+            raw[key.strip()] = value.strip()
+        for key, value in raw.items():
+            if key not in QUESTIONS:
+                raise AnswerError(
+                    f"Unknown question: {key}, expected one of {', '.join(QUESTIONS)}"
+                )
+            if isinstance(value, bool):
+                value = "y" if value else "n"
+            self.values[key] = QUESTIONS[key].validate(str(value).strip())
+        if non_interactive:
+            self.interactive = False
+
+    def configure_from_args(self, args: argparse.Namespace) -> None:
+        self.configure(args.answer_file, args.answer, args.non_interactive)
+
+    def _fallback(self, key: str, default: Optional[str]) -> str:
+        if default is None:
+            raise AnswerError(
+                f"No answer for {key} ({QUESTIONS[key].description}), "
+                f"pass --answer {key}=... or add it to the answer file"
+            )
+        logger.info(f"{key} is not answered, use default: {default}")
+        return default
+
+    def ask(self, key: str, prompt: str, default: Optional[str] = None) -> str:
+        """
+        获取答案, 交互模式下输入不合法时重新询问, 直接回车时使用默认值
+        Raises:
+            AnswerError: 非交互模式（或标准输入已关闭）且没有答案和默认值
+        """
+        if key in self.values:
+            logger.info(f"{key}: {self.values[key]} (answered)")
+            return self.values[key]
+        if not self.interactive:
+            return self._fallback(key, default)
+        while True:
+            try:
+                value = input(prompt).strip()
+            except EOFError:
+                return self._fallback(key, default)
+            if not value and default is not None:
+                return default
+            try:
+                return QUESTIONS[key].validate(value)
+            except AnswerError as e:
+                logger.error(str(e))
+
+    def confirm(self, key: str, prompt: str, default: bool) -> bool:
+        return self.ask(key, prompt, "y" if default else "n") == "y"
+
+    def reject(self, key: str, message: str) -> None:
+        """
+        答案在使用时才发现不可用（例如创建目录失败）: 交互模式下输出错误, 由调用方重新询问;
+        答案来自答案文件或非交互模式时抛出异常, 避免一直重试
+        """
+        if key in self.values or not self.interactive:
+            raise AnswerError(f"{key}: {message}")
+        logger.error(message)
+
+    def check(self, required: List[str]) -> bool:
+        """
+        安装前检查: 非交互模式下没有默认值的问题必须已提供答案
+        答案的格式在 configure 中已校验
+        """
+        if self.interactive:
+            return True
+        missing = [key for key in required if key not in self.values]
+        if missing:
+            logger.error(
+                f"Non-interactive install needs answers for: {', '.join(missing)}"
+            )
+            return False
+        return True
+
+
+def add_answer_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--answer-file",
+        default=None,
+        help="json file with answers to the install questions: " + ", ".join(QUESTIONS),
+    )
+    parser.add_argument(
+        "--answer",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="answer one install question, overrides the answer file",
+    )
+    parser.add_argument(
+        "--non-interactive",
+        action="store_true",
+        help="never prompt, use the defaults for unanswered questions "
+        "and fail the preflight if a required answer is missing",
+    )
+
+
+answers = Answers()
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import os
+import stat
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from constants import STORE_DIR, STORE_MAX_BYTES
+from utils.copy_engine import CopyEngine
+from utils.log_base import logger
+from utils.manifest import hash_file, iter_files
+from utils.staging import get_staging_path, remove_path, swap_into_place
+
+# 存储格式版本, 不兼容的变化时加一
+STORE_SCHEMA_VERSION = 1
+# 最近使用时间精确到微秒, 同一秒内入库的多个版本也能按顺序淘汰
+LAST_USED_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+class ArtifactStore:
+    """
+    目标端内容寻址存储, 保存安装过的每个版本的工具目录, 用于回滚和去重
+        /opt/aio/store/
+            blobs/ab/abcdef...    文件内容, 以 sha256 命名, 只读
+            blobs.json            每个 blob 入库时的 [size, mtime_ns], 判断 blob 是否被修改
+            snapshots/<id>.json   一个工具目录的一个版本: 文件 -> sha256、权限、属主, 以内容哈希为 id
+            refs.json             {工具目录: 当前版本的 snapshot id}
+    - 入库: 工具目录中的文件复制到 blobs（支持 reflink 的文件系统只复制元数据）, 工具目录中的文件不变,
+      与存储不共用 inode, 工具原地修改文件不会影响存储中的版本; 相同内容的 blob 只保存一份;
+      空文件（pid、锁文件等）不入库, 只记录权限
+    - 回滚: 按 snapshot 从 blobs 复制到暂存目录, 再 rename 替换工具目录
+    - 淘汰: blob 总大小超过 AIO_STORE_MAX_GB 时, 按最近使用时间淘汰旧版本
+    AIO_STORE=0 时关闭
+    """
+
+    def __init__(self, store_dir: str = STORE_DIR, max_bytes: int = STORE_MAX_BYTES):
+        self.root = Path(store_dir)
+        self.max_bytes = max_bytes
+        self.enabled = os.getenv("AIO_STORE", "1") != "0"
+        self.blobs_dir = self.root.joinpath("blobs")
+        self.snapshots_dir = self.root.joinpath("snapshots")
+        self._blobs: Optional[Dict[str, List[int]]] = None
+        self._refs: Optional[Dict[str, str]] = None
+        self._engine = CopyEngine(workers=1)
+
+    def _read_json(self, path: Path, default: Any) -> Any:
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return default
+        if data.get("schema") != STORE_SCHEMA_VERSION:
+            return default
+        return data
+
+    def _write_json(self, path: Path, data: Dict[str, Any]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(
+            json.dumps(dict(data, schema=STORE_SCHEMA_VERSION), indent=2),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path.as_posix(), path.as_posix())
+
+    @property
+    def blobs(self) -> Dict[str, List[int]]:
+        if self._blobs is None:
+            data = self._read_json(self.root.joinpath("blobs.json"), {})
+            self._blobs = data.get("blobs", {})
+        return self._blobs
+
+    @property
+    def refs(self) -> Dict[str, str]:
+        if self._refs is None:
+            data = self._read_json(self.root.joinpath("refs.json"), {})
+            self._refs = data.get("refs", {})
+        return self._refs
+
+    def _save_index(self) -> None:
+        self._write_json(self.root.joinpath("blobs.json"), {"blobs": self.blobs})
+        self._write_json(self.root.joinpath("refs.json"), {"refs": self.refs})
+
+    def get_blob_path(self, digest: str) -> Path:
+        return self.blobs_dir.joinpath(digest[:2], digest)
+
+    def _copy_blob(self, src: Path, blob_path: Path) -> None:
+        """
+        复制到暂存路径后 rename, 不会留下写了一半的 blob
+        """
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = get_staging_path(blob_path)
+        remove_path(tmp_path)
+        self._engine.copy_file(src, tmp_path)
+        os.chmod(tmp_path.as_posix(), 0o444)
+        os.replace(tmp_path.as_posix(), blob_path.as_posix())
+
+    def _check_blob(self, digest: str) -> bool:
+        """
+        size、mtime 与入库时一致时认为未修改, 否则重新计算 sha256, 不一致时删除
+        旧版本存储中的 blob 与工具目录中的文件是硬链接, 内容一致时改为独立的副本
+        """
+        path = self.get_blob_path(digest)
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        if st.st_nlink == 1 and self.blobs.get(digest) == [st.st_size, st.st_mtime_ns]:
+            return True
+        if hash_file(path) != digest:
+            logger.warning(f"store blob {digest} was modified, drop it")
+            path.unlink()
+            self.blobs.pop(digest, None)
+            return False
+        if st.st_nlink > 1:
+            self._copy_blob(path, path)
+            st = path.stat()
+        self.blobs[digest] = [st.st_size, st.st_mtime_ns]
+        return True
+
+    def _add_blob(self, path: Path, digest: str) -> None:
+        if self._check_blob(digest):
+            return
+        blob_path = self.get_blob_path(digest)
+        self._copy_blob(path, blob_path)
+        st = blob_path.stat()
+        self.blobs[digest] = [st.st_size, st.st_mtime_ns]
+
+    @staticmethod
+    def _get_known_digest(
+        st: os.stat_result,
+        entry: Optional[Dict[str, Any]],
+        known: Optional[List[int]],
+    ) -> Optional[str]:
+        """
+        文件的 inode、大小、修改时间与上次入库时一致时, 直接使用记录的 sha256, 不再读取
+        """
+        if not entry or "sha256" not in entry or not known:
+            return None
+        if known != [st.st_ino, st.st_size, st.st_mtime_ns]:
+            return None
+        return entry["sha256"]
+
+    def ingest(
+        self,
+        path: Path,
+        tools: Optional[Dict[str, str]] = None,
+        package: str = "",
+        hashes: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        """
+        将工具目录（或文件）入库, 作为该路径的当前版本
+        Args:
+            path: 目标端工具目录
+            tools: 目录中的工具版本, 回滚时按版本选择
+            package: 安装包名
+            hashes: 已知的文件 sha256（相对于 path）, 例如已按 manifest 校验过的文件, 不再读取
+        Returns:
+            str: snapshot id, 关闭或路径不存在时返回 None
+        """
+        if not self.enabled or not (path.exists() or path.is_symlink()):
+            return None
+        hashes = hashes or dict()
+        current = self.load_snapshot(self.refs.get(path.as_posix(), "")) or dict()
+        current_files = current.get("files", dict())
+        current_stats = current.get("stats", dict())
+        files: Dict[str, Dict[str, Any]] = dict()
+        # 文件的 [inode, size, mtime_ns], 下次入库时判断文件是否变化, 不参与 snapshot id
+        stats: Dict[str, List[int]] = dict()
+        for file_path in iter_files(path):
+            relative = file_path.relative_to(path).as_posix()
+            if file_path.is_symlink():
+                files[relative] = {"link": os.readlink(file_path.as_posix())}
+                continue
+            st = file_path.stat()
+            entry: Dict[str, Any] = {
+                "mode": stat.S_IMODE(st.st_mode),
+                "uid": st.st_uid,
+                "gid": st.st_gid,
+            }
+            if st.st_size == 0:
+                files[relative] = dict(entry, size=0)
+                continue
+            digest = (
+                hashes.get(relative)
+                or self._get_known_digest(
+                    st, current_files.get(relative), current_stats.get(relative)
+                )
+                or hash_file(file_path)
+            )
+            self._add_blob(file_path, digest)
+            files[relative] = dict(entry, sha256=digest)
+            stats[relative] = [st.st_ino, st.st_size, st.st_mtime_ns]
+        snapshot_id = hashlib.sha1(
+            json.dumps([path.as_posix(), files], sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        snapshot_path = self.snapshots_dir.joinpath(f"{snapshot_id}.json")
+        snapshot = self._read_json(snapshot_path, {}) or {
+            "id": snapshot_id,
+            "path": path.as_posix(),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": files,
+        }
+        # 同一内容的版本只保存一份, 版本信息以最后一次安装为准
+        snapshot["tools"] = tools or snapshot.get("tools") or {}
+        snapshot["package"] = package or snapshot.get("package", "")
+        snapshot["stats"] = stats
+        snapshot["last_used"] = datetime.now().strftime(LAST_USED_FORMAT)
+        self._write_json(snapshot_path, snapshot)
+        self.refs[path.as_posix()] = snapshot_id
+        self._save_index()
+        logger.info(f"store {path}: snapshot {snapshot_id}, {len(files)} files")
+        self.evict()
+        return snapshot_id
+
+    def load_snapshot(self, snapshot_id: str) -> Optional[Dict[str, Any]]:
+        if not snapshot_id:
+            return None
+        return self._read_json(self.snapshots_dir.joinpath(f"{snapshot_id}.json"), None)
+
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        """
+        所有版本, 最近使用的在前
+        """
+        if not self.snapshots_dir.exists():
+            return []
+        snapshots = [
+            self._read_json(path, None) for path in self.snapshots_dir.glob("*.json")
+        ]
+        return sorted(
+            (snapshot for snapshot in snapshots if snapshot),
+            key=lambda snapshot: snapshot["last_used"],
+            reverse=True,
+        )
+
+    def checkout(self, snapshot_id: str) -> bool:
+        """
+        将工具目录切换到指定版本: 先校验所有 blob, 在暂存目录中复制出完整目录, 再 rename 替换
+        """
+        snapshot = self.load_snapshot(snapshot_id)
+        if snapshot is None:
+            logger.error(f"store snapshot not found: {snapshot_id}")
+            return False
+        missing = [
+            relative
+            for relative, entry in snapshot["files"].items()
+            if "sha256" in entry and not self._check_blob(entry["sha256"])
+        ]
+        if missing:
+            logger.error(
+                f"store snapshot {snapshot_id} is incomplete, "
+                f"{len(missing)} files missing: {', '.join(missing[:10])}"
+            )
+            return False
+        target = Path(snapshot["path"])
+        staging_path = get_staging_path(target)
+        remove_path(staging_path)
+        try:
+            for relative, entry in snapshot["files"].items():
+                # 入库的是单个文件时 relative 为 "."
+                file_path = staging_path.joinpath(relative)
+                file_path.parent.mkdir(parents=True, exist_ok=True)
+                if "link" in entry:
+                    os.symlink(entry["link"], file_path.as_posix())
+                    continue
+                if "sha256" in entry:
+                    self._engine.copy_file(
+                        self.get_blob_path(entry["sha256"]), file_path
+                    )
+                else:
+                    file_path.touch()
+                os.chmod(file_path.as_posix(), entry["mode"])
+                if "uid" in entry and os.geteuid() == 0:
+                    os.chown(file_path.as_posix(), entry["uid"], entry["gid"])
+            swap_into_place(staging_path, target)
+        except OSError as e:
+            logger.error(f"Failed to checkout {snapshot_id} to {target}: {e}")
+            remove_path(staging_path)
+            return False
+        snapshot["last_used"] = datetime.now().strftime(LAST_USED_FORMAT)
+        self._write_json(self.snapshots_dir.joinpath(f"{snapshot_id}.json"), snapshot)
+        self.refs[target.as_posix()] = snapshot_id
+        self._save_index()
+        logger.info(f"store checkout {snapshot_id}: {target}")
+        return True
+
+    @staticmethod
+    def _get_digests(snapshot: Dict[str, Any]) -> set:
+        return {
+            entry["sha256"] for entry in snapshot["files"].values() if "sha256" in entry
+        }
+
+    def get_usage(self) -> int:
+        """
+        blob 总大小
+        """
+        usage = 0
+        for digest in self.blobs:
+            try:
+                usage += self.get_blob_path(digest).stat().st_size
+            except OSError:
+                continue
+        return usage
+
+    def evict(self) -> List[str]:
+        """
+        按最近使用时间淘汰不是当前版本的 snapshot, 直到存储占用不超过上限, 并删除不再引用的 blob
+        Returns:
+            list: 淘汰的 snapshot id
+        """
+        usage = self.get_usage()
+        if usage <= self.max_bytes:
+            return []
+        snapshots = self.list_snapshots()
+        references: Dict[str, int] = dict()
+        for snapshot in snapshots:
+            for digest in self._get_digests(snapshot):
+                references[digest] = references.get(digest, 0) + 1
+        current = set(self.refs.values())
+        evicted = []
+        for snapshot in reversed(snapshots):
+            if usage <= self.max_bytes:
+                break
+            if snapshot["id"] in current:
+                continue
+            self.snapshots_dir.joinpath(f"{snapshot['id']}.json").unlink()
+            evicted.append(snapshot["id"])
+            for digest in self._get_digests(snapshot):
+                references[digest] -= 1
+                if references[digest] > 0:
+                    continue
+                blob_path = self.get_blob_path(digest)
+                try:
+                    size = blob_path.stat().st_size
+                    blob_path.unlink()
+                except OSError:
+                    continue
+                usage -= size
+                self.blobs.pop(digest, None)
+        if evicted:
+            self._save_index()
+            logger.info(f"store evicted {len(evicted)} snapshots: {', '.join(evicted)}")
+        return evicted
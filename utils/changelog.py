@@ -0,0 +1,149 @@
+import json
+import os
+from collections import defaultdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
+
+from constants import AIO_LOGS_DIR, PackageFilenameEnum
+from utils.changelog_store import ActionEnum, ChangelogStore
+from utils.log_base import logger
+from utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from utils.aio_tools import ToolsHandler
+
+CHANGELOG_FILE = f"{AIO_LOGS_DIR}/changelog.txt"
+VERSION_FILE = f"{AIO_LOGS_DIR}/version.json"
+
+
+class ChangelogHandler:
+    def __init__(self, changelog_file, version_file):
+        self.changelog_file = changelog_file
+        self.version_file = version_file
+        self.store = ChangelogStore(changelog_file)
+        self.version_info = self._load_version()
+
+    def _load_version(self) -> Dict[str, str]:
+        if not os.path.exists(self.version_file):
+            return dict()
+        with open(self.version_file, "r") as f:
+            content = f.read().strip()
+            if not content:
+                return dict()
+            return json.loads(content)
+
+    def get_last_version_dict(self) -> Dict[str, str]:
+        """
+        最新的版本快照, 直接从索引读取
+        """
+        return self.store.latest()
+
+    def update_changelog(self) -> bool:
+        last_version_dict = self.get_last_version_dict()
+        if self.version_info == last_version_dict:
+            logger.info("Version information has not changed, not updating changelog")
+            return False
+        # 只记录发生变化的工具, 未变化的工具（Maintain）在导出时还原
+        changes = dict()
+        for key, value in self.version_info.items():
+            if key not in last_version_dict:
+                logger.info(
+                    f"Tool {key}:{value} not found in changelog, adding version information"
+                )
+                changes[key] = {"version": value, "action": ActionEnum.ADD.value}
+                continue
+            # Modify version information
+            history_version = last_version_dict.get(key)
+            if value != history_version:
+                version = f"{history_version} -> {value}"
+                logger.warning(f"Tool version changed, {key}:{version}")
+                changes[key] = {"version": version, "action": ActionEnum.MODIFY.value}
+        removed = [key for key in last_version_dict if key not in self.version_info]
+        self.store.append(changes, removed)
+        return True
+
+    def export_changelog(self, output_file=None) -> Path:
+        """
+        导出为 YAML 格式的 changelog, 供人工查看
+        """
+        return self.store.export_yaml(output_file or self.changelog_file)
+
+
+class VersionHandler:
+    def __init__(
+        self,
+        version_file,
+        changelog_file="",
+        tools_handler: Optional["ToolsHandler"] = None,
+    ):
+        self.version_file = version_file
+        self.changelog_file = changelog_file
+        self.version_info = defaultdict()
+        self._tools_handler = tools_handler
+
+    @property
+    def tools_handler(self) -> "ToolsHandler":
+        # 调用方已经有版本信息时不需要探测工具, 延迟创建（也延迟导入 aio_tools）
+        if self._tools_handler is None:
+            from utils.aio_tools import ToolsHandler
+
+            self._tools_handler = ToolsHandler()
+        return self._tools_handler
+
+    def get_version(self) -> Dict[str, str]:
+        result = self.tools_handler.get_tools_version()
+        return self.set_version(result)
+
+    def set_version(self, version_info: Dict[str, str]) -> Dict[str, str]:
+        """
+        使用已探测到的版本信息, 忽略空版本
+        """
+        metrics.set_tool_versions(version_info)
+        self.version_info.update({k: v for k, v in version_info.items() if v})
+        return self.version_info
+
+    def update_changelog(self) -> bool:
+        """Update changelog and return whether changes occurred"""
+        changelog_handler = ChangelogHandler(self.changelog_file, self.version_file)
+        if not changelog_handler.version_info:
+            logger.error(
+                "Version information is empty, please get version information first"
+            )
+            logger.error(
+                f"Get more information: {PackageFilenameEnum.CHANGELOG_UPDATER_BINARY.value} --help"
+            )
+            return False
+        metrics.set_tool_versions(changelog_handler.version_info)
+        return changelog_handler.update_changelog()
+
+    def save_version(self):
+        with open(self.version_file, "w") as f:
+            json.dump(self.version_info, f)
+
+
+def record_changelog(
+    version_info: Optional[Dict[str, str]] = None,
+    version_file: str = VERSION_FILE,
+    changelog_file: str = CHANGELOG_FILE,
+    tools_handler: Optional["ToolsHandler"] = None,
+) -> bool:
+    """
+    进程内记录版本信息并更新 changelog, 等价于依次执行
+        changelog-updater record
+        changelog-updater update
+    Args:
+        version_info: 已探测到的工具版本信息, 为空时探测目标端工具版本
+        version_file: 版本信息文件
+        changelog_file: changelog 文件
+        tools_handler: 探测工具版本使用的 ToolsHandler, 为空时自动创建
+    Returns:
+        bool: changelog 是否有变化
+    """
+    version_handler = VersionHandler(version_file, changelog_file, tools_handler)
+    if version_info is None:
+        version_handler.get_version()
+    else:
+        version_handler.set_version(version_info)
+    Path(version_file).parent.mkdir(parents=True, exist_ok=True)
+    version_handler.save_version()
+    return version_handler.update_changelog()
@@ -0,0 +1,194 @@
+import bisect
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from utils.changelog_store import (
+    RECORD_ID_FORMAT,
+    RECORD_TIME_FORMAT,
+    ActionEnum,
+    ChangelogStore,
+)
+from utils.log_base import logger
+
+# 工具被移除时记录的动作, 只出现在查询结果中
+REMOVE_ACTION = "Remove"
+# 支持的时间输入格式
+TIME_INPUT_FORMATS = [
+    RECORD_TIME_FORMAT,
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    # 旧版记录 id, 需要在 RECORD_ID_FORMAT 之前尝试, 否则 12 位数字会被解析为 %H%M%S
+    "%Y%m%d%H%M",
+    RECORD_ID_FORMAT,
+    "%Y%m%d",
+]
+
+
+def parse_time(value: str, end_of_day: bool = False) -> str:
+    """
+    将用户输入的时间转换为记录中的时间格式, 用于字符串比较
+    Args:
+        value: 时间, 支持 2025-10-20 12:30:00 / 2025-10-20 / 202510201230 / 20251020123000 等格式
+        end_of_day: 只有日期时, 是否取当天最后一秒
+    """
+    value = value.strip()
+    for time_format in TIME_INPUT_FORMATS:
+        try:
+            parsed = datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        if end_of_day and time_format in ("%Y-%m-%d", "%Y%m%d"):
+            parsed = parsed.replace(hour=23, minute=59, second=59)
+        return parsed.strftime(RECORD_TIME_FORMAT)
+    raise ValueError(f"invalid time: {value}")
+
+
+class ChangelogQuery:
+    """
+    changelog 历史查询, 基于按工具组织的历史索引 changelog.history.json
+        {"size": 4096, "records": 10, "tools": {"fsdeamon": [[time, action, version, id], ...]}}
+    索引只记录到 jsonl 的 size 字节处, 查询时只解析新追加的部分, 不需要加载完整的 YAML
+    """
+
+    def __init__(self, store: ChangelogStore):
+        self.store = store
+        self.history_file = store.data_file.with_suffix(".history.json")
+        self._history: Optional[Dict[str, Any]] = None
+
+    @property
+    def history(self) -> Dict[str, Any]:
+        if self._history is None:
+            self._history = self._load_history()
+        return self._history
+
+    def _load_history(self) -> Dict[str, Any]:
+        # 触发旧版 changelog 导入
+        self.store.index
+        history: Dict[str, Any] = {"size": 0, "records": 0, "tools": {}}
+        if self.history_file.exists():
+            try:
+                history = json.loads(self.history_file.read_text(encoding="utf-8"))
+            except ValueError:
+                logger.warning("Rebuilding changelog history index")
+        data_size = self.store.data_size()
+        if history["size"] > data_size:
+            # jsonl 被截断或重写, 重新建立索引
+            history = {"size": 0, "records": 0, "tools": {}}
+        if history["size"] < data_size:
+            self._index_from(history, data_size)
+            self._save_history(history)
+        return history
+
+    def _index_from(self, history: Dict[str, Any], data_size: int) -> None:
+        """
+        从上次索引到的位置继续解析新追加的记录
+        """
+        tools: Dict[str, List[List[str]]] = history["tools"]
+        with open(self.store.data_file, "rb") as f:
+            f.seek(history["size"])
+            while f.tell() < data_size:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    # 写入中的半行, 下次再解析
+                    break
+                history["size"] = f.tell()
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                history["records"] += 1
+                for name in record.get("removed", []):
+                    tools.setdefault(name, []).append(
+                        [record["time"], REMOVE_ACTION, "", record["id"]]
+                    )
+                for name, change in sorted(record.get("changes", {}).items()):
+                    tools.setdefault(name, []).append(
+                        [
+                            record["time"],
+                            change["action"],
+                            change["version"],
+                            record["id"],
+                        ]
+                    )
+
+    def _save_history(self, history: Dict[str, Any]) -> None:
+        tmp_file = self.history_file.with_name(f".{self.history_file.name}.tmp")
+        tmp_file.write_text(json.dumps(history), encoding="utf-8")
+        os.replace(tmp_file.as_posix(), self.history_file.as_posix())
+
+    def tool_history(self, tool_name: str) -> List[Dict[str, str]]:
+        """
+        单个工具的版本变化时间线
+        """
+        return [
+            {"time": time, "action": action, "version": version, "id": record_id}
+            for time, action, version, record_id in self.history["tools"].get(
+                tool_name, []
+            )
+        ]
+
+    def snapshot_at(self, at_time: str) -> Dict[str, str]:
+        """
+        某个时间点的版本快照
+        Args:
+            at_time: 记录中的时间格式, 见 parse_time
+        """
+        result = dict()
+        for name, events in self.history["tools"].items():
+            position = bisect.bisect_right([event[0] for event in events], at_time)
+            if position == 0:
+                continue
+            _, action, version, _ = events[position - 1]
+            if action == REMOVE_ACTION:
+                continue
+            result[name] = version.split("->")[-1].strip()
+        return dict(sorted(result.items()))
+
+    def diff(self, since: str, until: str) -> List[Dict[str, str]]:
+        """
+        两个时间点之间发生变化的工具
+        """
+        before = self.snapshot_at(since)
+        after = self.snapshot_at(until)
+        result = []
+        for name in sorted(set(before) | set(after)):
+            old_version, new_version = before.get(name, ""), after.get(name, "")
+            if old_version == new_version:
+                continue
+            if not old_version:
+                action = ActionEnum.ADD.value
+            elif not new_version:
+                action = REMOVE_ACTION
+            else:
+                action = ActionEnum.MODIFY.value
+            result.append(
+                {
+                    "tool": name,
+                    "before": old_version,
+                    "after": new_version,
+                    "action": action,
+                }
+            )
+        return result
+
+    def rollup(self) -> List[Dict[str, Any]]:
+        """
+        压缩视图: 每个工具的首次出现时间、最后变化时间、当前版本和变化次数
+        """
+        result = []
+        for name, events in sorted(self.history["tools"].items()):
+            _, last_action, last_version, _ = events[-1]
+            result.append(
+                {
+                    "tool": name,
+                    "current": ""
+                    if last_action == REMOVE_ACTION
+                    else last_version.split("->")[-1].strip(),
+                    "first_seen": events[0][0],
+                    "last_changed": events[-1][0],
+                    "changes": len(events),
+                }
+            )
+        return result
@@ -0,0 +1,327 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.log_base import logger
+
+# changelog 记录的 id 格式（旧版 YAML 的一级 key 为 %Y%m%d%H%M）,
+# 同一秒内的多条记录追加序号, 例如 20251020123000-1
+RECORD_ID_FORMAT = "%Y%m%d%H%M%S"
+RECORD_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class ActionEnum(Enum):
+    ADD = "Add"
+    MAINTAIN = "Maintain"
+    MODIFY = "Modify"
+
+
+def _next_record_id(last_id: str, record_time: datetime) -> str:
+    """
+    记录 id, 与上一条记录在同一秒内时追加序号, 保证 id 唯一
+    """
+    record_id = record_time.strftime(RECORD_ID_FORMAT)
+    if last_id == record_id:
+        return f"{record_id}-1"
+    prefix, _, sequence = last_id.partition("-")
+    if prefix == record_id and sequence.isdigit():
+        return f"{record_id}-{int(sequence) + 1}"
+    return record_id
+
+
+def _to_yaml_tools(
+    record: Dict[str, Any], snapshot: Dict[str, str]
+) -> Dict[str, List[Dict[str, str]]]:
+    """
+    一条记录在旧版 YAML 中的内容: 记录之后的每个工具, 未变化的工具记为 Maintain
+    """
+    changes = record.get("changes", {})
+    data = dict()
+    for name, version in sorted(snapshot.items()):
+        change = changes.get(name)
+        data[name] = [
+            {
+                "version": change["version"] if change else version,
+                "action": change["action"] if change else ActionEnum.MAINTAIN.value,
+                "time": record["time"],
+            }
+        ]
+    return data
+
+
+class ChangelogStore:
+    """
+    追加写入的 changelog 存储, 与 changelog.txt 位于同一目录
+    - changelog.jsonl: 每次更新追加一行, 只记录发生变化（Add/Modify）和被移除的工具
+        {"id": "20251020123000", "time": "2025-10-20 12:30:00",
+         "changes": {"fsdeamon": {"version": "1.0.0.1 -> 1.0.0.2", "action": "Modify"}},
+         "removed": []}
+    - changelog.index.json: 最新版本快照, 更新时只读写索引和追加一行, 与历史长度无关
+        {"latest": {...}, "last_id": "...", "entries": 10, "size": 4096}
+    索引中的 size 与 jsonl 文件大小不一致时（例如写入过程中断电）, 通过重放 jsonl 重建索引
+    - changelog.txt: 供人工查看的 YAML 视图, 每次记录只在末尾追加这条记录的一段
+    首次使用时自动导入旧版 YAML changelog.txt, 导入前备份为 changelog.txt.legacy
+    """
+
+    def __init__(self, changelog_file):
+        changelog_path = Path(changelog_file)
+        self.legacy_file = changelog_path
+        self.yaml_file = changelog_path
+        self.data_file = changelog_path.with_suffix(".jsonl")
+        self.index_file = changelog_path.with_suffix(".index.json")
+        self.lock_file = changelog_path.with_suffix(".lock")
+        self._index: Optional[Dict[str, Any]] = None
+
+    @contextmanager
+    def _locked(self):
+        """
+        cron 中的 changelog-updater 可能与安装程序同时写入, 使用文件锁互斥
+        """
+        self.lock_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_file, "a") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    @property
+    def index(self) -> Dict[str, Any]:
+        if self._index is None:
+            self._index = self._load_index()
+        return self._index
+
+    def data_size(self) -> int:
+        if not self.data_file.exists():
+            return 0
+        return self.data_file.stat().st_size
+
+    def _load_index(self, migrate: bool = True) -> Dict[str, Any]:
+        if migrate and not self.data_file.exists() and self.legacy_file.exists():
+            with self._locked():
+                if not self.data_file.exists():
+                    self._migrate_legacy()
+        if self.index_file.exists():
+            try:
+                index = json.loads(self.index_file.read_text(encoding="utf-8"))
+                if index.get("size") == self.data_size():
+                    return index
+            except ValueError:
+                pass
+        logger.info(f"Rebuilding changelog index: {self.index_file.as_posix()}")
+        index = self._rebuild_index()
+        self._save_index(index)
+        return index
+
+    def _rebuild_index(self) -> Dict[str, Any]:
+        index: Dict[str, Any] = {"latest": {}, "last_id": "", "entries": 0, "size": 0}
+        for record in self.iter_records():
+            self._apply(index, record)
+        index["size"] = self.data_size()
+        return index
+
+    def _apply(self, index: Dict[str, Any], record: Dict[str, Any]) -> None:
+        latest = index["latest"]
+        for name in record.get("removed", []):
+            latest.pop(name, None)
+        for name, change in record.get("changes", {}).items():
+            latest[name] = change["version"].split("->")[-1].strip()
+        index["last_id"] = record["id"]
+        index["entries"] += 1
+
+    def _save_index(self, index: Dict[str, Any]) -> None:
+        """
+        先写临时文件再 rename, 保证索引文件不会写一半
+        """
+        self.index_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.index_file.with_name(f".{self.index_file.name}.tmp")
+        tmp_file.write_text(json.dumps(index, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_file.as_posix(), self.index_file.as_posix())
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """
+        按写入顺序遍历记录, 忽略损坏的行（例如写入中断留下的半行）
+        """
+        if not self.data_file.exists():
+            return
+        with open(self.data_file, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skip broken changelog record: {line[:80]}")
+
+    def latest(self) -> Dict[str, str]:
+        """
+        最新的版本快照, 按工具名排序
+        """
+        return dict(sorted(self.index["latest"].items()))
+
+    def append(
+        self,
+        changes: Dict[str, Dict[str, str]],
+        removed: List[str],
+        record_time: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """
+        追加一条记录并更新索引
+        Args:
+            changes: 发生变化的工具, {name: {"version": ..., "action": ...}}
+            removed: 被移除的工具
+            record_time: 记录时间, 默认当前时间
+        Returns:
+            dict: 写入的记录
+        """
+        record_time = record_time or datetime.now()
+        # 加锁前完成旧版 changelog 的导入（导入过程自己会加锁）
+        self.index
+        with self._locked():
+            # 加锁后重新读取索引, 其他进程可能刚写入过
+            index = self._index = self._load_index(migrate=False)
+            record = {
+                "id": _next_record_id(index["last_id"], record_time),
+                "time": record_time.strftime(RECORD_TIME_FORMAT),
+                "changes": dict(sorted(changes.items())),
+                "removed": sorted(removed),
+            }
+            self.data_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.data_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(index, record)
+            index["size"] = self.data_size()
+            self._save_index(index)
+            self._append_yaml(record, index["latest"])
+        return record
+
+    def _append_yaml(self, record: Dict[str, Any], snapshot: Dict[str, str]) -> None:
+        """
+        在 YAML 视图末尾追加一条记录, 只与工具数量有关, 不重写历史
+        视图损坏或被删除时, 可以通过 export 重新生成
+        """
+        import yaml
+
+        block = {record["id"]: _to_yaml_tools(record, snapshot)}
+        with open(self.yaml_file, "a") as f:
+            yaml.safe_dump(
+                block,
+                f,
+                default_flow_style=False,
+                allow_unicode=True,
+                sort_keys=False,
+            )
+
+    def iter_snapshots(self) -> Iterator[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """
+        按时间顺序遍历每条记录以及记录之后的完整版本快照
+        """
+        snapshot: Dict[str, str] = dict()
+        for record in self.iter_records():
+            for name in record.get("removed", []):
+                snapshot.pop(name, None)
+            for name, change in record.get("changes", {}).items():
+                snapshot[name] = change["version"].split("->")[-1].strip()
+            yield record, dict(snapshot)
+
+    def to_yaml_layout(self) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+        """
+        还原为旧版 YAML changelog 的结构, 按写入顺序排列（新记录在后, 与追加的视图一致）
+        未变化的工具记为 Maintain
+        """
+        return {
+            record["id"]: _to_yaml_tools(record, snapshot)
+            for record, snapshot in self.iter_snapshots()
+        }
+
+    def export_yaml(self, output_file) -> Path:
+        """
+        导出为旧版 YAML 格式, 供人工查看
+        先写到同目录下的临时文件再 rename, 读取方不会读到写了一半的文件
+        """
+        import yaml
+
+        output_path = Path(output_file)
+        data = self.to_yaml_layout()
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=output_path.parent.as_posix(), prefix=f".{output_path.name}."
+        )
+        try:
+            with os.fdopen(fd, "w") as f:
+                yaml.safe_dump(
+                    data,
+                    f,
+                    default_flow_style=False,
+                    allow_unicode=True,
+                    sort_keys=False,
+                )
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, output_path.as_posix())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return output_path
+
+    def _migrate_legacy(self) -> None:
+        """
+        导入旧版 YAML changelog.txt
+        """
+        import yaml
+
+        with open(self.legacy_file, "r") as f:
+            data = yaml.safe_load(f) or dict()
+        logger.info(
+            f"Migrating changelog {self.legacy_file.as_posix()} -> {self.data_file.as_posix()}"
+        )
+        snapshot: Dict[str, str] = dict()
+        lines = []
+        for record_id, tools in sorted(data.items(), key=lambda x: str(x[0])):
+            tools = tools or dict()
+            changes = dict()
+            record_time = ""
+            for name, value in tools.items():
+                item = value[0]
+                record_time = record_time or str(item.get("time", ""))
+                version = str(item["version"])
+                current = version.split("->")[-1].strip()
+                if (
+                    item.get("action") != ActionEnum.MAINTAIN.value
+                    or snapshot.get(name) != current
+                ):
+                    changes[name] = {
+                        "version": version,
+                        "action": item.get("action", ActionEnum.MODIFY.value),
+                    }
+            removed = sorted(name for name in snapshot if name not in tools)
+            snapshot = {
+                name: str(value[0]["version"]).split("->")[-1].strip()
+                for name, value in tools.items()
+            }
+            record = {
+                "id": str(record_id),
+                "time": record_time,
+                "changes": dict(sorted(changes.items())),
+                "removed": removed,
+            }
+            lines.append(json.dumps(record, ensure_ascii=False, sort_keys=True))
+        self.data_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.data_file.with_name(f".{self.data_file.name}.tmp")
+        tmp_file.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+        shutil.copy2(
+            self.legacy_file.as_posix(),
+            self.legacy_file.with_name(f"{self.legacy_file.name}.legacy").as_posix(),
+        )
+        os.replace(tmp_file.as_posix(), self.data_file.as_posix())
+        # 旧版视图新记录在前, 只在导入时重新导出一次, 之后的记录追加在末尾
+        self.export_yaml(self.yaml_file)
@@ -1,11 +1,11 @@
-import json
-import os
-import platform
 import shutil
 from pathlib import Path
 
-from constants import DISK_SPACE_THRESHOLD, GB_SIZE, PROJECT_DIR, PackageFilenameEnum
+from constants import DISK_SPACE_THRESHOLD, GB_SIZE, HOST_FACTS_FILE
+from utils.host_facts import HostFacts, get_host_facts
 from utils.log_base import logger
+from utils.preflight import Preflight
+from utils.timeline import timeline
 
 
 class HostEnvironmentDetection:
@@ -13,27 +13,17 @@ class HostEnvironmentDetection:
     主机环境检测
     """
 
-    def __init__(self):
-        self.arch = self._get_arch()
-
-    def _get_arch(self):
-        arch = platform.machine().lower()
-        if arch in ["x86_64", "amd64", "i386", "i686"]:
-            return "x86_64"
-        elif arch in ["aarch64", "arm64", "armv8"]:
-            return "aarch64"
-        else:
-            return "x86_64"
+    def __init__(self, host_facts: HostFacts = None):
+        self.host_facts = host_facts or get_host_facts()
+        self.arch = self.host_facts.arch
 
     def _check_arch(self) -> bool:
         """
         从version.json文件中获取package_name，从package_name中获取arch
         """
-        version_file = PROJECT_DIR.joinpath(PackageFilenameEnum.VERSION.value)
-        data = json.loads(version_file.read_text(encoding="utf-8"))
-        package_name = data.get("package_name")
+        package_name = self.host_facts.package_config.get("package_name")
         if not package_name:
-            logger.error(f"package_name not found in {version_file}")
+            logger.error(f"package_name not found in {self.host_facts.version_file}")
             return False
         if self.arch in package_name:
             logger.info(
@@ -46,36 +36,17 @@ class HostEnvironmentDetection:
             )
             return False
 
-    def _get_os_release(self) -> str:
-        """
-        获取操作系统版本， centos, bclinux
-        """
-        os_release_files = [
-            Path("/etc/os-release"),
-            Path("/etc/redhat-release"),
-            Path("/etc/lsb-release"),
-        ]
-        for os_release_file in os_release_files:
-            if not os_release_file.exists():
-                continue
-            for line in os_release_file.read_text(encoding="utf-8").splitlines():
-                if "=" in line:
-                    key, value = line.strip().split("=", 1)
-                    if key.strip().upper() == "ID":
-                        return value.strip().strip('"').strip("'").strip().lower()
-        return ""
-
     def _check_os_release(self) -> bool:
         """
         检查操作系统版本, centos, bclinux
         """
-        version_file = PROJECT_DIR.joinpath(PackageFilenameEnum.VERSION.value)
-        data = json.loads(version_file.read_text(encoding="utf-8"))
-        supported_os_releases = data.get("os_release")
+        supported_os_releases = self.host_facts.package_config.get("os_release")
         if not supported_os_releases:
-            logger.error(f"os_release config not found in {version_file}")
+            logger.error(
+                f"os_release config not found in {self.host_facts.version_file}"
+            )
             return False
-        os_release = self._get_os_release()
+        os_release = self.host_facts.os_release
         if not os_release:
             logger.error(f"current os_release not found")
             return False
@@ -94,15 +65,16 @@ class HostEnvironmentDetection:
         """
         检查磁盘空间, >5G 返回 True, 否则返回 False
         """
-        opt_path = Path("/opt")
-        if os.path.ismount(opt_path.as_posix()):
-            usage = shutil.disk_usage(opt_path)
+        # /opt 所在的挂载点, /opt 不是单独的挂载点时为 /
+        mount = self.host_facts.get_mount(Path("/opt"))
+        if mount is not None:
+            free_bytes = mount["free_bytes"]
         else:
-            usage = shutil.disk_usage(Path("/"))
+            free_bytes = shutil.disk_usage(Path("/")).free
 
-        free_space = f"{usage.free/GB_SIZE:.2f}G"
+        free_space = f"{free_bytes/GB_SIZE:.2f}G"
         need_space = f"{DISK_SPACE_THRESHOLD/GB_SIZE:.2f}G"
-        if usage.free - DISK_SPACE_THRESHOLD > 0:
+        if free_bytes - DISK_SPACE_THRESHOLD > 0:
             logger.info(
                 f"disk space enough, free: {free_space}, need at least {need_space}"
             )
@@ -113,10 +85,34 @@ class HostEnvironmentDetection:
             )
             return False
 
+    def _dump_host_facts(self) -> None:
+        if HOST_FACTS_FILE:
+            self.host_facts.dump(HOST_FACTS_FILE)
+
+    def add_checks(
+        self,
+        preflight: Preflight,
+        check_os_release: bool = True,
+        check_disk_space: bool = True,
+    ) -> None:
+        """
+        将主机检查加入安装前检查, 与其他检查并发执行
+        Args:
+            check_disk_space: 安装程序按安装包规划磁盘空间（SpacePlanner）时不需要固定阈值的检查
+        """
+        self._dump_host_facts()
+        preflight.add("arch", self._check_arch)
+        if check_os_release:
+            preflight.add("os_release", self._check_os_release)
+        if check_disk_space:
+            preflight.add("disk_space", self._check_disk_space)
+
+    @timeline.phase("host_check")
     def check(self, check_os_release: bool = True) -> bool:
         logger.info(
             f"To initialize the installation or upgrade, the following conditions must be met:"
         )
+        self._dump_host_facts()
         is_arch_supported = self._check_arch()
         if not is_arch_supported:
             return False
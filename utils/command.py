@@ -1,9 +1,227 @@
+import codecs
 import os
+import re
+import select
+import shlex
+import shutil
+import signal
 import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from constants import PROJECT_DIR
+from utils.log_base import command_logger
+from utils.timeline import timeline
+
+# display 时子进程输出没有换行, 超过这个时间没有后续输出时先写入日志（提示、进度）
+STREAM_FLUSH_INTERVAL = 0.1
+# display 时子进程退出后, 继续读取剩余输出的最长时间
+STREAM_DRAIN_TIMEOUT = 1.0
+# 需要交给 /bin/bash 解析的 shell 特性字符（管道、重定向、变量、通配符、引号等）
+SHELL_META_PATTERN = re.compile(r"[|&;<>()$`\\\"'*?\[\]#~{}\n]")
+# 会启动后台进程的命令（cmd &、nohup、setsid）, 不在常驻 shell 会话中执行
+BACKGROUND_PATTERN = re.compile(r"(^|[^&>])&([^&>]|$)|\bnohup\b|\bsetsid\b")
+# 常驻 shell 会话等待命令输出时, 每隔这么久检查一次 bash 协进程是否还在运行（秒）
+SESSION_POLL_INTERVAL = 1.0
+
+# 子进程环境变量只构建一次，避免每次调用都复制 os.environ
+_BASE_ENV: Optional[Dict[str, str]] = None
+
+
+def get_base_env() -> Dict[str, str]:
+    """
+    获取子进程使用的环境变量（缓存）
+    """
+    global _BASE_ENV
+    if _BASE_ENV is None:
+        env = os.environ.copy()
+        env["LANG"] = "en_US.UTF-8"
+        _BASE_ENV = env
+    return _BASE_ENV
+
+
+def reset_base_env() -> None:
+    """
+    os.environ 发生变化后调用，下次执行命令时重新构建环境变量
+    """
+    global _BASE_ENV
+    _BASE_ENV = None
+
+
+def is_posix_spawn_available() -> bool:
+    """
+    当前解释器的 subprocess 是否支持 posix_spawn 快速路径（Python 3.8+ / glibc 2.24+）
+    Python 3.6 上始终返回 False，此时退回 subprocess 默认的 fork_exec
+    """
+    return bool(getattr(subprocess, "_USE_POSIX_SPAWN", False))
+
+
+class ShellSessionError(RuntimeError):
+    pass
+
+
+class ShellSessionBusy(ShellSessionError):
+    """
+    会话正在被其他线程使用, 调用方单独启动 /bin/bash 执行, 并发的命令不会排队
+    """
+
+
+class ShellSession:
+    """
+    常驻的 bash 协进程，用于批量执行大量短小的 shell 探测命令（lsmod | grep ...、ps -ef | grep ...）
+    每条命令按帧发送:
+        ( cd <dir> && eval '<command>' ) </dev/null 2><stderr_file>; printf '<token>:%d\\n' "$?"
+    stdout 读到 <token>:<exit_code> 为止，stderr 从临时文件中读取
+    命令在子 shell 中执行，cd、变量、exit 等不会影响后续命令
+    命令整体作为一个字符串交给 eval, 引号不配对、heredoc 未结束等语法错误返回 2（与 bash -c 一致）,
+    不会让 bash 等待后续输入; 没有指定超时时间的命令一直等待, 期间 bash 协进程退出时报错
+    同一时间只执行一条命令, 会话被占用时（例如并发的安装前检查）抛出 ShellSessionBusy
+    关闭会话时会杀掉整个进程组, 包括命令启动的后台进程, 因此启动后台进程的命令不使用会话（见 Command）
+    """
+
+    def __init__(self):
+        self._process: Optional[subprocess.Popen] = None
+        self._token = uuid.uuid4().hex
+        self._marker = re.compile(f"{self._token}:(-?\\d+)\n".encode())
+        self._stderr_path = ""
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "ShellSession":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @property
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def _start(self) -> None:
+        fd, self._stderr_path = tempfile.mkstemp(prefix="aio_session_", suffix=".err")
+        os.close(fd)
+        self._process = subprocess.Popen(
+            ["/bin/bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=get_base_env(),
+            start_new_session=True,
+        )
+
+    def close(self) -> None:
+        process, self._process = self._process, None
+        if process is not None:
+            if process.poll() is None:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            process.wait()
+            for stream in (process.stdin, process.stdout):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+        if self._stderr_path and os.path.exists(self._stderr_path):
+            os.unlink(self._stderr_path)
+        self._stderr_path = ""
+
+    def execute(
+        self, command_str: str, working_dir: Path, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        if not self._lock.acquire(blocking=False):
+            raise ShellSessionBusy("shell session is in use")
+        try:
+            return self._execute(command_str, working_dir, timeout)
+        finally:
+            self._lock.release()
+
+    def _execute(
+        self, command_str: str, working_dir: Path, timeout: Optional[int]
+    ) -> subprocess.CompletedProcess:
+        if not self.is_alive:
+            self.close()
+            self._start()
+        frame = (
+            f"( cd -- {shlex.quote(str(working_dir))} && "
+            f"eval {shlex.quote(command_str)} ) "
+            f"</dev/null 2>{shlex.quote(self._stderr_path)}; "
+            f"printf '{self._token}:%d\\n' \"$?\"\n"
+        )
+        try:
+            self._process.stdin.write(frame.encode("utf-8"))
+            self._process.stdin.flush()
+            stdout, returncode = self._read_frame(command_str, timeout)
+        except (OSError, ValueError) as e:
+            self.close()
+            raise ShellSessionError(f"shell session broken: {e}")
+        with open(self._stderr_path, "rb") as f:
+            stderr = f.read()
+        return subprocess.CompletedProcess(
+            command_str,
+            returncode,
+            stdout=stdout.decode("utf-8", errors="replace"),
+            stderr=stderr.decode("utf-8", errors="replace"),
+        )
+
+    def _read_frame(self, command_str: str, timeout: Optional[int]):
+        """
+        读取到结束标记为止; 没有超时时间时一直等待, 每隔 SESSION_POLL_INTERVAL 秒检查 bash 是否退出
+        """
+        fd = self._process.stdout.fileno()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        buffer = bytearray()
+        while True:
+            match = self._marker.search(buffer)
+            if match:
+                return bytes(buffer[: match.start()]), int(match.group(1))
+            wait = SESSION_POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, max(deadline - time.monotonic(), 0))
+            readable, _, _ = select.select([fd], [], [], wait)
+            if not readable:
+                if deadline is not None and time.monotonic() >= deadline:
+                    # 超时: 杀掉整个协进程，下次执行命令时重新启动
+                    self.close()
+                    raise subprocess.TimeoutExpired(command_str, timeout)
+                if not self.is_alive:
+                    self.close()
+                    raise ShellSessionError("bash exited unexpectedly")
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                self.close()
+                raise ShellSessionError("bash exited unexpectedly")
+            buffer.extend(chunk)
+
+
+# 当前激活的 shell 会话，Command 在 shell 模式下优先使用
+_ACTIVE_SESSION: Optional[ShellSession] = None
+
+
+@contextmanager
+def shell_session():
+    """
+    在上下文中激活常驻 shell 会话，所有 Command(...).run() 的 shell 命令共用一个 bash 协进程
+    启动后台进程的命令（cmd &、nohup、setsid）仍然单独执行, 退出上下文时杀掉会话的进程组不会影响这些进程
+    设置环境变量 AIO_SHELL_SESSION=0 可关闭
+    """
+    global _ACTIVE_SESSION
+    if _ACTIVE_SESSION is not None or os.getenv("AIO_SHELL_SESSION", "1") == "0":
+        yield _ACTIVE_SESSION
+        return
+    session = ShellSession()
+    _ACTIVE_SESSION = session
+    try:
+        yield session
+    finally:
+        _ACTIVE_SESSION = None
+        session.close()
 
 
 class Command:
@@ -18,39 +236,187 @@ class Command:
         self.timeout = timeout
 
     def run(self, original=False, display=False) -> subprocess.CompletedProcess:
-        env = os.environ.copy()
-        env["LANG"] = "en_US.UTF-8"
-        stdout: Optional[int] = None if display else subprocess.PIPE
-        stderr: Optional[int] = None if display else subprocess.PIPE
+        with timeline.span(self.command_str, category="command") as span:
+            result = self._run(original, display)
+            if span is not None:
+                span.attrs["returncode"] = result.returncode
+            return result
+
+    def _run(self, original=False, display=False) -> subprocess.CompletedProcess:
+        # display 时合并 stdout、stderr, 逐行写入日志
+        stdout = subprocess.PIPE
+        stderr = subprocess.STDOUT if display else subprocess.PIPE
 
         if original:
             # 直接调用系统调用（如 execvp），​​不启动额外的 shell 进程​​（如 /bin/bash），性能更高。
             # 如果 self.command是字符串（如 "ls -l"），Python 会尝试自动分割为参数列表（可能不准确）
             # 如果 self.command是列表（如 ["ls", "-l"]），则直接按列表传递参数，​​避免 shell 注入风险​​。
-            return subprocess.run(
-                self.command,
-                cwd=self.working_dir,
-                stdout=stdout,
-                stderr=stderr,
-                timeout=self.timeout,
-                universal_newlines=True,
-                env=env,
-            )
-        else:
-            # 通过 Shell 执行
-            # 无论 self.command是字符串还是列表，最终会合并为单个字符串，由 /bin/bash解析执行。
-            return subprocess.run(
-                self.command_str,
-                shell=True,
-                executable="/bin/bash",
-                cwd=self.working_dir,
-                stdout=stdout,
-                stderr=stderr,
-                timeout=self.timeout,
-                universal_newlines=True,
-                env=env,
+            return self._run_args(self.command, stdout, stderr, display)
+        if not self.need_shell:
+            # 没有使用任何 shell 特性，跳过 /bin/bash 直接执行
+            args = shlex.split(self.command_str)
+            try:
+                return self._run_args(args, stdout, stderr, display)
+            except (FileNotFoundError, PermissionError) as e:
+                # 与 bash 的行为保持一致: 命令不存在返回 127，无执行权限返回 126
+                returncode = 127 if isinstance(e, FileNotFoundError) else 126
+                return subprocess.CompletedProcess(
+                    args, returncode, stdout="", stderr=f"{args[0]}: {e.strerror}\n"
+                )
+        if (
+            _ACTIVE_SESSION is not None
+            and not display
+            and not BACKGROUND_PATTERN.search(self.command_str)
+        ):
+            # 复用常驻 bash 协进程，省去每条命令启动 /bin/bash 的开销
+            # 会话被其他线程占用（ShellSessionBusy）或已损坏时, 单独启动 /bin/bash 执行
+            try:
+                return _ACTIVE_SESSION.execute(
+                    self.command_str, self.working_dir, self.timeout
+                )
+            except ShellSessionError:
+                pass
+        # 通过 Shell 执行
+        # 无论 self.command是字符串还是列表，最终会合并为单个字符串，由 /bin/bash解析执行。
+        return self._spawn(
+            self.command_str,
+            display,
+            shell=True,
+            executable="/bin/bash",
+            cwd=self.working_dir,
+            stdout=stdout,
+            stderr=stderr,
+            timeout=self.timeout,
+            universal_newlines=True,
+            env=get_base_env(),
+        )
+
+    def _run_args(
+        self, args: List[str], stdout: int, stderr: int, display: bool = False
+    ) -> subprocess.CompletedProcess:
+        """
+        以参数列表方式执行命令
+        满足条件时走 posix_spawn（vfork）快速路径，父进程 RSS 很大时不再需要复制页表:
+            - 解释器支持 posix_spawn
+            - 可执行文件能解析为绝对路径
+            - 工作目录就是当前目录（posix_spawn 不支持切换 cwd）
+        """
+        args = [str(arg) for arg in args]
+        kwargs = dict(
+            cwd=self.working_dir,
+            stdout=stdout,
+            stderr=stderr,
+            timeout=self.timeout,
+            universal_newlines=True,
+            env=get_base_env(),
+        )
+        if args and is_posix_spawn_available() and self._is_current_dir():
+            executable = self._resolve_executable(args[0])
+            if executable:
+                args = [executable] + args[1:]
+                # pipe 默认不可继承（PEP 446），关闭 close_fds 不会泄露文件描述符
+                kwargs.update(cwd=None, close_fds=False)
+        return self._spawn(args, display, **kwargs)
+
+    def _spawn(self, args, display: bool, **kwargs) -> subprocess.CompletedProcess:
+        """
+        display 时由后台线程读取子进程输出并写入日志, 由日志线程输出到终端和 json 日志文件,
+        终端输出慢时不会拖慢子进程（rpm、pip、make 等输出较多的命令）
+        子进程退出后最多再等待 STREAM_DRAIN_TIMEOUT 秒读取剩余输出, 不等待 EOF:
+        rdb start 等命令启动的后台进程会继承管道, 这些进程的输出由读取线程继续转发
+        """
+        if not display:
+            return subprocess.run(args, **kwargs)
+        timeout = kwargs.pop("timeout", None)
+        # 按字节读取, 自行解码, 没有换行的输出也能及时显示
+        kwargs.pop("universal_newlines", None)
+        lines: List[str] = []
+        process = subprocess.Popen(args, **kwargs)
+        reader = threading.Thread(
+            target=self._forward_output, args=(process.stdout, lines), daemon=True
+        )
+        reader.start()
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            reader.join(STREAM_DRAIN_TIMEOUT)
+            raise subprocess.TimeoutExpired(args, timeout, output="\n".join(lines))
+        reader.join(STREAM_DRAIN_TIMEOUT)
+        return subprocess.CompletedProcess(
+            args, returncode, stdout="\n".join(list(lines))
+        )
+
+    def _forward_output(self, stream, lines: List[str]) -> None:
+        """
+        读取到 EOF 为止, 按行写入日志; 没有换行的输出（提示、进度）在 STREAM_FLUSH_INTERVAL 秒内
+        没有后续输出时也写入日志
+        """
+        fd = stream.fileno()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+
+        def emit(line: str) -> None:
+            line = line.rstrip("\r")
+            lines.append(line)
+            command_logger.info(
+                line, extra={"stream": True, "command": self.command_str}
             )
 
+        try:
+            while True:
+                readable, _, _ = select.select([fd], [], [], STREAM_FLUSH_INTERVAL)
+                if not readable:
+                    if pending:
+                        emit(pending)
+                        pending = ""
+                    continue
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                pending += decoder.decode(chunk)
+                *complete, pending = pending.split("\n")
+                for line in complete:
+                    emit(line)
+            pending += decoder.decode(b"", final=True)
+            if pending:
+                emit(pending)
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
+
+    def _is_current_dir(self) -> bool:
+        if self.working_dir is None:
+            return True
+        try:
+            return Path(self.working_dir).resolve() == Path.cwd().resolve()
+        except OSError:
+            return False
+
+    def _resolve_executable(self, program: str) -> Optional[str]:
+        if os.path.dirname(program):
+            return os.path.abspath(program)
+        return shutil.which(program, path=get_base_env().get("PATH"))
+
+    @property
+    def need_shell(self) -> bool:
+        """
+        命令字符串中是否包含需要 shell 解析的特性, 或者命令不是可执行文件
+        （cd、source、export、ulimit 等内建命令、函数, 以及不存在的命令, 由 bash 处理）
+        """
+        command_str = self.command_str
+        if SHELL_META_PATTERN.search(command_str):
+            return True
+        first_word = command_str.split(None, 1)[0] if command_str.strip() else ""
+        # 形如 "LANG=C cmd" 的变量赋值前缀
+        if not first_word or "=" in first_word:
+            return True
+        if os.path.dirname(first_word):
+            return False
+        return self._resolve_executable(first_word) is None
+
     @property
     def command_str(self) -> str:
         return " ".join(self.command)
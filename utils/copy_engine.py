@@ -0,0 +1,238 @@
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# 每次 copy_file_range / sendfile 的最大字节数
+CHUNK_SIZE = 64 * 1024 * 1024
+# 复制目录时的并发数, 小文件多时主要开销在系统调用和元数据上
+COPY_WORKERS = min(16, (os.cpu_count() or 1) * 2)
+# 这些错误表示当前方式不支持（跨文件系统、文件系统不支持等）, 换下一种方式
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EBADF,
+}
+
+
+class ShortCopyError(OSError):
+    """
+    copy_file_range / sendfile 在复制完成前返回 0（源文件变小, 或文件系统不支持）
+    """
+
+
+@dataclass
+class CopyStats:
+    files: int = 0
+    symlinks: int = 0
+    dirs: int = 0
+    bytes: int = 0
+    # 每种复制方式处理的文件数: reflink / copy_file_range / sendfile / userspace
+    methods: Dict[str, int] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, method: str, size: int) -> None:
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+
+class CopyEngine:
+    """
+    使用内核复制文件, 数据不经过用户态缓冲区, 按顺序尝试:
+        1. FICLONE: 同一文件系统且支持 reflink（xfs/btrfs）时只复制元数据
+        2. copy_file_range: 内核内复制（python 3.8+）
+        3. sendfile
+        4. shutil.copyfileobj
+    某种方式在一对设备之间失败后, 后续文件不再尝试
+    文件权限、修改时间与源文件一致, 软链按原样复制（不跟随）
+    """
+
+    def __init__(self, workers: int = COPY_WORKERS):
+        self.workers = workers
+        self._unsupported: Dict[Tuple[int, int], set] = dict()
+        self._lock = threading.Lock()
+        self._methods = [("reflink", self._reflink)]
+        if hasattr(os, "copy_file_range"):
+            self._methods.append(("copy_file_range", self._copy_file_range))
+        if hasattr(os, "sendfile"):
+            self._methods.append(("sendfile", self._sendfile))
+
+    def _is_supported(self, devices: Tuple[int, int], method: str) -> bool:
+        with self._lock:
+            return method not in self._unsupported.get(devices, set())
+
+    def _mark_unsupported(self, devices: Tuple[int, int], method: str) -> None:
+        with self._lock:
+            self._unsupported.setdefault(devices, set()).add(method)
+
+    def _reflink(self, src_fd: int, dst_fd: int, size: int) -> None:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+    def _copy_file_range(self, src_fd: int, dst_fd: int, size: int) -> None:
+        copied = 0
+        while copied < size:
+            sent = os.copy_file_range(src_fd, dst_fd, min(CHUNK_SIZE, size - copied))
+            if sent == 0:
+                raise ShortCopyError(f"copy_file_range stopped at {copied}/{size}")
+            copied += sent
+
+    def _sendfile(self, src_fd: int, dst_fd: int, size: int) -> None:
+        copied = 0
+        while copied < size:
+            sent = os.sendfile(dst_fd, src_fd, copied, min(CHUNK_SIZE, size - copied))
+            if sent == 0:
+                raise ShortCopyError(f"sendfile stopped at {copied}/{size}")
+            copied += sent
+
+    def _copy_data(self, src: str, dst: str, size: int, src_dev: int) -> str:
+        """
+        复制文件内容, 返回使用的复制方式
+        某种方式出错或没有复制完整时, 清空目标文件后换下一种方式, 最后用用户态循环复制
+        Raises:
+            ShortCopyError: 复制后的大小与 size 不一致（复制过程中源文件被修改）
+        """
+        src_fd = os.open(src, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            dst_fd = os.open(
+                dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600
+            )
+            try:
+                if size == 0:
+                    return "empty"
+                devices = (src_dev, os.fstat(dst_fd).st_dev)
+                for method, func in self._methods:
+                    if not self._is_supported(devices, method):
+                        continue
+                    try:
+                        func(src_fd, dst_fd, size)
+                        return self._check_size(dst_fd, size, method)
+                    except ShortCopyError:
+                        # 只影响这一个文件, 不标记为不支持
+                        pass
+                    except OSError as e:
+                        if e.errno not in _UNSUPPORTED_ERRNOS:
+                            raise
+                        self._mark_unsupported(devices, method)
+                    # 失败的方式可能已经写入了部分数据
+                    os.lseek(src_fd, 0, os.SEEK_SET)
+                    os.ftruncate(dst_fd, 0)
+                    os.lseek(dst_fd, 0, os.SEEK_SET)
+                while True:
+                    chunk = os.read(src_fd, 1024 * 1024)
+                    if not chunk:
+                        break
+                    view = memoryview(chunk)
+                    while view:
+                        view = view[os.write(dst_fd, view) :]
+                return self._check_size(dst_fd, size, "userspace")
+            finally:
+                os.close(dst_fd)
+        finally:
+            os.close(src_fd)
+
+    @staticmethod
+    def _check_size(dst_fd: int, size: int, method: str) -> str:
+        copied = os.fstat(dst_fd).st_size
+        if copied != size:
+            raise ShortCopyError(f"{method} copied {copied} bytes, expected {size}")
+        return method
+
+    def _copy_entry(self, src: str, dst: str, stats: CopyStats) -> None:
+        """
+        复制文件或软链, 使用字符串路径, 复制目录时每个文件都会调用
+        """
+        st = os.lstat(src)
+        if stat.S_ISLNK(st.st_mode):
+            if os.path.lexists(dst):
+                os.unlink(dst)
+            os.symlink(os.readlink(src), dst)
+            with stats._lock:
+                stats.symlinks += 1
+            return
+        if os.path.islink(dst):
+            # 不能通过软链写入到其他位置
+            os.unlink(dst)
+        method = self._copy_data(src, dst, st.st_size, st.st_dev)
+        os.chmod(dst, stat.S_IMODE(st.st_mode))
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        stats.add(method, st.st_size)
+
+    def copy_file(
+        self, src: Path, dst: Path, stats: Optional[CopyStats] = None
+    ) -> Path:
+        """
+        复制单个文件或软链, dst 是已存在的目录时复制到该目录下
+        """
+        stats = stats or CopyStats()
+        if dst.is_dir() and not dst.is_symlink():
+            dst = dst.joinpath(src.name)
+        self._copy_entry(src.as_posix(), dst.as_posix(), stats)
+        return dst
+
+    def copy_tree(self, src: Path, dst: Path) -> CopyStats:
+        """
+        递归复制目录, dst 不能已存在（与 shutil.copytree 一致）
+        文件并发复制, 目录的权限和修改时间在所有文件复制完成后设置
+        """
+        stats = CopyStats()
+        dirs: List[Tuple[str, str]] = []
+        files: List[Tuple[str, str]] = []
+        src_root, dst_root = src.as_posix(), dst.as_posix()
+        for root, dir_names, file_names in os.walk(src_root):
+            target_root = dst_root + root[len(src_root) :]
+            os.makedirs(target_root, exist_ok=root != src_root)
+            dirs.append((root, target_root))
+            for name in file_names:
+                files.append(
+                    (os.path.join(root, name), os.path.join(target_root, name))
+                )
+            for name in list(dir_names):
+                # 指向目录的软链按软链复制, 不进入
+                if os.path.islink(os.path.join(root, name)):
+                    dir_names.remove(name)
+                    files.append(
+                        (os.path.join(root, name), os.path.join(target_root, name))
+                    )
+        if self.workers > 1 and len(files) > 1:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                # list() 让异常在这里抛出
+                list(executor.map(lambda item: self._copy_entry(*item, stats), files))
+        else:
+            for src_file, dst_file in files:
+                self._copy_entry(src_file, dst_file, stats)
+        # 子目录在前, 避免设置父目录修改时间后又被子目录的写入修改
+        for src_dir, dst_dir in reversed(dirs):
+            shutil.copystat(src_dir, dst_dir)
+        stats.dirs = len(dirs)
+        return stats
+
+
+def copy_anything(src: Path, dst: Path, workers: int = COPY_WORKERS) -> CopyStats:
+    """
+    复制文件或目录, 目录已存在时先删除
+    """
+    engine = CopyEngine(workers)
+    if src.is_dir() and not src.is_symlink():
+        if dst.is_symlink():
+            dst.unlink()
+        elif dst.exists():
+            shutil.rmtree(dst, ignore_errors=True)
+        return engine.copy_tree(src, dst)
+    stats = CopyStats()
+    if not dst.is_dir():
+        dst.parent.mkdir(parents=True, exist_ok=True)
+    engine.copy_file(src, dst, stats)
+    return stats
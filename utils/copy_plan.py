@@ -0,0 +1,174 @@
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils.manifest import PackageManifest
+
+
+@dataclass
+class CopyOperation:
+    # 安装包中的文件或目录
+    src: Path
+    # 目标端的文件或目录
+    dst: Path
+    # file / dir
+    path_type: str
+    # 由本次复制更新的工具
+    tools: List[str] = field(default_factory=list)
+    # 复制的字节数
+    bytes: int = 0
+    # 已从安装包直接解压到的暂存路径, 执行时 rename 到 dst, 不再复制
+    staged: Optional[Path] = None
+    # dst 中在目标端生成的文件或目录（例如编译的内核模块）, 替换 dst 时保留目标端的内容
+    preserve: List[Path] = field(default_factory=list)
+
+
+def get_tree_bytes(path: Path) -> int:
+    """
+    文件或目录的总大小, 不跟随软链
+    """
+    if path.is_symlink() or path.is_file():
+        return path.lstat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return total
+
+
+def _is_within(path: Path, parent: Path) -> bool:
+    return path == parent or parent in path.parents
+
+
+class CopyPlanner:
+    """
+    将需要安装或更新的工具解析为最少的、互不重叠的复制操作
+    - 没有 replace_dirs 的工具（例如 aio-speed、fs-cli）归属到包含它的其他工具的 replace_dirs（rpc、fs-tools）
+    - 多个工具共享同一个目录时只复制一次
+    - 目录已被上级目录包含时（嵌套）不再单独复制
+    - 替换的目录中包含 preserve_paths 时（例如 fs-tools 中编译的内核模块）, 保留目标端的内容
+    执行复制计划时每个文件最多复制一次
+    """
+
+    def __init__(
+        self,
+        package_tools: List,
+        package_tools_path: Path,
+        target_tools_path: Path,
+        manifest: Optional[PackageManifest] = None,
+        preserve_paths: Optional[List[Path]] = None,
+    ):
+        self.package_tools_map = {tool.name: tool for tool in package_tools}
+        self.package_tools_path = package_tools_path
+        self.target_tools_path = target_tools_path
+        self.manifest = manifest
+        # 目标端生成的文件或目录, 不能被安装包中的内容替换
+        self.preserve_paths = preserve_paths or []
+        # 所有工具的 replace_dirs, 用于查找没有 replace_dirs 的工具的归属目录
+        self._all_dirs: Dict[Path, str] = dict()
+        for tool in package_tools:
+            for item in tool.get_replace_dirs:
+                self._all_dirs.setdefault(Path(item["path"]), item["path_type"])
+
+    def _resolve_dirs(self, tool) -> Dict[Path, str]:
+        """
+        工具对应的复制源: replace_dirs, 没有时使用包含工具文件的最深的 replace_dir
+        """
+        replace_dirs = {
+            Path(item["path"]): item["path_type"] for item in tool.get_replace_dirs
+        }
+        if replace_dirs:
+            return replace_dirs
+        owners = [path for path in self._all_dirs if _is_within(tool.path, path)]
+        if owners:
+            owner = max(owners, key=lambda path: len(path.parts))
+            return {owner: self._all_dirs[owner]}
+        if self._exists(tool.path):
+            return {tool.path: "file"}
+        return dict()
+
+    def _exists(self, path: Path) -> bool:
+        """
+        安装包还未解压时（直接解压到暂存路径）根据 manifest 判断
+        """
+        if not _is_within(path, self.package_tools_path):
+            # 不在安装包中的工具, 例如 airflow、cdm
+            return False
+        if path.exists():
+            return True
+        if self.manifest is None:
+            return False
+        relative = path.relative_to(self.package_tools_path).as_posix()
+        return next(self.manifest.iter_files_under(relative), None) is not None
+
+    def _get_bytes(self, src: Path) -> int:
+        if self.manifest is not None:
+            relative = src.relative_to(self.package_tools_path).as_posix()
+            return self.manifest.get_bytes([relative])
+        return get_tree_bytes(src)
+
+    def plan(self, tool_names: List[str]) -> List[CopyOperation]:
+        """
+        Args:
+            tool_names: 需要安装或更新的工具
+        Returns:
+            list: 按路径排序的复制操作, 上级目录在前
+        """
+        sources: Dict[Path, CopyOperation] = dict()
+        for name in tool_names:
+            tool = self.package_tools_map.get(name)
+            if tool is None:
+                continue
+            for src, path_type in self._resolve_dirs(tool).items():
+                if not self._exists(src):
+                    # 安装包中没有的目录, 不能用空目录替换目标端
+                    continue
+                operation = sources.get(src)
+                if operation is None:
+                    dst = self.target_tools_path.joinpath(
+                        src.relative_to(self.package_tools_path)
+                    )
+                    operation = sources[src] = CopyOperation(src, dst, path_type)
+                if name not in operation.tools:
+                    operation.tools.append(name)
+        result: List[CopyOperation] = []
+        # 排序后上级目录一定在子目录之前
+        for src in sorted(sources, key=lambda path: path.parts):
+            operation = sources[src]
+            parent = next((item for item in result if _is_within(src, item.src)), None)
+            if parent is not None:
+                parent.tools.extend(
+                    name for name in operation.tools if name not in parent.tools
+                )
+                continue
+            result.append(operation)
+        for operation in result:
+            operation.bytes = self._get_bytes(operation.src)
+            operation.preserve = [
+                path
+                for path in self.preserve_paths
+                if path != operation.dst and _is_within(path, operation.dst)
+            ]
+        return result
+
+    @staticmethod
+    def format_plan(plan: List[CopyOperation]) -> str:
+        table_data = [
+            [
+                operation.dst.as_posix(),
+                operation.path_type,
+                ", ".join(operation.tools),
+                operation.bytes,
+            ]
+            for operation in plan
+        ]
+        table_data.append(["total", "", "", sum(operation.bytes for operation in plan)])
+        from tabulate import tabulate
+
+        return tabulate(
+            table_data, headers=["path", "type", "tools", "bytes"], tablefmt="pretty"
+        )
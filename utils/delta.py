@@ -0,0 +1,443 @@
+import hashlib
+import json
+import lzma
+import os
+import re
+import shutil
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from constants import VENV_DIRS
+from utils.log_base import logger
+from utils.manifest import PackageManifest, hash_file, iter_files
+from utils.staging import TOOLS_ARCHIVE_DIR, get_staging_path, remove_path
+
+# delta.json 格式版本, 不兼容的变化时加一
+DELTA_SCHEMA_VERSION = 1
+# 补丁文件在安装包中的目录
+DELTA_ARCHIVE_DIR = "delta"
+# 小于该大小的文件直接打包完整文件
+DELTA_PATCH_MIN_SIZE = 1024 * 1024
+# 补丁超过完整文件大小的比例时打包完整文件
+DELTA_PATCH_MAX_RATIO = 0.5
+PATCH_MAGIC = b"AIODELTA1\n"
+# 分块: 在连续的 0 字节（ELF 节之间的对齐填充）之后切分, 插入、删除内容后后续分块的边界不变
+CHUNK_BOUNDARY_PATTERN = re.compile(b"\x00{8,}")
+CHUNK_MIN_SIZE = 2 * 1024
+CHUNK_MAX_SIZE = 64 * 1024
+
+
+class DeltaError(RuntimeError):
+    pass
+
+
+def iter_chunks(data: bytes) -> Iterator[Tuple[int, int]]:
+    """
+    按内容切分, 返回 (起始位置, 结束位置)
+    """
+    start = 0
+    for match in CHUNK_BOUNDARY_PATTERN.finditer(data):
+        end = match.end()
+        while end - start > CHUNK_MAX_SIZE:
+            yield start, start + CHUNK_MAX_SIZE
+            start += CHUNK_MAX_SIZE
+        if end - start >= CHUNK_MIN_SIZE:
+            yield start, end
+            start = end
+    while start < len(data):
+        end = min(start + CHUNK_MAX_SIZE, len(data))
+        yield start, end
+        start = end
+
+
+def make_patch(base: bytes, new: bytes) -> bytes:
+    """
+    生成二进制补丁: 新文件中与旧文件相同的分块记为复制旧文件的区间, 其余记为数据
+        C offset length: 从旧文件复制
+        D length data: 新数据
+    """
+    view = memoryview(base)
+    index: Dict[bytes, Tuple[int, int]] = dict()
+    for start, end in iter_chunks(base):
+        index.setdefault(hashlib.sha1(view[start:end]).digest(), (start, end - start))
+    ops: List[Any] = []
+    new_view = memoryview(new)
+    for start, end in iter_chunks(new):
+        chunk = new_view[start:end]
+        hit = index.get(hashlib.sha1(chunk).digest())
+        if hit is not None and view[hit[0] : hit[0] + hit[1]] == chunk:
+            if ops and ops[-1][0] == "C" and sum(ops[-1][1:]) == hit[0]:
+                ops[-1][2] += hit[1]
+            else:
+                ops.append(["C", hit[0], hit[1]])
+        elif ops and ops[-1][0] == "D":
+            ops[-1][1] += chunk
+        else:
+            ops.append(["D", bytearray(chunk)])
+    body = bytearray()
+    for op in ops:
+        if op[0] == "C":
+            body += b"C" + struct.pack(">QQ", op[1], op[2])
+        else:
+            body += b"D" + struct.pack(">Q", len(op[1])) + op[1]
+    return PATCH_MAGIC + lzma.compress(bytes(body))
+
+
+def apply_patch(base_path: Path, patch_path: Path, output_path: Path) -> str:
+    """
+    Returns:
+        str: 生成的文件的 sha256
+    """
+    patch = patch_path.read_bytes()
+    if not patch.startswith(PATCH_MAGIC):
+        raise DeltaError(f"invalid patch file: {patch_path}")
+    body = memoryview(lzma.decompress(patch[len(PATCH_MAGIC) :]))
+    base = memoryview(base_path.read_bytes())
+    sha256 = hashlib.sha256()
+    position = 0
+    with open(output_path, "wb") as f:
+        while position < len(body):
+            kind = bytes(body[position : position + 1])
+            if kind == b"C":
+                offset, length = struct.unpack_from(">QQ", body, position + 1)
+                data = base[offset : offset + length]
+                position += 17
+            elif kind == b"D":
+                (length,) = struct.unpack_from(">Q", body, position + 1)
+                data = body[position + 9 : position + 9 + length]
+                position += 9 + length
+            else:
+                raise DeltaError(f"invalid patch record in {patch_path}")
+            f.write(data)
+            sha256.update(data)
+    return sha256.hexdigest()
+
+
+def _stat_entry(path: Path) -> Dict[str, Any]:
+    if path.is_symlink():
+        return {"link": os.readlink(path.as_posix())}
+    return {
+        "sha256": hash_file(path),
+        "size": path.stat().st_size,
+        "mode": path.stat().st_mode & 0o7777,
+    }
+
+
+def _scan(root: Path) -> Dict[str, Dict[str, Any]]:
+    if not root.exists():
+        return dict()
+    return {
+        path.relative_to(root).as_posix(): _stat_entry(path)
+        for path in iter_files(root)
+    }
+
+
+def parse_wheel_name(name: str) -> Tuple[str, str]:
+    """
+    aio_tasks-5.5.1.0-py3-none-any.whl -> (aio_tasks, 5.5.1.0)
+    """
+    parts = name[: -len(".whl")].split("-")
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+
+class DeltaBuilder:
+    """
+    打包时对比上一个版本的 package.tar.gz（已解压）, 生成增量包
+    - tools/: 只打包变化的文件, 大的二进制文件打包补丁, 记录目标端现有文件应有的哈希
+    - whl: 与上一版本相同的不再打包, 记录目标端应已安装的版本
+    - 其他文件（内核源码等）: 目标端不保留, 始终完整打包
+    只记录属于某个工具目录的文件（manifest 中的 dirs）, 其他文件不会被复制到目标端
+    """
+
+    def __init__(
+        self,
+        base_root: Path,
+        new_root: Path,
+        manifests: List[PackageManifest],
+    ):
+        self.base_root = base_root
+        self.new_root = new_root
+        # {arch: [工具目录, ...]}
+        self.arch_dirs: Dict[str, List[str]] = dict()
+        for manifest in manifests:
+            for arch, tools in manifest.data.get("tools", {}).items():
+                dirs = self.arch_dirs.setdefault(arch, [])
+                for info in tools.values():
+                    for item in info.get("dirs") or [info["path"]]:
+                        if item not in dirs:
+                            dirs.append(item)
+
+    def _get_archs(self, relative: str) -> List[str]:
+        return sorted(
+            arch
+            for arch, dirs in self.arch_dirs.items()
+            if any(relative == item or relative.startswith(item + "/") for item in dirs)
+        )
+
+    def _build_tools(self, output_root: Path) -> Dict[str, Dict[str, Any]]:
+        base_tools = _scan(self.base_root.joinpath(TOOLS_ARCHIVE_DIR))
+        new_tools = _scan(self.new_root.joinpath(TOOLS_ARCHIVE_DIR))
+        entries = dict()
+        for relative in sorted(set(base_tools) | set(new_tools)):
+            base, new = base_tools.get(relative), new_tools.get(relative)
+            if base == new:
+                continue
+            archs = self._get_archs(relative)
+            if not archs:
+                continue
+            entry: Dict[str, Any] = {"archs": archs, "base": base}
+            if new is None:
+                entry["action"] = "delete"
+            else:
+                entry.update(new)
+                entry["action"] = self._write_tool(relative, base, new, output_root)
+            entries[relative] = entry
+        return entries
+
+    def _write_tool(
+        self,
+        relative: str,
+        base: Optional[Dict[str, Any]],
+        new: Dict[str, Any],
+        output_root: Path,
+    ) -> str:
+        """
+        写入完整文件或补丁, 返回 add / replace / patch
+        """
+        new_path = self.new_root.joinpath(TOOLS_ARCHIVE_DIR, relative)
+        if (
+            base is not None
+            and "sha256" in base
+            and "sha256" in new
+            and new["size"] >= DELTA_PATCH_MIN_SIZE
+        ):
+            patch = make_patch(
+                self.base_root.joinpath(TOOLS_ARCHIVE_DIR, relative).read_bytes(),
+                new_path.read_bytes(),
+            )
+            if len(patch) <= new["size"] * DELTA_PATCH_MAX_RATIO:
+                patch_path = output_root.joinpath(
+                    DELTA_ARCHIVE_DIR, relative + ".patch"
+                )
+                patch_path.parent.mkdir(parents=True, exist_ok=True)
+                patch_path.write_bytes(patch)
+                return "patch"
+        target = output_root.joinpath(TOOLS_ARCHIVE_DIR, relative)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if "link" in new:
+            os.symlink(new["link"], target.as_posix())
+        else:
+            shutil.copy2(new_path.as_posix(), target.as_posix())
+        return "add" if base is None else "replace"
+
+    def build(self, output_root: Path, base_package: str) -> Dict[str, Any]:
+        """
+        Args:
+            output_root: 增量包内容的目录, 打包为新的 package.tar.gz
+            base_package: 上一个版本的安装包名
+        """
+        tools = self._build_tools(output_root)
+        wheels = dict()
+        for path in sorted(self.new_root.iterdir()):
+            if path.name == TOOLS_ARCHIVE_DIR:
+                continue
+            base_path = self.base_root.joinpath(path.name)
+            if (
+                path.name.endswith(".whl")
+                and base_path.is_file()
+                and hash_file(base_path) == hash_file(path)
+            ):
+                library, version = parse_wheel_name(path.name)
+                wheels[library] = version
+                continue
+            target = output_root.joinpath(path.name)
+            if path.is_dir() and not path.is_symlink():
+                shutil.copytree(path.as_posix(), target.as_posix(), symlinks=True)
+            else:
+                shutil.copy2(path.as_posix(), target.as_posix(), follow_symlinks=False)
+        return {
+            "schema": DELTA_SCHEMA_VERSION,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "base_package": base_package,
+            "tools": tools,
+            "wheels": wheels,
+        }
+
+
+class DeltaPackage:
+    """
+    安装时读取 delta.json: 校验目标端是否为增量包的基础版本, 将变化的文件写入工具目录
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    @classmethod
+    def load(cls, delta_file: Path) -> Optional["DeltaPackage"]:
+        if not delta_file.exists():
+            return None
+        try:
+            data = json.loads(delta_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load delta {delta_file}: {e}")
+            return None
+        if data.get("schema") != DELTA_SCHEMA_VERSION:
+            logger.warning(f"Unsupported delta schema: {data.get('schema')}")
+            return None
+        return cls(data)
+
+    def save(self, delta_file: Path) -> Path:
+        delta_file.write_text(
+            json.dumps(self.data, indent=2, sort_keys=True), encoding="utf-8"
+        )
+        return delta_file
+
+    @property
+    def base_package(self) -> str:
+        return self.data.get("base_package", "")
+
+    def get_tool_entries(self, arch: str) -> Dict[str, Dict[str, Any]]:
+        return {
+            relative: entry
+            for relative, entry in self.data.get("tools", {}).items()
+            if arch in entry["archs"]
+        }
+
+    def check_base(self, tools_root: Path, arch: str) -> List[str]:
+        """
+        目标端的文件必须与基础版本一致（新增的文件不能已存在）
+        Returns:
+            list: 不一致的文件
+        """
+        mismatched = []
+        for relative, entry in self.get_tool_entries(arch).items():
+            target = tools_root.joinpath(relative)
+            base = entry["base"]
+            if base is None:
+                matched = not (target.exists() or target.is_symlink())
+            else:
+                try:
+                    current = _stat_entry(target)
+                except OSError:
+                    current = None
+                # 权限可能在目标端被修改, 只比较内容
+                matched = current is not None and all(
+                    current.get(key) == base.get(key) for key in ["sha256", "link"]
+                )
+            if not matched:
+                mismatched.append(target.as_posix())
+        return mismatched
+
+    def check_wheels(self) -> List[str]:
+        """
+        增量包中没有的 whl, 目标端虚拟环境中已安装的版本必须与基础版本一致
+        没有安装该库的虚拟环境不检查（与完整包一样, 安装时只更新已有的虚拟环境）
+        Returns:
+            list: 不一致的库
+        """
+        # 延迟导入, 只有增量包需要
+        from utils.version_reader import get_distribution_version
+
+        mismatched = []
+        for library, version in self.data.get("wheels", {}).items():
+            for name, venv_dir in VENV_DIRS.items():
+                installed = get_distribution_version(Path(venv_dir), library)
+                if installed and not self._same_version(installed, version):
+                    mismatched.append(f"{name}:{library} {installed} != {version}")
+        return mismatched
+
+    @staticmethod
+    def _same_version(left: str, right: str) -> bool:
+        from packaging.version import InvalidVersion
+        from packaging.version import parse as parseVersion
+
+        try:
+            return parseVersion(left) == parseVersion(right)
+        except InvalidVersion:
+            return left == right
+
+    def _stage(
+        self, relative: str, entry: Dict[str, Any], package_root: Path, target: Path
+    ) -> Path:
+        """
+        写入一个文件的暂存路径, 失败时删除写了一半的暂存文件
+        """
+        staging_path = get_staging_path(target)
+        remove_path(staging_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            self._write_staging(relative, entry, package_root, target, staging_path)
+        except BaseException:
+            remove_path(staging_path)
+            raise
+        return staging_path
+
+    def _write_staging(
+        self,
+        relative: str,
+        entry: Dict[str, Any],
+        package_root: Path,
+        target: Path,
+        staging_path: Path,
+    ) -> None:
+        if "link" in entry:
+            os.symlink(entry["link"], staging_path.as_posix())
+            return
+        if entry["action"] == "patch":
+            digest = apply_patch(
+                target,
+                package_root.joinpath(DELTA_ARCHIVE_DIR, relative + ".patch"),
+                staging_path,
+            )
+        else:
+            shutil.copyfile(
+                package_root.joinpath(TOOLS_ARCHIVE_DIR, relative).as_posix(),
+                staging_path.as_posix(),
+            )
+            digest = hash_file(staging_path)
+        if digest != entry["sha256"]:
+            raise DeltaError(f"checksum mismatch after applying delta: {target}")
+        os.chmod(staging_path.as_posix(), entry["mode"])
+
+    def apply(self, package_root: Path, tools_root: Path, arch: str) -> List[Path]:
+        """
+        先把所有变化的文件写到目标文件旁的暂存路径并校验哈希, 全部成功后再逐个 rename 替换
+        Args:
+            package_root: 解压后的增量包目录
+            tools_root: 目标端工具目录, 即 TOOLS_PATH
+        Returns:
+            list: 变化的目标文件
+        """
+        entries = self.get_tool_entries(arch)
+        staged: List[Tuple[Path, Path]] = []
+        replaced = 0
+        try:
+            for relative, entry in entries.items():
+                if entry["action"] == "delete":
+                    continue
+                target = tools_root.joinpath(relative)
+                staged.append(
+                    (self._stage(relative, entry, package_root, target), target)
+                )
+            for staging_path, target in staged:
+                if target.is_dir() and not target.is_symlink():
+                    shutil.rmtree(target.as_posix())
+                os.replace(staging_path.as_posix(), target.as_posix())
+                replaced += 1
+        except BaseException:
+            # 删除还没有替换到目标路径的暂存文件
+            for staging_path, _ in staged[replaced:]:
+                remove_path(staging_path)
+            raise
+        changed = [target for _, target in staged]
+        for relative, entry in entries.items():
+            if entry["action"] == "delete":
+                target = tools_root.joinpath(relative)
+                remove_path(target)
+                changed.append(target)
+        logger.info(
+            f"applied delta from {self.base_package}: {len(changed)} files changed"
+        )
+        return changed
@@ -0,0 +1,143 @@
+import atexit
+import io
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Set
+
+from constants import AIO_LOGS_DIR, PROJECT_DIR
+from utils.log_base import logger
+
+# 环境变量开关: AIO_PROFILE=cpu,mem（或 1/all）
+PROFILE_ENV = "AIO_PROFILE"
+# 隐藏参数开关: --aio-profile 或 --aio-profile=cpu,mem，不出现在 --help 中
+PROFILE_FLAG = "--aio-profile"
+# tracemalloc 保存的调用栈深度
+PROFILE_FRAMES_ENV = "AIO_PROFILE_FRAMES"
+# 报告中输出的条目数
+TOP_LIMIT = 30
+
+
+def _parse_modes(value: str) -> Set[str]:
+    value = value.strip().lower()
+    if not value or value == "0":
+        return set()
+    if value in ("1", "all", "true", "yes"):
+        return {"cpu", "mem"}
+    return {item.strip() for item in value.split(",") if item.strip()}
+
+
+def _pop_profile_flag(argv: List[str]) -> Optional[str]:
+    """
+    从 argv 中取出隐藏参数，避免 argparse 报未知参数
+    """
+    for index, arg in enumerate(argv):
+        if arg == PROFILE_FLAG:
+            argv.pop(index)
+            return "all"
+        if arg.startswith(f"{PROFILE_FLAG}="):
+            argv.pop(index)
+            return arg.split("=", 1)[1]
+    return None
+
+
+def _get_output_dir() -> Path:
+    for candidate in (Path(AIO_LOGS_DIR), PROJECT_DIR, Path("/tmp")):
+        if candidate.is_dir() and os.access(candidate.as_posix(), os.W_OK):
+            return candidate
+    return Path.cwd()
+
+
+class FunctionProfiler:
+    """
+    函数级 CPU（cProfile）和内存（tracemalloc）分析
+    未开启时不导入 cProfile/tracemalloc，不产生任何开销
+    退出时（包括 sys.exit）将结果写到日志目录:
+        <name>-<time>.pstats:   cProfile 原始数据, 可用 python -m pstats 或 snakeviz 查看
+        <name>-<time>.cpu.txt:  按累计耗时排序的函数列表
+        <name>-<time>.mem.txt:  峰值内存和分配最多的代码位置
+    """
+
+    def __init__(self, name: str, modes: Set[str]):
+        self.name = name
+        self.modes = modes
+        self._profiler = None
+        self._prefix = ""
+
+    def start(self) -> None:
+        suffix = datetime.now().strftime("%Y%m%d%H%M%S")
+        self._prefix = _get_output_dir().joinpath(f"{self.name}-{suffix}").as_posix()
+        if "mem" in self.modes:
+            import tracemalloc
+
+            tracemalloc.start(int(os.getenv(PROFILE_FRAMES_ENV, "1") or 1))
+        if "cpu" in self.modes:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        if self._profiler is not None:
+            self._profiler.disable()
+        # 先输出内存结果，避免统计到 pstats 自身的内存分配
+        if "mem" in self.modes:
+            import tracemalloc
+
+            if tracemalloc.is_tracing():
+                self._dump_memory()
+                tracemalloc.stop()
+        if self._profiler is not None:
+            self._dump_cpu()
+            self._profiler = None
+
+    def _dump_cpu(self) -> None:
+        import pstats
+
+        self._profiler.dump_stats(f"{self._prefix}.pstats")
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream)
+        stats.sort_stats("cumulative").print_stats(TOP_LIMIT)
+        Path(f"{self._prefix}.cpu.txt").write_text(stream.getvalue(), encoding="utf-8")
+        logger.info(f"cpu profile saved: {self._prefix}.pstats")
+
+    def _dump_memory(self) -> None:
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        key_type = "traceback" if tracemalloc.get_traceback_limit() > 1 else "lineno"
+        lines = [
+            f"current: {current / 1024 / 1024:.2f}MB, peak: {peak / 1024 / 1024:.2f}MB",
+            f"top {TOP_LIMIT} allocation sites (by {key_type}):",
+        ]
+        for stat in snapshot.statistics(key_type)[:TOP_LIMIT]:
+            lines.append(str(stat))
+            if key_type == "traceback":
+                lines.extend(f"    {line}" for line in stat.traceback.format())
+        Path(f"{self._prefix}.mem.txt").write_text(
+            "\n".join(lines) + "\n", encoding="utf-8"
+        )
+        logger.info(f"memory profile saved: {self._prefix}.mem.txt")
+
+
+def install_profiler(name: str) -> Optional[FunctionProfiler]:
+    """
+    入口脚本最开始调用, 根据环境变量或隐藏参数开启分析
+    for example:
+        AIO_PROFILE=cpu,mem ./install
+        ./install --aio-profile=mem
+    """
+    flag_value = _pop_profile_flag(sys.argv)
+    modes = _parse_modes(
+        flag_value if flag_value is not None else os.getenv(PROFILE_ENV, "")
+    )
+    if not modes:
+        return None
+    profiler = FunctionProfiler(name, modes)
+    profiler.start()
+    return profiler
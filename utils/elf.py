@@ -0,0 +1,143 @@
+import re
+import struct
+from pathlib import Path
+from typing import Dict, Optional
+
+ELF_MAGIC = b"\x7fELF"
+# e_ident[EI_CLASS]
+ELF_CLASS_32 = 1
+ELF_CLASS_64 = 2
+# e_ident[EI_DATA]
+ELF_DATA_LSB = 1
+ELF_DATA_MSB = 2
+# sh_type SHT_NOBITS: .bss 等在文件中没有内容的节
+SHT_NOBITS = 8
+
+
+class ELFError(ValueError):
+    pass
+
+
+class ELFFile:
+    """
+    只读取节头表的最小 ELF 解析器, 不依赖 binutils/modinfo,
+    可以读取其他架构（例如在 x86_64 上读取 aarch64）的二进制文件和内核模块
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._sections: Optional[Dict[str, tuple]] = None
+
+    def _read_header(self, f) -> tuple:
+        ident = f.read(16)
+        if len(ident) < 16 or ident[:4] != ELF_MAGIC:
+            raise ELFError(f"not an ELF file: {self.path.as_posix()}")
+        elf_class, elf_data = ident[4], ident[5]
+        if elf_class not in (ELF_CLASS_32, ELF_CLASS_64):
+            raise ELFError(f"unknown ELF class {elf_class}: {self.path.as_posix()}")
+        if elf_data not in (ELF_DATA_LSB, ELF_DATA_MSB):
+            raise ELFError(f"unknown ELF data {elf_data}: {self.path.as_posix()}")
+        endian = "<" if elf_data == ELF_DATA_LSB else ">"
+        if elf_class == ELF_CLASS_64:
+            # e_type .. e_shstrndx
+            header_format = endian + "HHIQQQIHHHHHH"
+            section_format = endian + "IIQQQQIIQQ"
+        else:
+            header_format = endian + "HHIIIIIHHHHHH"
+            section_format = endian + "IIIIIIIIII"
+        data = f.read(struct.calcsize(header_format))
+        if len(data) < struct.calcsize(header_format):
+            raise ELFError(f"truncated ELF header: {self.path.as_posix()}")
+        header = struct.unpack(header_format, data)
+        if header[10] and header[10] < struct.calcsize(section_format):
+            raise ELFError(f"invalid e_shentsize {header[10]}: {self.path.as_posix()}")
+        # e_shoff, e_shentsize, e_shnum, e_shstrndx
+        return header[5], header[10], header[11], header[12], section_format
+
+    @property
+    def sections(self) -> Dict[str, tuple]:
+        """
+        节名 -> (sh_type, sh_offset, sh_size)
+        """
+        if self._sections is None:
+            self._sections = self._read_sections()
+        return self._sections
+
+    def _read_sections(self) -> Dict[str, tuple]:
+        with open(self.path, "rb") as f:
+            shoff, shentsize, shnum, shstrndx, section_format = self._read_header(f)
+            if shoff == 0 or shnum == 0:
+                return dict()
+            f.seek(shoff)
+            table = f.read(shentsize * shnum)
+            if len(table) < shentsize * shnum:
+                raise ELFError(f"truncated section table: {self.path.as_posix()}")
+            headers = []
+            for i in range(shnum):
+                item = struct.unpack_from(section_format, table, i * shentsize)
+                # sh_name, sh_type, sh_offset, sh_size
+                headers.append((item[0], item[1], item[4], item[5]))
+            if shstrndx >= shnum:
+                raise ELFError(f"invalid shstrndx: {self.path.as_posix()}")
+            _, _, names_offset, names_size = headers[shstrndx]
+            f.seek(names_offset)
+            names = f.read(names_size)
+        result = dict()
+        for name_offset, sh_type, offset, size in headers:
+            end = names.find(b"\0", name_offset)
+            name = names[name_offset:end].decode("ascii", errors="replace")
+            if name and name not in result:
+                result[name] = (sh_type, offset, size)
+        return result
+
+    def read_section(self, name: str) -> Optional[bytes]:
+        """
+        读取节内容, 节不存在时返回 None
+        """
+        section = self.sections.get(name)
+        if section is None:
+            return None
+        sh_type, offset, size = section
+        if sh_type == SHT_NOBITS:
+            return b""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+
+def read_modinfo(path: Path) -> Dict[str, str]:
+    """
+    读取内核模块 .modinfo 节, 等价于 modinfo 的输出
+        {"version": "1.0.0.1", "vermagic": "3.10.0-1160.el7.x86_64 SMP mod_unload", "srcversion": "..."}
+    同一个 key 出现多次时（例如 alias、depends）保留第一个
+    """
+    content = ELFFile(path).read_section(".modinfo")
+    result: Dict[str, str] = dict()
+    if not content:
+        return result
+    for item in content.split(b"\0"):
+        if b"=" not in item:
+            continue
+        key, value = item.split(b"=", 1)
+        result.setdefault(
+            key.decode("utf-8", errors="replace"),
+            value.decode("utf-8", errors="replace"),
+        )
+    return result
+
+
+def search_section(path: Path, pattern: str, section: str = ".rodata") -> str:
+    """
+    在节内容中查找编译进二进制文件的版本字符串
+    Args:
+        path: ELF 文件
+        pattern: 正则表达式, 返回第一个分组, 例如 r"version:\\s*(\\d+\\.\\d+\\.\\d+)"
+        section: 节名, 默认 .rodata
+    """
+    content = ELFFile(path).read_section(section)
+    if not content:
+        return ""
+    match = re.search(pattern.encode("utf-8"), content)
+    if not match:
+        return ""
+    return match.group(1).decode("utf-8", errors="replace")
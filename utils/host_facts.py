@@ -0,0 +1,276 @@
+import json
+import os
+import platform
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from constants import HOST_FACTS_FILE, PROJECT_DIR, VENV_DIRS, PackageFilenameEnum
+from utils.log_base import logger
+
+# 不占用磁盘空间的文件系统, 不统计剩余空间
+PSEUDO_FS_TYPES = {
+    "autofs",
+    "binfmt_misc",
+    "bpf",
+    "cgroup",
+    "cgroup2",
+    "configfs",
+    "debugfs",
+    "devpts",
+    "devtmpfs",
+    "fusectl",
+    "hugetlbfs",
+    "mqueue",
+    "nsfs",
+    "proc",
+    "pstore",
+    "rpc_pipefs",
+    "securityfs",
+    "selinuxfs",
+    "sysfs",
+    "tracefs",
+}
+OS_RELEASE_FILES = ["/etc/os-release", "/etc/redhat-release", "/etc/lsb-release"]
+
+
+def normalize_arch(machine: str) -> str:
+    arch = machine.lower()
+    if arch in ["x86_64", "amd64", "i386", "i686"]:
+        return "x86_64"
+    elif arch in ["aarch64", "arm64", "armv8"]:
+        return "aarch64"
+    else:
+        return "x86_64"
+
+
+def fact(func: Callable) -> property:
+    """
+    只读属性, 第一次访问时探测, 结果保存在 HostFacts._facts 中
+    """
+    name = func.__name__
+
+    def getter(self):
+        if name not in self._facts:
+            self._facts[name] = func(self)
+        return self._facts[name]
+
+    getter.__doc__ = func.__doc__
+    getter.__fact__ = True
+    return property(getter)
+
+
+class HostFacts:
+    """
+    主机信息快照, 所有检查和安装脚本共用, 每项信息只探测一次
+        - arch: 架构, x86_64 / aarch64
+        - os_release: /etc/os-release 中的 ID, centos / bclinux
+        - kernel: 内核版本
+        - package_config: 安装包中的 version.json
+        - mounts: 挂载点、文件系统类型和剩余空间
+        - rpms: 已安装的 rpm 包及版本
+        - venvs: aio 的 python 虚拟环境
+        - processes: 正在运行的进程命令行, 用于判断工具是否在运行
+    dump() 将所有信息写入 json 文件, 其他编排工具可以直接读取, 不需要再次探测主机
+    """
+
+    def __init__(self, version_file: Optional[Path] = None):
+        self.version_file = version_file or PROJECT_DIR.joinpath(
+            PackageFilenameEnum.VERSION.value
+        )
+        self._facts: Dict[str, Any] = dict()
+
+    @fact
+    def arch(self) -> str:
+        return normalize_arch(platform.machine())
+
+    @fact
+    def os_release(self) -> str:
+        for os_release_file in OS_RELEASE_FILES:
+            path = Path(os_release_file)
+            if not path.exists():
+                continue
+            for line in path.read_text(encoding="utf-8").splitlines():
+                if "=" in line:
+                    key, value = line.strip().split("=", 1)
+                    if key.strip().upper() == "ID":
+                        return value.strip().strip('"').strip("'").strip().lower()
+        return ""
+
+    @fact
+    def kernel(self) -> str:
+        return os.uname().release
+
+    @fact
+    def package_config(self) -> Dict[str, Any]:
+        """
+        version.json, 不存在时为空字典（例如在目标端单独执行 changelog-updater）
+        """
+        if not self.version_file.exists():
+            return dict()
+        return json.loads(self.version_file.read_text(encoding="utf-8"))
+
+    @fact
+    def mounts(self) -> List[Dict[str, Any]]:
+        """
+        真实文件系统的挂载点, 同一挂载点只保留最后一次挂载
+        """
+        mounts: Dict[str, Dict[str, Any]] = dict()
+        try:
+            lines = Path("/proc/mounts").read_text().splitlines()
+        except OSError:
+            lines = []
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 3 or fields[2] in PSEUDO_FS_TYPES:
+                continue
+            # /proc/mounts 中空格等字符被转义为八进制
+            mount_point = re.sub(
+                r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1]
+            )
+            try:
+                st = os.statvfs(mount_point)
+            except OSError:
+                continue
+            mounts[mount_point] = {
+                "device": fields[0],
+                "mount_point": mount_point,
+                "fs_type": fields[2],
+                "total_bytes": st.f_blocks * st.f_frsize,
+                "free_bytes": st.f_bavail * st.f_frsize,
+            }
+        return list(mounts.values())
+
+    @fact
+    def rpms(self) -> Dict[str, str]:
+        """
+        {name: version-release}, 没有 rpm 命令时为空字典
+        """
+        # 延迟导入, command 依赖 timeline, 不需要 rpm 信息时不导入
+        from utils.command import Command
+
+        try:
+            result = Command(
+                ["rpm", "-qa", "--queryformat", "%{NAME} %{VERSION}-%{RELEASE}\\n"]
+            ).run(original=True)
+        except OSError as e:
+            logger.warning(f"Failed to query rpm packages: {e}")
+            return dict()
+        if result.returncode != 0:
+            logger.warning(f"Failed to query rpm packages: {result.stderr.strip()}")
+            return dict()
+        rpms = dict()
+        for line in result.stdout.splitlines():
+            if " " in line:
+                name, version = line.split(" ", 1)
+                rpms[name] = version
+        return rpms
+
+    @fact
+    def venvs(self) -> Dict[str, Dict[str, str]]:
+        """
+        {name: {path, python, pip}}, 虚拟环境不存在时不包含
+        """
+        venvs = dict()
+        for name, venv_dir in VENV_DIRS.items():
+            path = Path(venv_dir)
+            if not path.is_dir():
+                continue
+            python_version = ""
+            pyvenv_cfg = path.joinpath("pyvenv.cfg")
+            if pyvenv_cfg.exists():
+                for line in pyvenv_cfg.read_text(encoding="utf-8").splitlines():
+                    key, _, value = line.partition("=")
+                    if key.strip() in ["version", "version_info"]:
+                        python_version = value.strip()
+            pip_path = path.joinpath("bin", "pip3")
+            venvs[name] = {
+                "path": path.as_posix(),
+                "python": python_version,
+                "pip": pip_path.as_posix() if pip_path.exists() else "",
+            }
+        return venvs
+
+    @fact
+    def processes(self) -> List[str]:
+        """
+        所有进程的命令行, 读取 /proc, 不执行 ps
+        """
+        processes = []
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    cmdline = f.read()
+            except OSError:
+                # 进程已退出
+                continue
+            if cmdline:
+                processes.append(
+                    cmdline.rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace")
+                )
+        return processes
+
+    def get_mount(self, path: Path) -> Optional[Dict[str, Any]]:
+        """
+        路径所在的挂载点（最长匹配）, 路径不需要存在
+        """
+        target = os.path.abspath(path.as_posix())
+        matched = None
+        for mount in self.mounts:
+            mount_point = mount["mount_point"]
+            prefix = mount_point.rstrip("/") + "/"
+            if target == mount_point or target.startswith(prefix):
+                if matched is None or len(mount_point) > len(matched["mount_point"]):
+                    matched = mount
+        return matched
+
+    def is_running(self, pattern: str) -> bool:
+        return any(pattern in cmdline for cmdline in self.processes)
+
+    def refresh(self, *names: str) -> None:
+        """
+        重新探测指定的信息（安装 rpm、启动服务之后）, 不指定时全部重新探测
+        """
+        if not names:
+            self._facts.clear()
+        for name in names:
+            self._facts.pop(name, None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        探测所有信息
+        """
+        names = [
+            name
+            for name, value in vars(type(self)).items()
+            if isinstance(value, property) and getattr(value.fget, "__fact__", False)
+        ]
+        return {name: getattr(self, name) for name in names}
+
+    def dump(self, facts_file: Optional[str] = None) -> Optional[Path]:
+        """
+        写入 json 文件, 先写临时文件再 rename, 读取方不会读到一半的内容
+        """
+        facts_file = facts_file or HOST_FACTS_FILE
+        if not facts_file:
+            return None
+        path = Path(facts_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(
+            json.dumps(self.to_dict(), indent=2, sort_keys=True), encoding="utf-8"
+        )
+        os.replace(tmp_path.as_posix(), path.as_posix())
+        logger.info(f"Host facts saved to {path}")
+        return path
+
+
+@lru_cache(maxsize=None)
+def get_host_facts() -> HostFacts:
+    """
+    进程内共用的主机信息快照
+    """
+    return HostFacts()
@@ -1,5 +1,25 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import re
+import socket
 import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from constants import (
+    LOG_FILE,
+    LOG_FILE_BACKUP_COUNT,
+    LOG_FILE_LEVEL,
+    LOG_FILE_MAX_BYTES,
+    LOG_LEVEL,
+)
 
 COLORS = {
     "DEBUG": "\033[92m",  # Green
@@ -9,32 +29,209 @@ COLORS = {
     "CRITICAL": "\033[91;1m",  # Bold red
     "RESET": "\033[0m",  # Reset color
 }
+ANSI_PATTERN = re.compile(r"\033\[[0-9;]*m")
+# json 日志中的结构化字段, 通过 extra 或 log_context 设置
+STRUCTURED_FIELDS = ("phase", "tool", "command", "category", "duration", "returncode")
+HOSTNAME = socket.gethostname()
 
 
 class ColorFormatter(logging.Formatter):
     """Custom color log formatter"""
 
     def format(self, record):
+        if getattr(record, "stream", False):
+            # 子进程输出原样显示
+            return record.getMessage()
         color = COLORS.get(record.levelname, COLORS["RESET"])
         message = super().format(record)
         return f"{color}{message}{COLORS['RESET']}"
 
 
-# Configure logging system
-def setup_logger():
-    logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
-
-    # Console output
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(
-        ColorFormatter(
-            "[%(asctime)s] [%(levelname)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志一行 json: time、level、host、pid、message 以及 STRUCTURED_FIELDS 中已设置的字段
+    """
+
+    def format(self, record):
+        data: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "host": HOSTNAME,
+            "pid": record.process,
+            "message": ANSI_PATTERN.sub("", record.getMessage()),
+        }
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class ConsoleFilter(logging.Filter):
+    """
+    extra={"console": False} 的日志只写入日志文件（例如阶段耗时）
+    """
+
+    def filter(self, record):
+        return getattr(record, "console", True)
+
+
+_context = threading.local()
+
+
+def get_log_context() -> Dict[str, Any]:
+    return getattr(_context, "fields", {})
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    上下文中（当前线程）的日志都带上这些字段, 例如 phase、tool
+    """
+    previous = get_log_context()
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """
+    调用方线程只把日志记录放入队列, 格式化和输出（终端、文件）在日志线程中完成,
+    终端输出慢（例如 ssh 会话、大量 rpm 输出）时不会阻塞安装
+    """
+
+    def prepare(self, record):
+        # 默认的 prepare 会在调用方线程中格式化消息, 这里只附加上下文字段
+        for name, value in get_log_context().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return record
+
+
+def _get_level(name: str) -> int:
+    level = logging.getLevelName(name)
+    return level if isinstance(level, int) else logging.DEBUG
+
+
+def _create_file_handler(path: str) -> Optional[logging.Handler]:
+    directory = os.path.dirname(path) or "."
+    if not os.path.isdir(directory) or not os.access(directory, os.W_OK):
+        return None
+    try:
+        handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=LOG_FILE_MAX_BYTES,
+            backupCount=LOG_FILE_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    except OSError:
+        return None
+    handler.setFormatter(JsonFormatter())
+    handler.setLevel(_get_level(LOG_FILE_LEVEL))
+    return handler
+
+
+class LogPipeline:
+    """
+    日志流水线: root logger -> ContextQueueHandler -> 队列 -> QueueListener -> 控制台 / json 日志文件
+    root logger 的级别取各输出端级别的最小值, 低于该级别的日志在创建记录前就被丢弃;
+    各输出端在格式化前按自己的级别过滤
+    """
+
+    def __init__(self):
+        self.handlers: List[logging.Handler] = []
+        self.file_handler: Optional[logging.Handler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    @property
+    def file_enabled(self) -> bool:
+        return self.file_handler is not None
+
+    def start(self) -> logging.Logger:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(
+            ColorFormatter(
+                "[%(asctime)s] [%(levelname)s] %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S",
+            )
         )
-    )
+        console_handler.setLevel(_get_level(LOG_LEVEL))
+        console_handler.addFilter(ConsoleFilter())
+        self.handlers = [console_handler]
+        self.file_handler = _create_file_handler(LOG_FILE)
+        if self.file_handler is not None:
+            self.handlers.append(self.file_handler)
+
+        log_queue: queue.Queue = queue.Queue(-1)
+        self.listener = logging.handlers.QueueListener(
+            log_queue, *self.handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.stop)
+
+        root = logging.getLogger()
+        root.setLevel(min(handler.level for handler in self.handlers))
+        root.addHandler(ContextQueueHandler(log_queue))
+        return root
 
-    logger.addHandler(console_handler)
-    return logger
+    def stop(self) -> None:
+        """
+        输出队列中剩余的日志, 进程退出时自动调用
+        """
+        listener, self.listener = self.listener, None
+        if listener is None:
+            return
+        listener.stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+pipeline = LogPipeline()
+
+
+# Configure logging system
+def setup_logger():
+    return pipeline.start()
 
 
 logger = setup_logger()
+# 子进程输出
+command_logger = logging.getLogger("aio.command")
+
+
+@contextmanager
+def log_span(name: str, category: str, attrs: Dict[str, Any]):
+    """
+    阶段内的日志带上 phase（命令带上 command）和 tool 字段,
+    启用 json 日志文件时, 结束后在日志文件中记录耗时
+    """
+    fields: Dict[str, Any] = {"command" if category == "command" else "phase": name}
+    tool = attrs.get("tool") or attrs.get("tools")
+    if tool:
+        fields["tool"] = tool if isinstance(tool, str) else ",".join(map(str, tool))
+    if not pipeline.file_enabled:
+        with log_context(**fields):
+            yield
+        return
+    start = time.perf_counter()
+    try:
+        with log_context(**fields):
+            yield
+    finally:
+        # 启用性能分析时, 命令的 returncode 由 Command 写入 span 的 attrs
+        logger.debug(
+            f"{category} {name} finished",
+            extra={
+                **fields,
+                "category": category,
+                "duration": round(time.perf_counter() - start, 6),
+                "returncode": attrs.get("returncode"),
+                "console": False,
+            },
+        )
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.log_base import logger
+from utils.version_reader import read_version
+
+# manifest 格式版本, 不兼容的变化时加一
+MANIFEST_SCHEMA_VERSION = 1
+# 版本探测、文件哈希的并发数
+MANIFEST_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+
+def hash_file(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def iter_files(path: Path) -> Iterator[Path]:
+    """
+    遍历文件和软链（不跟随软链）, 按路径排序
+    """
+    if path.is_symlink() or path.is_file():
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            yield Path(root).joinpath(name)
+        # os.walk 不会把指向目录的软链放在 files 中
+        for name in dirs:
+            if Path(root).joinpath(name).is_symlink():
+                yield Path(root).joinpath(name)
+
+
+class ManifestBuilder:
+    """
+    打包时探测 package.tar.gz 中 tools/ 目录, 生成 manifest.json
+        {
+            "schema": 1,
+            "created": "2025-10-20 12:30:00",
+            "files": {"fs-tools/x86_64/fsdeamon/fsdeamon": [size, sha256], ...},
+            "tools": {
+                "x86_64": {
+                    "fsdeamon": {
+                        "version": "1.0.0.1",
+                        "path": "fs-tools/x86_64/fsdeamon/fsdeamon",
+                        "dirs": ["fs-tools"],
+                        "file_count": 10,
+                        "bytes": 4096,
+                        "sha256": "..."
+                    }
+                }
+            }
+        }
+    路径都相对于 tools/ 目录; 软链记为 [-1, 链接目标]
+    其他架构的二进制文件不能执行, 只使用 reader 读取版本
+    """
+
+    def __init__(self, tools_root: Path, host_arch: str, workers: int = 0):
+        self.tools_root = tools_root
+        self.host_arch = host_arch
+        self.workers = workers or MANIFEST_WORKERS
+
+    def _relative(self, path: Path) -> Optional[str]:
+        try:
+            return path.relative_to(self.tools_root).as_posix()
+        except ValueError:
+            return None
+
+    def _get_tool_paths(self, tool) -> List[Path]:
+        """
+        工具对应的文件或目录: replace_dirs, 没有 replace_dirs 时为工具文件本身
+        """
+        paths = [Path(item["path"]) for item in tool.get_replace_dirs]
+        return paths or [tool.path]
+
+    def _probe_version(self, tool) -> str:
+        if tool.reader is not None:
+            version = read_version(tool.reader, tool.path, tool.parse)
+            if version:
+                return version
+        if tool.command is None or tool.arch != self.host_arch:
+            return ""
+        # 延迟导入, aio_tools 依赖本模块
+        from utils.aio_tools import ToolCommand
+
+        try:
+            return ToolCommand(tool).get_version() or ""
+        except OSError as e:
+            logger.warning(f"Failed to probe {tool.name} version: {e}")
+            return ""
+
+    def _stat_file(self, path: Path) -> Tuple[int, str]:
+        if path.is_symlink():
+            return -1, os.readlink(path.as_posix())
+        return path.stat().st_size, hash_file(path)
+
+    def build(self, tools_by_arch: Dict[str, List[Any]]) -> Dict[str, Any]:
+        """
+        Args:
+            tools_by_arch: {arch: [ToolInfo, ...]}, tools_path 为解压后的 tools/ 目录
+        """
+        tool_files: Dict[Tuple[str, str], List[str]] = dict()
+        tool_dirs: Dict[Tuple[str, str], List[str]] = dict()
+        probe_tools = []
+        for arch, tools in tools_by_arch.items():
+            for tool in tools:
+                if self._relative(tool.path) is None or not tool.path.exists():
+                    # 不在安装包中的工具, 例如 airflow、cdm
+                    continue
+                paths = [path for path in self._get_tool_paths(tool) if path.exists()]
+                tool_dirs[(arch, tool.name)] = [self._relative(p) for p in paths]
+                tool_files[(arch, tool.name)] = [
+                    self._relative(file) for path in paths for file in iter_files(path)
+                ]
+                probe_tools.append((arch, tool))
+        all_files = sorted({file for files in tool_files.values() for file in files})
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            versions = executor.map(
+                lambda item: self._probe_version(item[1]), probe_tools
+            )
+            stats = executor.map(
+                lambda file: self._stat_file(self.tools_root.joinpath(file)), all_files
+            )
+            files = dict(zip(all_files, stats))
+            versions = list(versions)
+        result: Dict[str, Any] = {
+            "schema": MANIFEST_SCHEMA_VERSION,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "files": {name: list(value) for name, value in files.items()},
+            "tools": {arch: dict() for arch in tools_by_arch},
+        }
+        for (arch, tool), version in zip(probe_tools, versions):
+            names = tool_files[(arch, tool.name)]
+            sha256 = hashlib.sha256()
+            for name in names:
+                sha256.update(f"{name}\0{files[name][1]}\n".encode("utf-8"))
+            result["tools"][arch][tool.name] = {
+                "version": version,
+                "path": self._relative(tool.path),
+                "dirs": tool_dirs[(arch, tool.name)],
+                "file_count": len(names),
+                "bytes": sum(max(files[name][0], 0) for name in names),
+                "sha256": sha256.hexdigest(),
+            }
+        return result
+
+
+class PackageManifest:
+    """
+    安装时读取 manifest.json, 不需要在目标端执行安装包中的二进制文件
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    @classmethod
+    def load(cls, manifest_file: Path) -> Optional["PackageManifest"]:
+        """
+        manifest 不存在或格式不兼容时返回 None, 调用方回退到 version.txt
+        """
+        if not manifest_file.exists():
+            return None
+        try:
+            data = json.loads(manifest_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load manifest {manifest_file}: {e}")
+            return None
+        if data.get("schema") != MANIFEST_SCHEMA_VERSION:
+            logger.warning(f"Unsupported manifest schema: {data.get('schema')}")
+            return None
+        return cls(data)
+
+    def save(self, manifest_file: Path) -> Path:
+        manifest_file.write_text(
+            json.dumps(self.data, indent=2, sort_keys=True), encoding="utf-8"
+        )
+        return manifest_file
+
+    @property
+    def files(self) -> Dict[str, List[Any]]:
+        return self.data.get("files", {})
+
+    def get_tools(self, arch: str) -> Dict[str, Dict[str, Any]]:
+        return self.data.get("tools", {}).get(arch, {})
+
+    def get_versions(self, arch: str) -> Dict[str, str]:
+        """
+        安装包中的工具版本, 忽略探测不到版本的工具
+        """
+        return {
+            name: info["version"]
+            for name, info in self.get_tools(arch).items()
+            if info.get("version")
+        }
+
+    def iter_files_under(self, relative_path: str) -> Iterator[Tuple[str, List[Any]]]:
+        """
+        relative_path 本身或其目录下的所有文件
+        """
+        prefix = relative_path.rstrip("/") + "/"
+        for name, value in self.files.items():
+            if name == relative_path or name.startswith(prefix):
+                yield name, value
+
+    def get_bytes(self, relative_paths: List[str]) -> int:
+        """
+        多个文件或目录的总大小, 重叠部分只计算一次
+        """
+        names = {
+            name for path in relative_paths for name, _ in self.iter_files_under(path)
+        }
+        return sum(max(self.files[name][0], 0) for name in names)
+
+    def verify(self, relative_path: str, target_root: Path) -> List[str]:
+        """
+        校验复制到目标端的文件与 manifest 一致
+        Args:
+            relative_path: 相对于 tools/ 的文件或目录
+            target_root: 目标端工具目录, 即 TOOLS_PATH
+        Returns:
+            list: 不一致的文件
+        """
+        mismatched = []
+        for name, (size, digest) in self.iter_files_under(relative_path):
+            target = target_root.joinpath(name)
+            try:
+                if size < 0:
+                    matched = os.readlink(target.as_posix()) == digest
+                else:
+                    matched = (
+                        target.stat().st_size == size and hash_file(target) == digest
+                    )
+            except OSError:
+                matched = False
+            if not matched:
+                mismatched.append(target.as_posix())
+        return mismatched
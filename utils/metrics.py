@@ -0,0 +1,291 @@
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from constants import METRICS_DIR
+from utils.log_base import logger
+from utils.timeline import timeline
+
+# 阶段耗时直方图的桶（秒）
+PHASE_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800)
+# 工具版本、探测耗时写入同一个文件, 安装和 changelog-updater 都会更新
+TOOLS_METRICS_FILE = "aio_tools.prom"
+# 跨安装累加的指标, 写入前与上一次的文件合并
+CUMULATIVE_METRICS = (
+    "aio_install_runs_total",
+    "aio_install_phase_duration_seconds_bucket",
+    "aio_install_phase_duration_seconds_sum",
+    "aio_install_phase_duration_seconds_count",
+)
+SAMPLE_PATTERN = re.compile(r"^(\w+)(\{.*\})? (\S+)$")
+HISTOGRAM_SUFFIX_PATTERN = re.compile(r"_(bucket|sum|count)$")
+
+HELP = {
+    "aio_install_last_result": (
+        "gauge",
+        "Result of the last run, 1 success, 0 failure.",
+    ),
+    "aio_install_last_timestamp_seconds": ("gauge", "Unix time the last run finished."),
+    "aio_install_last_duration_seconds": ("gauge", "Duration of the last run."),
+    "aio_install_last_bytes": (
+        "gauge",
+        "Bytes extracted or copied by the last run.",
+    ),
+    "aio_install_runs_total": ("counter", "Runs by result."),
+    "aio_install_phase_duration_seconds": ("histogram", "Duration of install phases."),
+    "aio_tool_version_info": ("gauge", "Installed tool version, 0 if not installed."),
+    "aio_tool_probe_duration_seconds": (
+        "gauge",
+        "Latency of the last tool version probe.",
+    ),
+    "aio_tools_last_timestamp_seconds": (
+        "gauge",
+        "Unix time the tool versions were probed.",
+    ),
+}
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels: str) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(round(float(value), 6))
+
+
+def get_tar_bytes(tar) -> int:
+    """
+    tar 中普通文件的总大小, 在 extractall 之后调用不需要再读取一次
+    """
+    return sum(member.size for member in tar.getmembers() if member.isfile())
+
+
+class MetricsFile:
+    """
+    node-exporter textfile 格式, 同一个指标的样本写在一起
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[Tuple[str, float]]] = dict()
+
+    def add(self, family: str, name: str, labels: str, value: float) -> None:
+        self.samples.setdefault(family, []).append((f"{name}{labels}", value))
+
+    def render(self) -> str:
+        lines = []
+        for family, samples in self.samples.items():
+            metric_type, description = HELP[family]
+            lines.append(f"# HELP {family} {description}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            lines.extend(f"{key} {_format_value(value)}" for key, value in samples)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: Path) -> None:
+        """
+        先写到同目录下的临时文件（node-exporter 只读取 .prom）, 再 rename, 不会读到写了一半的文件
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=path.parent.as_posix(), prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path.as_posix())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def load_samples(path: Path) -> Dict[str, float]:
+    """
+    读取上一次写入的累加指标, {"name{labels}": value}
+    """
+    result: Dict[str, float] = dict()
+    if not path.exists():
+        return result
+    try:
+        content = path.read_text(encoding="utf-8")
+    except OSError:
+        return result
+    for line in content.splitlines():
+        match = SAMPLE_PATTERN.match(line)
+        if match is None or match.group(1) not in CUMULATIVE_METRICS:
+            continue
+        try:
+            result[f"{match.group(1)}{match.group(2) or ''}"] = float(match.group(3))
+        except ValueError:
+            continue
+    return result
+
+
+class InstallMetrics:
+    """
+    安装指标, 安装结束后写入 node-exporter textfile 采集目录（METRICS_DIR）:
+    - aio_<name>.prom: 最近一次的结果、时间、耗时、解压/复制的字节数,
+      以及跨安装累加的运行次数和阶段耗时直方图
+    - aio_tools.prom: 每个工具的版本（label）和版本探测耗时
+    阶段耗时来自 timeline, 采集目录可写时才启用 timeline, 否则没有额外开销
+    """
+
+    def __init__(self, metrics_dir: str = METRICS_DIR):
+        self.metrics_dir = Path(metrics_dir) if metrics_dir else None
+        self.result: Optional[bool] = None
+        self.bytes: Dict[str, int] = dict()
+        self.tool_versions: Dict[str, str] = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return (
+            self.metrics_dir is not None
+            and self.metrics_dir.is_dir()
+            and os.access(self.metrics_dir.as_posix(), os.W_OK)
+        )
+
+    def add_bytes(self, kind: str, size: int) -> None:
+        """
+        Args:
+            kind: extracted / copied
+            size: 字节数
+        """
+        self.bytes[kind] = self.bytes.get(kind, 0) + size
+
+    def set_tool_versions(self, versions: Dict[str, str]) -> None:
+        """
+        记录探测到的工具版本, 空版本表示未安装
+        """
+        for name, version in versions.items():
+            if version or name not in self.tool_versions:
+                self.tool_versions[name] = version or ""
+
+    def _add_phases(self, metrics_file: MetricsFile, installer: str) -> None:
+        family = "aio_install_phase_duration_seconds"
+        durations: Dict[str, List[float]] = dict()
+        for span in timeline.spans:
+            if span.category != "command":
+                durations.setdefault(span.name, []).append(span.duration)
+        for phase, values in sorted(durations.items()):
+            for bucket in PHASE_BUCKETS:
+                metrics_file.add(
+                    family,
+                    f"{family}_bucket",
+                    _labels(installer=installer, phase=phase, le=str(bucket)),
+                    sum(1 for value in values if value <= bucket),
+                )
+            metrics_file.add(
+                family,
+                f"{family}_bucket",
+                _labels(installer=installer, phase=phase, le="+Inf"),
+                len(values),
+            )
+            labels = _labels(installer=installer, phase=phase)
+            metrics_file.add(family, f"{family}_sum", labels, sum(values))
+            metrics_file.add(family, f"{family}_count", labels, len(values))
+
+    def save_install(self, name: str, duration: float) -> Path:
+        path = self.metrics_dir.joinpath(f"aio_{name}.prom")
+        metrics_file = MetricsFile()
+        now = time.time()
+        for family, value in [
+            ("aio_install_last_result", 1 if self.result else 0),
+            ("aio_install_last_timestamp_seconds", int(now)),
+            ("aio_install_last_duration_seconds", duration),
+        ]:
+            metrics_file.add(family, family, _labels(installer=name), value)
+        for kind, size in sorted(self.bytes.items()):
+            metrics_file.add(
+                "aio_install_last_bytes",
+                "aio_install_last_bytes",
+                _labels(installer=name, kind=kind),
+                size,
+            )
+        for result in ("success", "failure"):
+            metrics_file.add(
+                "aio_install_runs_total",
+                "aio_install_runs_total",
+                _labels(installer=name, result=result),
+                int((result == "success") == bool(self.result)),
+            )
+        self._add_phases(metrics_file, name)
+        # 与上一次的累加指标合并, 本次没有执行的阶段保留原值
+        previous = load_samples(path)
+        for samples in metrics_file.samples.values():
+            for index, (key, value) in enumerate(samples):
+                if key in previous:
+                    samples[index] = (key, value + previous.pop(key))
+        for key, value in previous.items():
+            sample_name = key.split("{", 1)[0]
+            family = HISTOGRAM_SUFFIX_PATTERN.sub("", sample_name)
+            metrics_file.add(family, sample_name, key[len(sample_name) :], value)
+        metrics_file.write(path)
+        return path
+
+    def save_tools(self) -> Optional[Path]:
+        if not self.tool_versions:
+            return None
+        metrics_file = MetricsFile()
+        for tool, version in sorted(self.tool_versions.items()):
+            metrics_file.add(
+                "aio_tool_version_info",
+                "aio_tool_version_info",
+                _labels(tool=tool, version=version),
+                1 if version else 0,
+            )
+        probes: Dict[str, float] = dict()
+        for span in timeline.spans:
+            if span.name == "version_probe" and "tool" in span.attrs:
+                probes[span.attrs["tool"]] = span.duration
+        for tool, duration in sorted(probes.items()):
+            metrics_file.add(
+                "aio_tool_probe_duration_seconds",
+                "aio_tool_probe_duration_seconds",
+                _labels(tool=tool),
+                duration,
+            )
+        family = "aio_tools_last_timestamp_seconds"
+        metrics_file.add(family, family, "", int(time.time()))
+        path = self.metrics_dir.joinpath(TOOLS_METRICS_FILE)
+        metrics_file.write(path)
+        return path
+
+    @contextmanager
+    def recording(self, name: str, enabled: bool = True, install: bool = True):
+        """
+        记录一次运行, 结束后（包括 sys.exit 退出）写入指标文件
+        调用方在上下文中设置 result, 没有设置（异常退出）时记为失败
+        Args:
+            name: 安装包名称, 例如 install_rdb_agent
+            enabled: 是否记录, 只执行检查等操作时不记录
+            install: 是否写入安装指标, 为 False 时只写入工具版本（changelog-updater）
+        """
+        if not enabled or not self.enabled:
+            yield
+            return
+        timeline.enable()
+        self.result = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            try:
+                if install:
+                    path = self.save_install(name, time.perf_counter() - start)
+                    logger.debug(f"install metrics: {path.as_posix()}")
+                tools_path = self.save_tools()
+                if tools_path is not None:
+                    logger.debug(f"tools metrics: {tools_path.as_posix()}")
+            except OSError as e:
+                logger.warning(f"Failed to write metrics to {self.metrics_dir}: {e}")
+
+
+metrics = InstallMetrics()
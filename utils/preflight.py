@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+from utils.log_base import COLORS, logger
+from utils.timeline import timeline
+
+
+@dataclass
+class CheckResult:
+    name: str
+    passed: bool
+    duration: float = 0.0
+    # 检查抛出异常时的错误信息, 其他原因由检查函数自己输出日志
+    error: str = ""
+
+
+class Preflight:
+    """
+    安装前检查, 所有检查并发执行, 不在第一个失败时停止, 最后输出一张汇总表
+    - 检查之间互相独立, 都只读取主机状态, 不做修改
+    - 安装包校验（PBKDF2、sha256）在 OpenSSL 中执行时释放 GIL, 与 rpm、ps 等子进程检查重叠
+    - 共用的 shell 协进程带锁, 多个线程执行命令时按顺序执行
+    """
+
+    def __init__(self, name: str = "preflight"):
+        self.name = name
+        self.checks: List[Tuple[str, Callable[[], bool]]] = []
+
+    def add(self, name: str, func: Callable[[], bool]) -> "Preflight":
+        """
+        Args:
+            name: 检查名称, 显示在汇总表中
+            func: 检查函数, 返回 True 表示通过
+        """
+        self.checks.append((name, func))
+        return self
+
+    def _run_check(self, name: str, func: Callable[[], bool]) -> CheckResult:
+        start = time.perf_counter()
+        with timeline.span(name, category="preflight"):
+            try:
+                passed, error = bool(func()), ""
+            except Exception as e:
+                logger.error(f"Check {name} failed: {e}")
+                passed, error = False, str(e)
+        return CheckResult(name, passed, time.perf_counter() - start, error)
+
+    def format_results(self, results: List[CheckResult]) -> str:
+        from tabulate import tabulate
+
+        table_data = []
+        for result in results:
+            if result.passed:
+                status = f"{COLORS['DEBUG']}pass{COLORS['RESET']}"
+            else:
+                status = f"{COLORS['ERROR']}fail{COLORS['RESET']}"
+            table_data.append(
+                [result.name, status, f"{result.duration:.2f}s", result.error]
+            )
+        return tabulate(
+            table_data, headers=["check", "result", "time", "error"], tablefmt="pretty"
+        )
+
+    def run(self) -> bool:
+        """
+        Returns:
+            bool: 所有检查都通过时返回 True
+        """
+        if not self.checks:
+            return True
+        with timeline.span(self.name):
+            with ThreadPoolExecutor(max_workers=len(self.checks)) as executor:
+                futures = [
+                    executor.submit(self._run_check, name, func)
+                    for name, func in self.checks
+                ]
+                # 按添加顺序输出
+                results = [future.result() for future in futures]
+        table = self.format_results(results)
+        failed = [result.name for result in results if not result.passed]
+        if failed:
+            logger.error(
+                f"Preflight failed: {', '.join(failed)}, fix them and retry.\n{table}"
+            )
+            return False
+        logger.info(f"Preflight passed:\n{table}")
+        return True
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from constants import PROBE_CACHE_FILE
+from utils.log_base import logger
+
+# 缓存格式版本, 格式变化时整体失效
+CACHE_SCHEMA_VERSION = 1
+
+
+def get_file_identity(path: Path, use_hash: bool = False) -> Optional[List[Any]]:
+    """
+    文件标识: [st_dev, st_ino, st_size, st_mtime_ns, sha256]
+    文件被替换、重新写入时标识一定会变化（sha256 只在 use_hash 时计算）
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    digest = ""
+    if use_hash:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, digest]
+
+
+def get_rule_fingerprint(
+    command: Optional[List[str]],
+    parse: Optional[Callable[[str], str]],
+    reader: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    版本探测规则指纹: 命令、reader 和解析函数的字节码, TOOLS 中的规则变化时缓存失效
+    """
+    sha1 = hashlib.sha1(json.dumps([command, reader], sort_keys=True).encode("utf-8"))
+    code = getattr(parse, "__code__", None)
+    if code is not None:
+        sha1.update(code.co_code)
+        sha1.update(repr(code.co_consts).encode("utf-8"))
+    return sha1.hexdigest()
+
+
+class ProbeCache:
+    """
+    工具版本探测缓存, 以工具二进制文件的标识为 key, 标识不变时不再执行二进制文件
+        {"schema": 1, "entries": {"<path>": {"identity": [...], "rule": "...", "version": "..."}}}
+    - AIO_PROBE_CACHE=0: 关闭缓存
+    - AIO_PROBE_CACHE_HASH=1: 标识中包含文件 sha256, 更严格但需要读取整个文件
+    """
+
+    def __init__(self, cache_file: str = PROBE_CACHE_FILE):
+        self.cache_file = Path(cache_file)
+        self.enabled = os.getenv("AIO_PROBE_CACHE", "1") != "0"
+        self.use_hash = os.getenv("AIO_PROBE_CACHE_HASH", "0") == "1"
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @property
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = self._load()
+        return self._entries
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.enabled or not self.cache_file.exists():
+            return dict()
+        try:
+            data = json.loads(self.cache_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return dict()
+        if data.get("schema") != CACHE_SCHEMA_VERSION:
+            return dict()
+        return data.get("entries", dict())
+
+    def get(self, path: Path, rule: str) -> Optional[str]:
+        """
+        获取缓存的版本, 文件标识或探测规则变化时返回 None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self.entries.get(path.as_posix())
+        if not entry or entry.get("rule") != rule:
+            return None
+        if entry.get("identity") != get_file_identity(path, self.use_hash):
+            return None
+        return entry.get("version")
+
+    def set(self, path: Path, rule: str, version: str) -> None:
+        if not self.enabled:
+            return
+        identity = get_file_identity(path, self.use_hash)
+        if identity is None:
+            return
+        with self._lock:
+            self.entries[path.as_posix()] = {
+                "identity": identity,
+                "rule": rule,
+                "version": version,
+            }
+            self._dirty = True
+
+    def invalidate(self, path: Path) -> None:
+        """
+        删除 path 本身以及 path 目录下所有文件的缓存, 复制工具后调用
+        """
+        if not self.enabled:
+            return
+        prefix = path.as_posix().rstrip("/") + "/"
+        with self._lock:
+            for key in list(self.entries):
+                if key == path.as_posix() or key.startswith(prefix):
+                    self.entries.pop(key)
+                    self._dirty = True
+
+    def save(self) -> None:
+        """
+        写入缓存文件（临时文件 + rename）, 写入失败不影响安装流程
+        """
+        if not self.enabled or not self._dirty:
+            return
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.cache_file.with_name(f".{self.cache_file.name}.tmp")
+            with self._lock:
+                content = json.dumps(
+                    {"schema": CACHE_SCHEMA_VERSION, "entries": self.entries},
+                    sort_keys=True,
+                )
+                self._dirty = False
+            tmp_file.write_text(content, encoding="utf-8")
+            os.replace(tmp_file.as_posix(), self.cache_file.as_posix())
+        except OSError as e:
+            logger.warning(f"Failed to save tools version cache: {e}")
@@ -0,0 +1,525 @@
+import json
+import shlex
+import shutil
+import statistics
+import subprocess
+import tarfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from constants import AIO_LOGS_DIR, PackageFilenameEnum
+from utils.command import get_base_env
+from utils.log_base import COLORS, logger
+from utils.staging import normalize_member_name
+
+# 部署步骤, 按顺序执行
+ROLLOUT_STEPS = ["push", "unpack", "check", "install", "collect"]
+# 目标主机上存放安装包的目录
+DEFAULT_REMOTE_DIR = "/root/aio-rollout"
+DEFAULT_SSH_OPTIONS = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=10"]
+
+
+class RolloutError(RuntimeError):
+    pass
+
+
+class Transport(ABC):
+    """
+    在目标主机上执行命令、传输文件
+    所有子进程的标准输入都是 /dev/null, 多个主机并发执行时不会争抢终端
+    """
+
+    def __init__(self, host: Dict[str, Any]):
+        self.host = host
+
+    def _run(
+        self, args: List[str], timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            args,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            universal_newlines=True,
+            env=get_base_env(),
+        )
+
+    @abstractmethod
+    def run(
+        self, command: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        """
+        在目标主机上通过 bash 执行命令
+        """
+
+    @abstractmethod
+    def put(
+        self, local: Path, remote: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        """
+        上传本地文件到目标主机
+        """
+
+    @abstractmethod
+    def get(
+        self, remote: str, local: Path, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        """
+        从目标主机下载文件
+        """
+
+
+class SSHTransport(Transport):
+    """
+    ssh / scp, 需要提前配置免密登录
+    """
+
+    def __init__(self, host: Dict[str, Any]):
+        super().__init__(host)
+        self.target = f"{host.get('user', 'root')}@{host['address']}"
+        self.port = str(host.get("port", 22))
+        self.options = host.get("ssh_options", DEFAULT_SSH_OPTIONS)
+
+    def run(
+        self, command: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(
+            ["ssh", "-p", self.port, *self.options, self.target, command], timeout
+        )
+
+    def put(
+        self, local: Path, remote: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(
+            [
+                "scp",
+                "-P",
+                self.port,
+                *self.options,
+                str(local),
+                f"{self.target}:{remote}",
+            ],
+            timeout,
+        )
+
+    def get(
+        self, remote: str, local: Path, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(
+            [
+                "scp",
+                "-P",
+                self.port,
+                *self.options,
+                f"{self.target}:{remote}",
+                str(local),
+            ],
+            timeout,
+        )
+
+
+class LocalTransport(Transport):
+    """
+    在本机执行, 用于测试部署流程, 每个主机配置不同的 remote_dir
+    """
+
+    def run(
+        self, command: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(["/bin/bash", "-c", command], timeout)
+
+    def _copy(self, src: str, dst: str) -> subprocess.CompletedProcess:
+        try:
+            shutil.copy(src, dst)
+        except OSError as e:
+            return subprocess.CompletedProcess(["cp", src, dst], 1, "", f"{e}\n")
+        return subprocess.CompletedProcess(["cp", src, dst], 0, "", "")
+
+    def put(
+        self, local: Path, remote: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._copy(str(local), remote)
+
+    def get(
+        self, remote: str, local: Path, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._copy(remote, str(local))
+
+
+class ContainerTransport(Transport):
+    """
+    docker / podman 容器, 用于在一台机器上模拟多台主机
+    """
+
+    def __init__(self, host: Dict[str, Any]):
+        super().__init__(host)
+        self.engine = host.get("engine", "docker")
+        self.container = host.get("container", host["address"])
+
+    def run(
+        self, command: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(
+            [self.engine, "exec", self.container, "/bin/bash", "-c", command], timeout
+        )
+
+    def put(
+        self, local: Path, remote: str, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(
+            [self.engine, "cp", str(local), f"{self.container}:{remote}"], timeout
+        )
+
+    def get(
+        self, remote: str, local: Path, timeout: Optional[int] = None
+    ) -> subprocess.CompletedProcess:
+        return self._run(
+            [self.engine, "cp", f"{self.container}:{remote}", str(local)], timeout
+        )
+
+
+TRANSPORTS = {
+    "ssh": SSHTransport,
+    "local": LocalTransport,
+    "container": ContainerTransport,
+}
+
+
+def load_inventory(inventory_file: Path) -> List[Dict[str, Any]]:
+    """
+    主机清单, json 格式, defaults 中的配置会合并到每个主机
+        {
+            "defaults": {
+                "transport": "ssh", "user": "root", "port": 22, "install_args": ["-f"],
+                "answers": {"server_ip": "10.0.0.2", "build_kernel": "y"}
+            },
+            "hosts": [{"name": "agent-01", "address": "10.0.0.11"}, ...]
+        }
+    也可以直接是主机列表; answers 是安装过程中问题的答案, 主机中的答案与 defaults 合并
+    """
+    data = json.loads(inventory_file.read_text(encoding="utf-8"))
+    if isinstance(data, list):
+        data = {"hosts": data}
+    defaults = data.get("defaults", {})
+    hosts = []
+    for item in data.get("hosts", []):
+        if isinstance(item, str):
+            item = {"address": item}
+        host = {**defaults, **item}
+        host["answers"] = {**defaults.get("answers", {}), **item.get("answers", {})}
+        if "address" not in host:
+            raise ValueError(f"host address is required: {item}")
+        host.setdefault("name", host["address"])
+        host.setdefault("transport", "ssh")
+        if host["transport"] not in TRANSPORTS:
+            raise ValueError(f"unsupported transport: {host['transport']}")
+        hosts.append(host)
+    names = [host["name"] for host in hosts]
+    if len(set(names)) != len(names):
+        raise ValueError("host names in inventory must be unique")
+    return hosts
+
+
+def get_package_root(package: Path) -> str:
+    """
+    build.py 生成的安装包中的顶层目录
+    """
+    with tarfile.open(package.as_posix(), "r|*") as tar:
+        for member in tar:
+            return normalize_member_name(member.name).split("/", 1)[0]
+    raise ValueError(f"empty package: {package}")
+
+
+@dataclass
+class HostResult:
+    name: str
+    address: str
+    # success / failed / skipped
+    status: str = "skipped"
+    # 失败的步骤
+    failed_step: str = ""
+    error: str = ""
+    durations: Dict[str, float] = field(default_factory=dict)
+    log_file: str = ""
+
+    @property
+    def total(self) -> float:
+        return sum(self.durations.values())
+
+
+class Rollout:
+    """
+    批量部署: 推送安装包、解压、在目标主机上执行安装前检查（./install --check, 包含安装包校验）、安装、收集结果
+    - 先部署 canary 个主机, 全部成功后再部署其余主机
+    - 最多 concurrency 个主机同时部署
+    - 失败主机数超过 max_failures（允许失败的主机数）后不再开始新的主机, -1 表示不限制
+    每个主机的命令输出写到 log_dir/<name>.log, 最后输出汇总表并写入 log_dir/report.json
+    """
+
+    def __init__(
+        self,
+        package: Path,
+        hosts: List[Dict[str, Any]],
+        log_dir: Path,
+        concurrency: int = 10,
+        canary: int = 1,
+        max_failures: int = 0,
+        check_only: bool = False,
+        profile: bool = False,
+        timeout: Optional[int] = None,
+    ):
+        self.package = package
+        self.hosts = hosts
+        self.log_dir = log_dir
+        self.concurrency = max(concurrency, 1)
+        self.canary = max(canary, 0)
+        self.max_failures = max_failures
+        self.check_only = check_only
+        self.profile = profile
+        self.timeout = timeout
+        self.package_root = get_package_root(package)
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def _log(self, log_file: Path, text: str) -> None:
+        with open(log_file, "a", encoding="utf-8") as f:
+            f.write(text)
+
+    def _step(
+        self,
+        result: HostResult,
+        log_file: Path,
+        name: str,
+        description: str,
+        func: Callable[[], subprocess.CompletedProcess],
+    ) -> subprocess.CompletedProcess:
+        """
+        执行一个步骤, 同一步骤可以包含多条命令, 耗时累加
+        """
+        start = time.perf_counter()
+        try:
+            process = func()
+        except (OSError, subprocess.TimeoutExpired) as e:
+            process = subprocess.CompletedProcess(description, 255, "", f"{e}\n")
+        elapsed = time.perf_counter() - start
+        result.durations[name] = round(result.durations.get(name, 0) + elapsed, 3)
+        self._log(
+            log_file,
+            f"==> [{datetime.now():%Y-%m-%d %H:%M:%S}] {name}: {description}\n"
+            f"{process.stdout}{process.stderr}"
+            f"<== returncode={process.returncode} duration={elapsed:.3f}s\n\n",
+        )
+        if process.returncode != 0:
+            result.failed_step = name
+            lines = (process.stderr or process.stdout).strip().splitlines()
+            raise RolloutError(
+                lines[-1] if lines else f"returncode {process.returncode}"
+            )
+        return process
+
+    def _deploy(self, host: Dict[str, Any]) -> HostResult:
+        result = HostResult(host["name"], host["address"])
+        with self._lock:
+            if 0 <= self.max_failures < self._failures:
+                result.error = "too many failures"
+                return result
+        log_file = self.log_dir.joinpath(f"{host['name']}.log")
+        result.log_file = log_file.as_posix()
+        transport: Transport = TRANSPORTS[host["transport"]](host)
+        timeout = self.timeout
+        remote_dir = host.get("remote_dir", DEFAULT_REMOTE_DIR)
+        remote_package = f"{remote_dir}/{self.package.name}"
+        package_dir = shlex.quote(f"{remote_dir}/{self.package_root}")
+        install = f"./{PackageFilenameEnum.INSTALL.value}"
+        # 标准输入是 /dev/null, 安装过程中的问题都由 answers 回答, 缺少答案时安装前检查失败
+        answer_args = ["--non-interactive"] + [
+            shlex.quote(f"--answer={key}={value}")
+            for key, value in host.get("answers", {}).items()
+        ]
+        install_args = [shlex.quote(arg) for arg in host.get("install_args", [])]
+        install_args += answer_args
+        if self.profile:
+            install_args.append("--profile")
+
+        def run_step(name: str, command: str) -> subprocess.CompletedProcess:
+            return self._step(
+                result, log_file, name, command, lambda: transport.run(command, timeout)
+            )
+
+        try:
+            run_step("push", f"mkdir -p {shlex.quote(remote_dir)}")
+            self._step(
+                result,
+                log_file,
+                "push",
+                f"put {self.package} {remote_package}",
+                lambda: transport.put(self.package, remote_package, timeout),
+            )
+            run_step(
+                "unpack",
+                f"rm -rf {package_dir} && tar -xzf {shlex.quote(remote_package)} "
+                f"-C {shlex.quote(remote_dir)}",
+            )
+            # 安装前检查, 包含安装包校验
+            run_step(
+                "check",
+                " ".join([f"cd {package_dir} &&", install, "--check"] + answer_args),
+            )
+            if not self.check_only:
+                run_step(
+                    "install",
+                    " ".join([f"cd {package_dir} &&", install] + install_args),
+                )
+                if self.profile:
+                    self._collect_profile(transport, host, result, log_file)
+            result.status = "success"
+        except RolloutError as e:
+            result.status = "failed"
+            result.error = str(e)
+            with self._lock:
+                self._failures += 1
+        logger.info(
+            f"{host['name']}: {result.status} in {result.total:.1f}s"
+            + (f", {result.failed_step}: {result.error}" if result.error else "")
+        )
+        return result
+
+    def _collect_profile(
+        self,
+        transport: Transport,
+        host: Dict[str, Any],
+        result: HostResult,
+        log_file: Path,
+    ) -> None:
+        """
+        下载目标主机上最新的耗时报告
+        """
+        logs_dir = shlex.quote(host.get("logs_dir", AIO_LOGS_DIR))
+        command = f"ls -t {logs_dir}/*-profile-*.json | head -1"
+        process = self._step(
+            result,
+            log_file,
+            "collect",
+            command,
+            lambda: transport.run(command, self.timeout),
+        )
+        remote_report = process.stdout.strip()
+        if not remote_report:
+            return
+        local_report = self.log_dir.joinpath(f"{host['name']}-profile.json")
+        self._step(
+            result,
+            log_file,
+            "collect",
+            f"get {remote_report} {local_report}",
+            lambda: transport.get(remote_report, local_report, self.timeout),
+        )
+
+    def _run_batch(self, hosts: List[Dict[str, Any]]) -> List[HostResult]:
+        if not hosts:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(hosts))) as pool:
+            return list(pool.map(self._deploy, hosts))
+
+    def run(self) -> List[HostResult]:
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        canary_hosts = self.hosts[: self.canary]
+        other_hosts = self.hosts[self.canary :]
+        logger.info(
+            f"rollout {self.package.name} to {len(self.hosts)} hosts, "
+            f"canary: {len(canary_hosts)}, concurrency: {self.concurrency}, logs: {self.log_dir}"
+        )
+        results = self._run_batch(canary_hosts)
+        if any(result.status != "success" for result in results):
+            logger.error("canary failed, the other hosts are skipped")
+            results += [
+                HostResult(host["name"], host["address"], error="canary failed")
+                for host in other_hosts
+            ]
+        else:
+            results += self._run_batch(other_hosts)
+        return results
+
+    def report(self, results: List[HostResult], elapsed: float) -> bool:
+        """
+        输出汇总表, 写入 report.json
+        Returns:
+            bool: 所有主机都部署成功时返回 True
+        """
+        from tabulate import tabulate
+
+        steps = [
+            step for step in ROLLOUT_STEPS if any(step in r.durations for r in results)
+        ]
+        table_data = []
+        for result in results:
+            color = COLORS["DEBUG"] if result.status == "success" else COLORS["ERROR"]
+            table_data.append(
+                [result.name, f"{color}{result.status}{COLORS['RESET']}"]
+                + [
+                    f"{result.durations[step]:.1f}" if step in result.durations else ""
+                    for step in steps
+                ]
+                + [f"{result.total:.1f}", result.error[:80]]
+            )
+        summary = dict()
+        for step in steps + ["total"]:
+            values = [
+                result.total if step == "total" else result.durations[step]
+                for result in results
+                if step == "total" or step in result.durations
+            ]
+            if values:
+                summary[step] = {
+                    "p50": round(statistics.median(values), 3),
+                    "max": round(max(values), 3),
+                }
+        table_data.append(
+            ["p50 / max", ""]
+            + [
+                f"{summary[step]['p50']:.1f} / {summary[step]['max']:.1f}"
+                for step in steps + ["total"]
+            ]
+            + [""]
+        )
+        table = tabulate(
+            table_data,
+            headers=["host", "status"] + steps + ["total", "error"],
+            tablefmt="pretty",
+        )
+        counts = {
+            status: sum(1 for result in results if result.status == status)
+            for status in ["success", "failed", "skipped"]
+        }
+        report_file = self.log_dir.joinpath("report.json")
+        report_file.write_text(
+            json.dumps(
+                {
+                    "package": self.package.name,
+                    "elapsed": round(elapsed, 3),
+                    "counts": counts,
+                    "steps": summary,
+                    "hosts": [asdict(result) for result in results],
+                },
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+        passed = counts["success"] == len(results)
+        message = (
+            f"rollout finished in {elapsed:.1f}s, success: {counts['success']}, "
+            f"failed: {counts['failed']}, skipped: {counts['skipped']}, "
+            f"report: {report_file}\n{table}"
+        )
+        if passed:
+            logger.info(message)
+        else:
+            logger.error(message)
+        return passed
@@ -0,0 +1,184 @@
+import tarfile
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from constants import FSBACKUP_OUTPUT_MIN_BYTES, GB_SIZE, INSTALL_ROOT, SPACE_MARGIN
+from utils.copy_plan import CopyOperation, _is_within
+from utils.host_facts import HostFacts, get_host_facts
+from utils.log_base import COLORS, logger
+from utils.staging import TOOLS_ARCHIVE_DIR, normalize_member_name
+
+# rpm、whl 是压缩格式, 安装后的大小按安装包大小的倍数估算
+INSTALL_EXPAND_RATIO = 3
+# 编译内核时生成的目标文件按源码大小的倍数估算
+KERNEL_BUILD_RATIO = 2
+KERNEL_SOURCE_DIR = "fsbackup_kernel_4.x"
+INSTALL_PACKAGE_SUFFIXES = (".rpm", ".whl")
+
+
+@dataclass
+class SpaceRequirement:
+    # 写入位置, 不需要已存在
+    path: str
+    # 用途, 显示在汇总表中
+    purpose: str
+    bytes: int
+
+
+def format_size(size: int) -> str:
+    return f"{size / GB_SIZE:.2f}G"
+
+
+class SpacePlanner:
+    """
+    安装前根据 package.tar.gz 中每个成员的大小（只读取 tar 头, 不解压到磁盘）规划磁盘空间
+    每个写入位置映射到所在的挂载点, 按挂载点汇总后与剩余空间比较:
+        - 解压: PROJECT_DIR/package
+        - 工具: 直接解压到 TOOLS_PATH 旁的暂存路径, 或解压后再复制到 TOOLS_PATH
+        - rpm / whl 安装: /opt
+        - 内核编译: 临时目录
+        - fsbackup 完成后的输出目录: 至少 FSBACKUP_OUTPUT_MIN_BYTES
+    替换工具目录时新旧目录短暂共存, 旧目录占用的空间不扣除
+    """
+
+    def __init__(
+        self,
+        tar_path: Path,
+        package_dir: Path,
+        host_facts: Optional[HostFacts] = None,
+    ):
+        self.tar_path = tar_path
+        self.package_dir = package_dir
+        self.host_facts = host_facts or get_host_facts()
+
+    def scan_archive(self) -> List[Tuple[str, int]]:
+        """
+        Returns:
+            list: [(成员名, 大小), ...], 只包含普通文件
+        """
+        members = []
+        # 流式读取, 跳过文件内容, 不在内存中保留所有 TarInfo
+        with tarfile.open(self.tar_path.as_posix(), "r|*") as tar:
+            for member in tar:
+                if member.isfile():
+                    members.append((normalize_member_name(member.name), member.size))
+        return members
+
+    def _get_tools_target(
+        self, name: str, tools_plan: List[CopyOperation]
+    ) -> Optional[Path]:
+        path = self.package_dir.joinpath(name)
+        for operation in tools_plan:
+            if _is_within(path, operation.src):
+                return operation.dst
+        return None
+
+    def plan(
+        self,
+        tools_plan: Optional[List[CopyOperation]] = None,
+        tools_target: Optional[Path] = None,
+        kernel_build: bool = False,
+        fsbackup_output_dir: Optional[Path] = None,
+    ) -> List[SpaceRequirement]:
+        """
+        Args:
+            tools_plan: 工具复制计划, 工具直接解压到目标路径旁的暂存路径
+            tools_target: 没有复制计划时, 工具解压后复制到的目录
+            kernel_build: 是否会在临时目录中编译内核
+            fsbackup_output_dir: fsbackup 完成后的输出目录（已配置、已回答或默认目录）
+        """
+        requirements: Dict[Tuple[str, str], int] = dict()
+
+        def add(path: Path, purpose: str, size: int) -> None:
+            key = (path.as_posix(), purpose)
+            requirements[key] = requirements.get(key, 0) + size
+
+        prefix = f"{TOOLS_ARCHIVE_DIR}/"
+        for name, size in self.scan_archive():
+            if name.startswith(prefix):
+                if tools_plan is not None:
+                    target = self._get_tools_target(name, tools_plan)
+                    if target is not None:
+                        add(target.parent, "tools staging", size)
+                    # 不需要更新的工具不会被解压
+                    continue
+                add(self.package_dir, "extract", size)
+                if tools_target is not None:
+                    add(tools_target, "tools copy", size)
+                continue
+            add(self.package_dir, "extract", size)
+            if name.endswith(INSTALL_PACKAGE_SUFFIXES):
+                add(Path(INSTALL_ROOT), "rpm/pip install", size * INSTALL_EXPAND_RATIO)
+            elif kernel_build and name.startswith(f"{KERNEL_SOURCE_DIR}/"):
+                add(
+                    Path(tempfile.gettempdir()),
+                    "kernel build",
+                    size * KERNEL_BUILD_RATIO,
+                )
+        if fsbackup_output_dir is not None:
+            add(fsbackup_output_dir, "fsbackup output", FSBACKUP_OUTPUT_MIN_BYTES)
+        return [
+            SpaceRequirement(path, purpose, size)
+            for (path, purpose), size in requirements.items()
+        ]
+
+    def check(
+        self,
+        tools_plan: Optional[List[CopyOperation]] = None,
+        tools_target: Optional[Path] = None,
+        kernel_build: bool = False,
+        fsbackup_output_dir: Optional[Path] = None,
+    ) -> bool:
+        """
+        按挂载点检查剩余空间, 每个挂载点额外保留 SPACE_MARGIN
+        """
+        requirements = self.plan(
+            tools_plan, tools_target, kernel_build, fsbackup_output_dir
+        )
+        mounts: Dict[str, Dict] = dict()
+        for requirement in requirements:
+            mount = self.host_facts.get_mount(Path(requirement.path))
+            mount_point = mount["mount_point"] if mount else "/"
+            info = mounts.setdefault(
+                mount_point,
+                {
+                    "free": mount["free_bytes"] if mount else 0,
+                    "required": SPACE_MARGIN,
+                    "purposes": [],
+                },
+            )
+            info["required"] += requirement.bytes
+            if requirement.purpose not in info["purposes"]:
+                info["purposes"].append(requirement.purpose)
+        table_data = []
+        passed = True
+        for mount_point, info in sorted(mounts.items()):
+            enough = info["free"] >= info["required"]
+            passed = passed and enough
+            if enough:
+                status = f"{COLORS['DEBUG']}enough{COLORS['RESET']}"
+            else:
+                status = f"{COLORS['ERROR']}not enough{COLORS['RESET']}"
+            table_data.append(
+                [
+                    mount_point,
+                    ", ".join(info["purposes"]),
+                    format_size(info["required"]),
+                    format_size(info["free"]),
+                    status,
+                ]
+            )
+        from tabulate import tabulate
+
+        table = tabulate(
+            table_data,
+            headers=["mount", "used by", "required", "free", "status"],
+            tablefmt="pretty",
+        )
+        if passed:
+            logger.info(f"disk space enough:\n{table}")
+        else:
+            logger.error(f"disk space not enough:\n{table}")
+        return passed
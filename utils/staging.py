@@ -0,0 +1,188 @@
+import copy
+import os
+import shutil
+import tarfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from utils.log_base import logger
+from utils.metrics import metrics
+
+# 安装包中工具目录的前缀
+TOOLS_ARCHIVE_DIR = "tools"
+# 暂存目录后缀, 与目标路径位于同一目录（同一文件系统）, 保证可以 rename
+STAGING_SUFFIX = ".aio-staging"
+BACKUP_SUFFIX = ".aio-old"
+
+
+@dataclass
+class StageRoute:
+    # 归档中的路径（相对于 tools/）, 例如 rpc 或 s3-tools/x86_64/mc
+    archive_path: str
+    # 暂存路径, 目录或文件
+    staging_path: Path
+    # file / dir
+    path_type: str
+
+
+def get_staging_path(dst: Path) -> Path:
+    return dst.parent.joinpath(f".{dst.name}{STAGING_SUFFIX}")
+
+
+def normalize_member_name(name: str) -> str:
+    while name.startswith("./"):
+        name = name[2:]
+    return name.rstrip("/")
+
+
+class StagedExtractor:
+    """
+    一次遍历安装包, 将属于复制计划的成员直接解压到目标端的暂存路径, 其余成员（内核源码等）解压到 scratch 目录
+    不在复制计划中的工具文件不会被解压, 每个字节只写一次
+    """
+
+    def __init__(self, tar_path: Path, scratch_dir: Path, routes: List[StageRoute]):
+        self.tar_path = tar_path
+        self.scratch_dir = scratch_dir
+        # 长路径在前, 嵌套的路由优先匹配更深的一个
+        self.routes = sorted(
+            routes, key=lambda route: len(route.archive_path), reverse=True
+        )
+
+    def _route(self, name: str) -> Optional[Tuple[StageRoute, str]]:
+        """
+        返回成员对应的路由和在暂存路径中的相对路径
+        """
+        prefix = f"{TOOLS_ARCHIVE_DIR}/"
+        if not name.startswith(prefix):
+            return None
+        relative = name[len(prefix) :]
+        for route in self.routes:
+            if relative == route.archive_path:
+                return route, ""
+            if route.path_type == "dir" and relative.startswith(
+                route.archive_path + "/"
+            ):
+                return route, relative[len(route.archive_path) + 1 :]
+        return None
+
+    def _target(self, member: tarfile.TarInfo) -> Optional[Tuple[Path, str]]:
+        """
+        返回成员解压的根目录和新的成员名, 不需要解压时返回 None
+        """
+        name = normalize_member_name(member.name)
+        routed = self._route(name)
+        if routed is not None:
+            route, relative = routed
+            if route.path_type == "file":
+                return route.staging_path.parent, route.staging_path.name
+            if not relative:
+                return route.staging_path, "."
+            return route.staging_path, relative
+        if name == TOOLS_ARCHIVE_DIR or name.startswith(f"{TOOLS_ARCHIVE_DIR}/"):
+            # 不需要更新的工具
+            return None
+        return self.scratch_dir, member.name
+
+    def prepare(self) -> None:
+        """
+        删除上次中断留下的暂存路径
+        """
+        for route in self.routes:
+            remove_path(route.staging_path)
+            if route.path_type == "dir":
+                route.staging_path.mkdir(parents=True)
+            else:
+                route.staging_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def extract(self) -> Tuple[int, int]:
+        """
+        Returns:
+            tuple: (解压到暂存路径的成员数, 解压到 scratch 目录的成员数)
+        """
+        self.prepare()
+        staged, scratch, skipped, size = 0, 0, 0, 0
+        directories = []
+        with tarfile.open(self.tar_path, "r:*") as tar:
+            for member in tar:
+                target = self._target(member)
+                if target is None:
+                    skipped += 1
+                    continue
+                root, name = target
+                if name == ".":
+                    # 暂存目录本身, 只需要设置属性
+                    if member.isdir():
+                        routed = copy.copy(member)
+                        routed.name = name
+                        directories.append((routed, root))
+                    continue
+                routed = copy.copy(member)
+                routed.name = name
+                if member.islnk():
+                    # 硬链接的目标也需要按同样的路由改写
+                    link_target = self._target(
+                        tarfile.TarInfo(normalize_member_name(member.linkname))
+                    )
+                    if link_target is None or link_target[0] != root:
+                        logger.warning(f"skip hard link across routes: {member.name}")
+                        continue
+                    routed.linkname = link_target[1]
+                if member.isdir():
+                    directories.append((routed, root))
+                    tar.extract(routed, root.as_posix(), set_attrs=False)
+                else:
+                    tar.extract(routed, root.as_posix())
+                    if member.isfile():
+                        size += member.size
+                if root == self.scratch_dir:
+                    scratch += 1
+                else:
+                    staged += 1
+            # 与 extractall 一致, 最后设置目录的属性, 深层目录在前
+            directories.sort(key=lambda item: item[0].name, reverse=True)
+            for member, root in directories:
+                path = root.joinpath(member.name).as_posix()
+                tar.chown(member, path, False)
+                tar.utime(member, path)
+                tar.chmod(member, path)
+        logger.info(
+            f"extracted {staged} members to staging, {scratch} to {self.scratch_dir}, "
+            f"skipped {skipped} unchanged tool members"
+        )
+        metrics.add_bytes("extracted", size)
+        return staged, scratch
+
+
+def remove_path(path: Path) -> None:
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    elif path.exists():
+        shutil.rmtree(path)
+
+
+def swap_into_place(staging_path: Path, dst: Path) -> None:
+    """
+    将暂存路径替换到目标路径
+    - 文件: rename 原子替换
+    - 目录: 旧目录先 rename 为备份, 再把暂存目录 rename 到目标路径, 最后删除备份
+    暂存路径与目标路径在同一目录下, rename 不会跨文件系统
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if not staging_path.is_dir() or staging_path.is_symlink():
+        os.replace(staging_path.as_posix(), dst.as_posix())
+        return
+    if not (dst.exists() or dst.is_symlink()):
+        os.rename(staging_path.as_posix(), dst.as_posix())
+        return
+    backup = dst.parent.joinpath(f".{dst.name}{BACKUP_SUFFIX}")
+    remove_path(backup)
+    os.rename(dst.as_posix(), backup.as_posix())
+    try:
+        os.rename(staging_path.as_posix(), dst.as_posix())
+    except OSError:
+        # 还原旧目录
+        os.rename(backup.as_posix(), dst.as_posix())
+        raise
+    remove_path(backup)
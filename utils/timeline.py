@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from constants import AIO_LOGS_DIR, PROJECT_DIR
+from utils.log_base import log_span, logger
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    start: float
+    end: float = 0.0
+    thread_id: int = 0
+    depth: int = 0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return max(self.end - self.start, 0.0)
+
+
+class Timeline:
+    """
+    安装阶段耗时记录
+    - 阶段（phase）: 主机检查、校验、解压、安装 rpm/pip、复制工具、编译内核、changelog、启动服务
+    - 命令（command）: 阶段中执行的 Command
+    未启用时 span() 只设置日志上下文（阶段、工具）, 不记录耗时
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: List[Span] = []
+        self._origin = time.time() - time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name: str, category: str = "phase", **attrs):
+        with log_span(name, category, attrs):
+            if not self.enabled:
+                yield None
+                return
+            with self._record(name, category, attrs) as span:
+                yield span
+
+    @contextmanager
+    def _record(self, name: str, category: str, attrs: Dict[str, Any]):
+        depth = getattr(self._local, "depth", 0)
+        span = Span(
+            name=name,
+            category=category,
+            start=time.perf_counter(),
+            thread_id=threading.get_ident(),
+            depth=depth,
+            attrs=attrs,
+        )
+        self._local.depth = depth + 1
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._local.depth = depth
+            with self._lock:
+                self.spans.append(span)
+
+    def phase(self, name: str) -> Callable:
+        """
+        装饰器, 将整个函数记录为一个阶段
+        """
+
+        def decorator(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def to_report(self) -> Dict[str, Any]:
+        """
+        汇总报告: 按阶段、命令聚合耗时
+        """
+        spans = sorted(self.spans, key=lambda x: x.start)
+        phases: Dict[str, Dict[str, Any]] = dict()
+        commands: List[Dict[str, Any]] = []
+        for span in spans:
+            if span.category == "command":
+                commands.append(
+                    {
+                        "command": span.name,
+                        "duration": round(span.duration, 6),
+                        **span.attrs,
+                    }
+                )
+                continue
+            info = phases.setdefault(
+                span.name, {"count": 0, "duration": 0.0, "depth": span.depth}
+            )
+            info["count"] += 1
+            info["duration"] = round(info["duration"] + span.duration, 6)
+        total = 0.0
+        if spans:
+            total = max(span.end for span in spans) - spans[0].start
+        return {
+            "started_at": datetime.fromtimestamp(
+                self._origin + spans[0].start if spans else time.time()
+            ).strftime("%Y-%m-%d %H:%M:%S"),
+            "total_duration": round(total, 6),
+            "phases": phases,
+            "command_count": len(commands),
+            "command_duration": round(sum(item["duration"] for item in commands), 6),
+            "slowest_commands": sorted(
+                commands, key=lambda x: x["duration"], reverse=True
+            )[:20],
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Chrome trace 格式, 可在 chrome://tracing 或 Perfetto 中打开
+        """
+        pid = os.getpid()
+        events = []
+        for span in sorted(self.spans, key=lambda x: x.start):
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": int((self._origin + span.start) * 1000000),
+                    "dur": int(span.duration * 1000000),
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {k: str(v) for k, v in span.attrs.items()},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def _get_output_dir(self, output_dir: Optional[Path] = None) -> Path:
+        candidates = [output_dir] if output_dir else [Path(AIO_LOGS_DIR), PROJECT_DIR]
+        for candidate in candidates:
+            if candidate.is_dir() and os.access(candidate.as_posix(), os.W_OK):
+                return candidate
+        return PROJECT_DIR
+
+    def save(self, name: str, output_dir: Optional[Path] = None) -> Tuple[Path, Path]:
+        """
+        保存 json 报告和 chrome trace 文件
+        Args:
+            name: 文件名前缀, 例如 install_rdb_agent
+            output_dir: 输出目录, 默认是日志目录
+        Returns:
+            Tuple[Path, Path]: 报告文件路径, trace 文件路径
+        """
+        output_dir = self._get_output_dir(output_dir)
+        suffix = datetime.now().strftime("%Y%m%d%H%M%S")
+        report_path = output_dir.joinpath(f"{name}-profile-{suffix}.json")
+        trace_path = output_dir.joinpath(f"{name}-trace-{suffix}.json")
+        report_path.write_text(
+            json.dumps(self.to_report(), indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        trace_path.write_text(json.dumps(self.to_chrome_trace()), encoding="utf-8")
+        return report_path, trace_path
+
+    @contextmanager
+    def recording(self, name: str, enabled: bool = True):
+        """
+        --profile 使用: 记录整个安装过程, 结束后（包括 sys.exit 退出）保存报告
+        """
+        if not enabled:
+            yield
+            return
+        self.enable()
+        try:
+            with self.span(name):
+                yield
+        finally:
+            try:
+                report_path, trace_path = self.save(name)
+                logger.info(f"profile report: {report_path.as_posix()}")
+                logger.info(f"profile trace: {trace_path.as_posix()}")
+            except OSError as e:
+                logger.error(f"Failed to save profile report: {e}")
+
+
+timeline = Timeline()
@@ -7,11 +7,6 @@ import json
 import os
 from pathlib import Path
 
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import hashes, padding
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-
 from constants import FLAG, PROJECT_DIR, SECURE_KEY, PackageFilenameEnum
 from utils.log_base import logger
 
@@ -28,6 +23,9 @@ class AESFileCryptoWithSalt:
 
             self.password = password.encode("utf-8")
             self.iterations = iterations
+            # cryptography 导入较慢, 只在校验安装包时导入
+            from cryptography.hazmat.backends import default_backend
+
             self.backend = default_backend()
         except UnicodeEncodeError as e:
             raise ValueError(f"password encoding failed: {e}")
@@ -39,6 +37,9 @@ class AESFileCryptoWithSalt:
             if not salt or len(salt) != 16:
                 raise ValueError("salt must be 16 bytes")
 
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
             kdf = PBKDF2HMAC(
                 algorithm=hashes.SHA256(),
                 length=32,  # AES-256
@@ -62,6 +63,9 @@ class AESFileCryptoWithSalt:
             key = self._derive_key(salt)
             iv = os.urandom(16)
 
+            from cryptography.hazmat.primitives import padding
+            from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
             cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=self.backend)
             encryptor = cipher.encryptor()
             padder = padding.PKCS7(128).padder()
@@ -109,6 +113,13 @@ class AESFileCryptoWithSalt:
 
                 key = self._derive_key(salt)
 
+                from cryptography.hazmat.primitives import padding
+                from cryptography.hazmat.primitives.ciphers import (
+                    Cipher,
+                    algorithms,
+                    modes,
+                )
+
                 cipher = Cipher(
                     algorithms.AES(key), modes.CBC(iv), backend=self.backend
                 )
@@ -162,7 +173,10 @@ class PackageBuilder:
 
     def _parse_config(self, config_path) -> dict:
         if not config_path:
-            config_path = PROJECT_DIR.joinpath(PackageFilenameEnum.VERSION.value)
+            # 与主机环境检测共用 version.json 的解析结果
+            from utils.host_facts import get_host_facts
+
+            return get_host_facts().package_config
         with open(config_path, "r") as f:
             return json.load(f)
 
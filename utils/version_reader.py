@@ -0,0 +1,134 @@
+import re
+import struct
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.elf import ELFError, read_modinfo, search_section
+from utils.log_base import logger
+
+
+def parse_version(pattern: str, string: str) -> str:
+    match = re.search(pattern, string)
+    if match:
+        return match.group(1)
+    return ""
+
+
+def _read_modinfo(path: Path, field: str = "version") -> str:
+    return read_modinfo(path).get(field, "").strip()
+
+
+def _read_elf_string(path: Path, pattern: str, section: str = ".rodata") -> str:
+    # 返回整个匹配（例如 version 1.2.3）, 与 command 的输出一样交给 parse 解析
+    return search_section(path, f"({pattern})", section).strip()
+
+
+def normalize_distribution_name(name: str) -> str:
+    """
+    PEP 503 名称规范化, aio_public_module / aio-public-module / Aio.Public.Module 视为同一个包
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def get_site_packages(venv_dir: Path) -> List[Path]:
+    """
+    虚拟环境的 site-packages 目录, 例如 /opt/aio/cdm/lib/python3.6/site-packages
+    """
+    return sorted(venv_dir.glob("lib*/python*/site-packages"))
+
+
+def get_distribution_version(venv_dir: Path, distribution: str) -> str:
+    """
+    直接读取 *.dist-info/METADATA（或 *.egg-info/PKG-INFO）获取已安装包的版本, 不启动 pip
+    Args:
+        venv_dir: 虚拟环境目录, 例如 /opt/aio/cdm
+        distribution: 包名, 例如 aio-tasks
+    Returns:
+        str: 版本号, 未安装时返回空字符串
+    """
+    name = normalize_distribution_name(distribution)
+    for site_packages in get_site_packages(venv_dir):
+        for meta_dir in site_packages.iterdir():
+            if meta_dir.suffix == ".dist-info":
+                metadata_file = meta_dir.joinpath("METADATA")
+            elif meta_dir.suffix == ".egg-info":
+                metadata_file = meta_dir.joinpath("PKG-INFO")
+            else:
+                continue
+            # 目录名格式为 {name}-{version}.dist-info, name 中的 - 会被转义为 _
+            if normalize_distribution_name(meta_dir.stem.split("-")[0]) != name:
+                continue
+            metadata = _read_metadata(metadata_file)
+            if metadata is None:
+                continue
+            if normalize_distribution_name(metadata.get("Name", "")) != name:
+                continue
+            return (metadata.get("Version") or "").strip()
+    return ""
+
+
+def _read_metadata(metadata_file: Path) -> Optional[Dict[str, str]]:
+    """
+    只读取头部的 Name/Version 字段, 遇到空行（正文开始）即停止
+    """
+    if not metadata_file.is_file():
+        return None
+    result = dict()
+    with open(metadata_file, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if not line.strip():
+                break
+            key, _, value = line.partition(":")
+            if key in ("Name", "Version"):
+                result.setdefault(key, value.strip())
+                if len(result) == 2:
+                    break
+    return result
+
+
+def _read_dist_info(path: Path, distribution: str) -> str:
+    # path 为虚拟环境中的 bin/pip3, 输出与 pip3 show 的头部格式一致
+    version = get_distribution_version(path.parent.parent, distribution)
+    if not version:
+        return ""
+    return f"Name: {distribution}\nVersion: {version}"
+
+
+# 不执行工具二进制文件的版本读取方式, TOOLS 中通过 reader 选择
+# 读取结果与 command 的输出格式一致, 由工具的 parse 统一解析
+#   {"type": "modinfo", "field": "version"}: 读取内核模块 .modinfo 节
+#   {"type": "elf-string", "pattern": r"...", "section": ".rodata"}: 在节内容中查找版本字符串
+#   {"type": "dist-info", "distribution": "aio"}: path 为虚拟环境的 bin/pip3, 读取包的 METADATA
+READERS: Dict[str, Callable[..., str]] = {
+    "modinfo": _read_modinfo,
+    "elf-string": _read_elf_string,
+    "dist-info": _read_dist_info,
+}
+
+
+def read_version(
+    reader: Dict[str, Any],
+    path: Path,
+    parse: Optional[Callable[[str], str]] = None,
+) -> str:
+    """
+    使用 reader 读取版本, 读取失败时返回空字符串, 由调用方回退到 command
+    Args:
+        reader: 读取方式, 见 READERS
+        path: 工具文件
+        parse: 工具的 parse, 与 command 的输出一样解析读取结果
+    """
+    options = dict(reader)
+    reader_type = options.pop("type")
+    func = READERS.get(reader_type)
+    if func is None:
+        logger.warning(f"unknown version reader: {reader_type}")
+        return ""
+    try:
+        output = func(path, **options)
+    except (OSError, ELFError, struct.error) as e:
+        logger.debug(f"version reader {reader_type} failed for {path}: {e}")
+        return ""
+    if not output or parse is None:
+        return output
+    return parse(output) or ""